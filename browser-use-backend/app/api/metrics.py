@@ -0,0 +1,103 @@
+from fastapi import APIRouter
+
+from app.services.admission import admission_controller
+from app.services.azure_service import azure_service
+from app.services.agent_cache import agent_cache
+from app.services.browser_pool import browser_pool
+from app.services.document_manifest import document_manifests
+from app.services.screenshot_writer import screenshot_writer
+from app.services.session_reaper import session_reaper
+from app.services.session_registry import session_registry
+from app.services.session_router import session_router
+from app.services.task_queue import task_queue
+from app.utility.resilience import dependency_status
+
+router = APIRouter()
+
+
+@router.get("/pool")
+async def get_pool_metrics():
+    """
+    Warm browser pool occupancy and lease latency.
+    """
+    return browser_pool.metrics()
+
+
+@router.get("/tasks")
+async def get_task_queue_metrics():
+    """
+    Task worker pool occupancy for this process.
+    """
+    return task_queue.stats()
+
+
+@router.get("/shards")
+async def get_shard_metrics():
+    """
+    Session router view of the worker ring.
+    """
+    return session_router.stats()
+
+
+@router.get("/restore")
+async def get_restore_metrics():
+    """
+    Outcome and duration of the session registry restore at startup.
+    """
+    return session_registry.last_restore
+
+
+@router.get("/sessions")
+async def get_session_metrics():
+    """
+    Per-session CPU, RSS, VNC viewers and idle time, as of the last reaper pass.
+    """
+    return session_reaper.stats()
+
+
+@router.get("/capacity")
+async def get_capacity_metrics():
+    """
+    Host headroom for new sessions and whether create_session is admitting.
+    """
+    return admission_controller.stats()
+
+
+@router.get("/secrets")
+async def get_secret_metrics():
+    """
+    Key Vault cache hit rate, coalesced lookups and vault reads.
+    """
+    return azure_service.stats()
+
+
+@router.get("/screenshots")
+async def get_screenshot_writer_metrics():
+    """
+    Screenshots waiting in the write-behind buffer and write outcomes.
+    """
+    return screenshot_writer.stats()
+
+
+@router.get("/agents")
+async def get_agent_cache_metrics():
+    """
+    Cached agents, their estimated memory and evictions.
+    """
+    return agent_cache.stats()
+
+
+@router.get("/documents")
+async def get_document_metrics():
+    """
+    Request manifests held in memory and how often they were re-read.
+    """
+    return document_manifests.stats()
+
+
+@router.get("/dependencies")
+async def get_dependency_metrics():
+    """
+    Circuit breaker state and adaptive concurrency limit per downstream dependency.
+    """
+    return dependency_status()
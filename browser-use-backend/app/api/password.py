@@ -1,10 +1,15 @@
+import math
+
 from fastapi import APIRouter, HTTPException
-from app.models.models import PasswordRetrieveRequest, PasswordSaveRequest, PasswordResponse, SaveResponse
-from app.services.azure_service import AzureKeyVaultService
+from app.models.models import (
+    PasswordRetrieveRequest, PasswordSaveRequest, PasswordResponse, SaveResponse,
+    BulkPasswordRetrieveRequest, BulkPasswordItem, BulkPasswordResponse,
+)
+from app.services.azure_service import azure_service
+from app.utility.resilience import DependencyUnavailable
 
 
 router = APIRouter()
-azure_service = AzureKeyVaultService()
 
 
 @router.post("/retrieve-password", response_model=PasswordResponse)
@@ -32,6 +37,12 @@ async def retrieve_password(request: PasswordRetrieveRequest):
                 password=None,
                 message="Password not found for the given credentials"
             )
+    except DependencyUnavailable as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Key Vault busy, retry later: {str(e)}",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -39,6 +50,32 @@ async def retrieve_password(request: PasswordRetrieveRequest):
         )
 
 
+@router.post("/retrieve-passwords", response_model=BulkPasswordResponse)
+async def retrieve_passwords(request: BulkPasswordRetrieveRequest):
+    """
+    Retrieve many passwords in one call, e.g. ahead of a batch of runs for one
+    organization. Lookups run concurrently with bounded parallelism and warm the
+    secret cache; each item reports its own success or error. With warm_only the
+    passwords are cached but not returned.
+    """
+    outcomes = await azure_service.fetch_passwords(
+        [(item.organization_name, item.login_url, item.username) for item in request.items]
+    )
+    results = [
+        BulkPasswordItem(
+            organization_name=item.organization_name,
+            login_url=item.login_url,
+            username=item.username,
+            success=error is None,
+            password=None if request.warm_only else password,
+            error=error,
+        )
+        for item, (password, error) in zip(request.items, outcomes)
+    ]
+    succeeded = sum(1 for result in results if result.success)
+    return BulkPasswordResponse(results=results, succeeded=succeeded, failed=len(results) - succeeded)
+
+
 @router.post("/save-password", response_model=SaveResponse)
 async def save_password(request: PasswordSaveRequest):
     """
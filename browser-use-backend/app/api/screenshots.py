@@ -1,6 +1,9 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from typing import List, Optional
 from app.db.mongo import get_db
+from app.services.screenshot_writer import screenshot_writer
+from app.services.session_router import session_router
+from app.utility.storage_codec import IMAGE_MEDIA_TYPES, decode_screenshot, screenshot_bytes
 import logging
 
 router = APIRouter()
@@ -9,11 +12,15 @@ router = APIRouter()
 @router.get("/{session_id}")
 async def get_session_screenshots(
         session_id: str,
+        request: Request,
         step_number: Optional[int] = Query(None, description="Get specific step screenshot"),
         limit: Optional[int] = Query(None, description="Limit number of screenshots"),
         skip: Optional[int] = Query(0, description="Skip number of screenshots")
 ) -> List[dict]:
     """Get screenshots for a session."""
+    forwarded = await session_router.forward_if_remote(request, session_id)
+    if forwarded:
+        return forwarded
     try:
         db = get_db()
         collection = db.screenshots
@@ -34,7 +41,7 @@ async def get_session_screenshots(
 
         # Convert async cursor to list
         screenshots = await cursor.to_list(length=None)
-        return screenshots
+        return [decode_screenshot(doc) for doc in screenshots]
 
     except Exception as e:
         logging.error(f"Failed to retrieve screenshots for session {session_id}: {str(e)}")
@@ -42,8 +49,11 @@ async def get_session_screenshots(
 
 
 @router.get("/{session_id}/count")
-async def get_session_screenshots_count(session_id: str) -> dict:
+async def get_session_screenshots_count(session_id: str, request: Request) -> dict:
     """Get count of screenshots for a session."""
+    forwarded = await session_router.forward_if_remote(request, session_id)
+    if forwarded:
+        return forwarded
     try:
         db = get_db()
         collection = db.screenshots
@@ -54,3 +64,19 @@ async def get_session_screenshots_count(session_id: str) -> dict:
         logging.error(f"Failed to get screenshot count for session {session_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get screenshot count: {str(e)}")
 
+
+
+@router.get("/{session_id}/{step_number}/image")
+async def get_session_screenshot_image(session_id: str, step_number: int, request: Request):
+    """Get one step's screenshot as an image, in the format it is stored in."""
+    forwarded = await session_router.forward_if_remote(request, session_id)
+    if forwarded:
+        return forwarded
+    # A step's screenshot may still be in the write-behind buffer when its event is published.
+    doc = screenshot_writer.buffered(session_id, step_number)
+    if doc is None:
+        doc = await get_db().screenshots.find_one({"session_id": session_id, "step_number": step_number})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Screenshot not found")
+    data, image_format = screenshot_bytes(doc)
+    return Response(content=data, media_type=IMAGE_MEDIA_TYPES.get(image_format, "image/png"))
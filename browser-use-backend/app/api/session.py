@@ -1,49 +1,85 @@
+import base64
 import datetime
+import json
+import logging
 import os
 import uuid
 
-from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
 
 from app.core.config import SESSION_DIR
 from app.db.mongo import get_db
 
 from app.models.db_models import SessionDocument, SessionStatus
 from app.models.response_models import SessionResponse
-from app.utility.display_allocation import get_next_display_port, start_vnc_session, start_novnc_proxy,  VNC_PORTS, VNC_DISPLAYS
+from app.services.admission import AdmissionRejected, admission_controller
+from app.services.browser_pool import browser_pool
+from app.services.session_lifecycle import release_session_browser
+from app.services.session_registry import session_registry
+from app.services.session_router import session_router
+from app.utility.display_allocation import VNC_PORTS, VNC_DISPLAYS
 
 router =APIRouter()
 @router.post("/")
-async def create_session():
+async def create_session(request: Request, session_id: Optional[str] = Query(None, include_in_schema=False)):
     """
-    Endpoint to retrieve session information.
+    Create a browser session and return its id and VNC URL. The session is
+    placed on a worker by its id; only a peer worker may pass the id in.
     """
     try:
-        session_id = f"{uuid.uuid4().hex[:4]}-{uuid.uuid4().hex[:4]}-{uuid.uuid4().hex[:4]}-{uuid.uuid4().hex[:4]}"
+        # A forwarded request carries the id the routing worker placed on us.
+        if not (session_id and session_router.is_forwarded(request)):
+            session_id = f"{uuid.uuid4().hex[:4]}-{uuid.uuid4().hex[:4]}-{uuid.uuid4().hex[:4]}-{uuid.uuid4().hex[:4]}"
+            owner = session_router.place(session_id)
+            if owner != session_router.self_id:
+                return await session_router.forward(request, owner, params={"session_id": session_id})
+        elif session_id in VNC_DISPLAYS or await get_db()["sessions"].find_one({"_id": session_id}, {"_id": 1}):
+            return JSONResponse(status_code=409, content={"error": "conflict", "message": f"Session {session_id} already exists."})
+        try:
+            admission = await admission_controller.admit()
+        except AdmissionRejected as e:
+            return JSONResponse(
+                status_code=503,
+                content={"error": e.reason, "message": "No capacity for a new session, retry later."},
+                headers={"Retry-After": str(e.retry_after)},
+            )
         session_path = os.path.join(SESSION_DIR,session_id)
         os.makedirs(session_path, exist_ok=True)
-        display_num,web_port = get_next_display_port()
-        vnc_port = 5900 +display_num-100
-        start_vnc_session(display_num,vnc_port)
-        start_novnc_proxy(vnc_port,web_port)
-        VNC_PORTS[session_id] = web_port
-        VNC_DISPLAYS[session_id] = display_num
-
-
-        vnc_url = f"{os.getenv('BASE_URL','http://host.docker.internal')}:{web_port}/vnc.html?autoconnect=1"
-
-        now = datetime.datetime.now()
-        db = get_db()
-        doc = SessionDocument(
-            _id=session_id,
-
-            status=SessionStatus.INITIALIZING,
-            is_active=True,
-            vnc_url=vnc_url,
-            created_at=now,
-            updated_at=now,
-
-        )
-        await db["sessions"].insert_one(doc.model_dump(by_alias=True))
+        async with admission:
+            pooled = await browser_pool.lease(session_id)
+            try:
+                web_port = pooled.web_port
+                VNC_PORTS[session_id] = web_port
+                VNC_DISPLAYS[session_id] = pooled.display_num
+                await session_registry.register(session_id, pooled.display_num, pooled.web_port, pooled.vnc_port, pooled.profile_dir)
+
+                vnc_url = f"{os.getenv('BASE_URL','http://host.docker.internal')}:{web_port}/vnc.html?autoconnect=1"
+
+                now = datetime.datetime.now()
+                db = get_db()
+                doc = SessionDocument(
+                    _id=session_id,
+
+                    status=SessionStatus.INITIALIZING,
+                    is_active=True,
+                    vnc_url=vnc_url,
+                    worker_id=session_router.self_id,
+                    created_at=now,
+                    updated_at=now,
+
+                )
+                await db["sessions"].insert_one(doc.model_dump(by_alias=True))
+            except BaseException:
+                # Give the browser and its display back before the admission slot is released
+                await release_session_browser(session_id)
+                try:
+                    await session_registry.unregister(session_id)
+                except Exception as e:
+                    logging.error(f"Could not unregister failed session {session_id}: {e}")
+                raise
 
 
 
@@ -51,33 +87,96 @@ async def create_session():
     except Exception as e :
         return {"error": str(e), "message": "Failed to retrieve session information."}
     
-from typing import List, Dict, Any
-@router.get("/")
-async def get_all_sessions():
-    try:
-        db = get_db()
-        sessions = await db["sessions"].find({}).sort("created_at", -1).to_list(length=1000)
+SESSION_LIST_FIELDS = (
+    "workflow_id", "agent_id", "user_id", "status", "is_active", "vnc_url",
+    "worker_id", "last_error", "created_at", "updated_at", "resource_usage",
+)
+DEFAULT_SESSION_LIST_FIELDS = [f for f in SESSION_LIST_FIELDS if f != "resource_usage"]
 
-        # Get all session IDs
-        session_ids = [s["_id"] for s in sessions]
 
-        # Get all tasks for these sessions
-        tasks_by_session = {}
-        cursor = db["tasks"].find({"session_id": {"$in": session_ids}})
-        async for task in cursor:
-            tasks_by_session.setdefault(task["session_id"], []).append(task)
+def encode_session_cursor(session: dict) -> str:
+    raw = json.dumps([session["created_at"].isoformat(), session["_id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
 
-        # Merge tasks into sessions
-        for session in sessions:
-            session["task"] = tasks_by_session.get(session["_id"], [])
 
-        return sessions
+def decode_session_cursor(cursor: str) -> dict:
+    """Match the sessions after `cursor` in (created_at, _id) descending order."""
+    try:
+        created_at, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = datetime.datetime.fromisoformat(created_at)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": session_id}},
+    ]}
 
+
+@router.get("/")
+async def get_all_sessions(
+        limit: int = Query(50, ge=1, le=500, description="Sessions per page"),
+        cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+        fields: Optional[str] = Query(None, description=f"Comma-separated subset of: {', '.join(SESSION_LIST_FIELDS)}"),
+):
+    """
+    List sessions, newest first, one page at a time. Each session carries a
+    task summary (count and latest task) instead of its full task list;
+    GET /session/{session_id} still returns the tasks themselves.
+    """
+    if fields:
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = set(requested) - set(SESSION_LIST_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    else:
+        requested = DEFAULT_SESSION_LIST_FIELDS
+    projection = {field: 1 for field in requested}
+    projection["created_at"] = 1  # needed for the cursor
+
+    try:
+        db = get_db()
+        pipeline = [
+            {"$match": decode_session_cursor(cursor) if cursor else {}},
+            {"$sort": {"created_at": -1, "_id": -1}},
+            {"$limit": limit + 1},
+            {"$project": projection},
+            {"$lookup": {
+                "from": "tasks",
+                "localField": "_id",
+                "foreignField": "session_id",
+                "pipeline": [
+                    {"$sort": {"created_at": -1}},
+                    {"$group": {
+                        "_id": None,
+                        "count": {"$sum": 1},
+                        "latest_task_id": {"$first": "$_id"},
+                        "latest_status": {"$first": "$status"},
+                        "latest_updated_at": {"$first": "$updated_at"},
+                    }},
+                    {"$project": {"_id": 0}},
+                ],
+                "as": "task_summary",
+            }},
+            {"$set": {"task_summary": {"$ifNull": [{"$first": "$task_summary"}, {"count": 0}]}}},
+        ]
+        sessions = await db["sessions"].aggregate(pipeline).to_list(length=None)
+
+        next_cursor = None
+        if len(sessions) > limit:
+            sessions = sessions[:limit]
+            next_cursor = encode_session_cursor(sessions[-1])
+        return {"sessions": sessions, "next_cursor": next_cursor}
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch sessions: {str(e)}")
 
 @router.get("/{session_id}", response_model=SessionResponse)
-async def get_session_details(session_id: str):
+async def get_session_details(session_id: str, request: Request):
+    forwarded = await session_router.forward_if_remote(request, session_id)
+    if forwarded:
+        return forwarded
     try:
         db = get_db()
         session = await db["sessions"].find_one({"_id": session_id})
@@ -1,27 +1,33 @@
 import datetime
-import os
-import logging
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from app.db.mongo import get_db
-from app.services.browser_manager import USER_DATA_DIR_BASE
 
 from app.models.db_models import SessionStatus
-from app.services.browser_manager import AGENTS, get_status, SESSION_PAGES, BROWSERS, CONTEXTS
-from app.utility.display_allocation import USED_PORTS, VNC_PORTS, VNC_DISPLAYS, USED_DISPLAY
-import shutil
+from app.services.browser_manager import AGENTS, get_status
+from app.services.session_lifecycle import teardown_session
+from app.services.session_registry import session_registry
+from app.services.session_router import session_router
+from app.utility.display_allocation import display_allocator
 router = APIRouter(prefix="/sessions/{session_id}/agent", tags=["Agent"])
 
 @router.get("/status")
-async def get_agent_status(session_id: str):
+async def get_agent_status(session_id: str, request: Request):
     """
     Endpoint to retrieve the status of the agent.
     """
+    forwarded = await session_router.forward_if_remote(request, session_id)
+    if forwarded:
+        return forwarded
 
     try:
         agent = AGENTS.get(session_id)
         if agent:
+            display_allocator.touch(session_id)
             status = get_status(session_id=session_id)
             return {"status": status}
+        elif session_id in AGENTS.evicted:
+            # Only idle agents are evicted; the next task rehydrates it.
+            return {"status": "completed"}
         else:
             return {"error": "Agent not found.", "message": "Invalid session ID."}
     except Exception as e:
@@ -29,58 +35,30 @@ async def get_agent_status(session_id: str):
 
 
 @router.get("/stop")
-async def stop_agent(session_id: str):
+async def stop_agent(session_id: str, request: Request):
     """
     Endpoint to stop the agent and clean up all resources.
     """
-    db = get_db()
+    forwarded = await session_router.forward_if_remote(request, session_id)
+    if forwarded:
+        return forwarded
     try:
         agent = AGENTS.get(session_id)
-        if agent:
-            page = SESSION_PAGES.pop(session_id, None)
-            if page:
-                await page.close()
-            context = CONTEXTS.pop(session_id, None)
-            if context:
-                await context.close()
-            browser = BROWSERS.pop(session_id, None)
-            if browser:
-                await browser.close()
-            web_port = VNC_PORTS.pop(session_id, None)
-            display_num = VNC_DISPLAYS.pop(session_id, None)
-            if web_port:
-                USED_PORTS.discard(web_port)
-            if display_num:
-                USED_DISPLAY.discard(display_num)
-                from app.utility.display_allocation import cleanup_session_processes
-                cleanup_session_processes(display_num)
-            profile_dir = os.path.join(USER_DATA_DIR_BASE, session_id)
-            if os.path.exists(profile_dir):
-                shutil.rmtree(profile_dir)
-                logging.info(f"Deleted browser profile directory: {profile_dir}")
-
-            await db["sessions"].update_one(
-                {"_id": session_id},
-                {
-                    "$set": {
-                        "status": SessionStatus.DELETED,
-                        "is_active": False,
-                        "updated_at": datetime.datetime.now()
-                    }
-                }
-            )
-            agent.stop()
-            AGENTS.pop(session_id, None)
+        if agent or session_id in session_registry.hibernated or session_id in AGENTS.evicted:
+            await teardown_session(session_id)
             return {"status": "stopped"}
         else:
             return {"error": "Agent not found.", "message": "Invalid session ID."}
     except Exception as e:
         return {"error": str(e), "message": "Failed to stop the agent."}
 @router.get("/pause")
-async def pause_agent(session_id: str):
+async def pause_agent(session_id: str, request: Request):
     """
     Endpoint to pause the agent.
     """
+    forwarded = await session_router.forward_if_remote(request, session_id)
+    if forwarded:
+        return forwarded
     db = get_db()
     try:
         agent = AGENTS.get(session_id)
@@ -105,10 +83,13 @@ async def pause_agent(session_id: str):
 
 
 @router.get("/resume")
-async def resume_agent(session_id: str):
+async def resume_agent(session_id: str, request: Request):
     """
     Endpoint to resume the agent.
     """
+    forwarded = await session_router.forward_if_remote(request, session_id)
+    if forwarded:
+        return forwarded
     db = get_db()
     try:
         agent = AGENTS.get(session_id)
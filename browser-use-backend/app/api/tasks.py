@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+from app.db.mongo import get_db
+from app.services.task_queue import task_queue, TERMINAL_STATUSES
+
+router = APIRouter()
+
+TASK_STATUS_FIELDS = {"prompt": 0}
+
+
+@router.get("/{task_id}")
+async def get_task(task_id: str):
+    """
+    Get the status and, once finished, the output of a queued task.
+    """
+    task = await get_db()["tasks"].find_one({"_id": task_id}, TASK_STATUS_FIELDS)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task
+
+
+@router.get("/{task_id}/events")
+async def stream_task_events(task_id: str, request: Request):
+    """
+    Server-sent events for a task: the current state first, then a `step`
+    event as each agent step finishes and a `status` event on every status
+    change, until the task completes or fails.
+    """
+    db = get_db()
+    task = await db["tasks"].find_one({"_id": task_id}, TASK_STATUS_FIELDS)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    async def event_stream():
+        queue = task_queue.events.subscribe(task_id)
+        try:
+            current = task
+            last_status = current["status"]
+            last_step = (current.get("last_step") or {}).get("step_number")
+            yield f"event: status\ndata: {json.dumps(jsonable_encoder(current))}\n\n"
+            while last_status not in TERMINAL_STATUSES:
+                if await request.is_disconnected():
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=5)
+                    if event.get("type") == "step":
+                        last_step = event["step_number"]
+                        yield f"event: step\ndata: {json.dumps(event)}\n\n"
+                        continue
+                    last_status = event["status"]
+                    yield f"event: status\ndata: {json.dumps(jsonable_encoder(event))}\n\n"
+                except asyncio.TimeoutError:
+                    # The task may be running on another worker process; fall back to the database.
+                    current = await db["tasks"].find_one({"_id": task_id}, TASK_STATUS_FIELDS)
+                    if not current:
+                        break
+                    step = current.get("last_step")
+                    if step and step["step_number"] != last_step:
+                        last_step = step["step_number"]
+                        yield f"event: step\ndata: {json.dumps(jsonable_encoder(step))}\n\n"
+                    if current["status"] != last_status:
+                        last_status = current["status"]
+                        yield f"event: status\ndata: {json.dumps(jsonable_encoder(current))}\n\n"
+                    elif not step or step["step_number"] == last_step:
+                        yield ": keep-alive\n\n"
+        finally:
+            task_queue.events.unsubscribe(task_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
@@ -1,3 +1,94 @@
 import os
 
 SESSION_DIR = os.path.join(os.path.dirname(__file__), "sessions")
+
+# Warm browser pool
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+BROWSER_POOL_HEALTH_INTERVAL = float(os.getenv("BROWSER_POOL_HEALTH_INTERVAL", "30"))
+BROWSER_POOL_HEALTH_TIMEOUT = float(os.getenv("BROWSER_POOL_HEALTH_TIMEOUT", "5"))
+
+# Display / VNC port allocation. Slot i uses display DISPLAY_BASE+i,
+# VNC port VNC_PORT_BASE+i and noVNC web port WEB_PORT_BASE+i.
+DISPLAY_BASE = int(os.getenv("DISPLAY_BASE", "100"))
+VNC_PORT_BASE = int(os.getenv("VNC_PORT_BASE", "5900"))
+WEB_PORT_BASE = int(os.getenv("WEB_PORT_BASE", "6080"))
+DISPLAY_SLOT_START = int(os.getenv("DISPLAY_SLOT_START", "1"))
+DISPLAY_SLOT_COUNT = int(os.getenv("DISPLAY_SLOT_COUNT", "99"))
+DISPLAY_LEASE_TTL = float(os.getenv("DISPLAY_LEASE_TTL", str(6 * 3600)))
+DISPLAY_ORPHAN_GRACE = float(os.getenv("DISPLAY_ORPHAN_GRACE", "300"))
+DISPLAY_REAPER_INTERVAL = float(os.getenv("DISPLAY_REAPER_INTERVAL", "60"))
+
+# Xvfb / x11vnc / websockify supervision
+PROCESS_READY_TIMEOUT = float(os.getenv("PROCESS_READY_TIMEOUT", "10"))
+PROCESS_STOP_TIMEOUT = float(os.getenv("PROCESS_STOP_TIMEOUT", "5"))
+PROCESS_MONITOR_INTERVAL = float(os.getenv("PROCESS_MONITOR_INTERVAL", "2"))
+
+# Task queue
+TASK_WORKERS = int(os.getenv("TASK_WORKERS", "4"))
+TASK_LEASE_SECONDS = float(os.getenv("TASK_LEASE_SECONDS", "120"))
+TASK_POLL_INTERVAL = float(os.getenv("TASK_POLL_INTERVAL", "2"))
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", "3"))
+
+# Session sharding across worker processes / hosts. SHARD_WORKERS lists the
+# peers as "id=http://host:port,..."; leave it empty to run unsharded.
+SHARD_SELF = os.getenv("SHARD_SELF", "worker-0")
+SHARD_WORKERS = os.getenv("SHARD_WORKERS", "")
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", "64"))
+SHARD_HEALTH_INTERVAL = float(os.getenv("SHARD_HEALTH_INTERVAL", "5"))
+SHARD_FAILURE_THRESHOLD = int(os.getenv("SHARD_FAILURE_THRESHOLD", "3"))
+# Shared by all workers and required when SHARD_WORKERS is set; a request only
+# counts as forwarded by a peer if it carries it.
+SHARD_SECRET = os.getenv("SHARD_SECRET", "")
+
+# Idle session reaper. IDLE_SESSION_ACTION is "hibernate" (keep profile and
+# agent state, stop processes) or "teardown" (delete the session).
+IDLE_SESSION_TTL = float(os.getenv("IDLE_SESSION_TTL", "1800"))
+IDLE_SESSION_ACTION = os.getenv("IDLE_SESSION_ACTION", "hibernate")
+IDLE_REAPER_INTERVAL = float(os.getenv("IDLE_REAPER_INTERVAL", "30"))
+
+# Admission control for new sessions
+ADMISSION_MAX_CPU_PERCENT = float(os.getenv("ADMISSION_MAX_CPU_PERCENT", "85"))
+ADMISSION_MIN_AVAILABLE_MEMORY_MB = float(os.getenv("ADMISSION_MIN_AVAILABLE_MEMORY_MB", "1024"))
+ADMISSION_SESSION_MEMORY_MB = float(os.getenv("ADMISSION_SESSION_MEMORY_MB", "600"))
+ADMISSION_MAX_SESSIONS = int(os.getenv("ADMISSION_MAX_SESSIONS", "0"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "10"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "15"))
+
+# Optional per-session caps (0 = off). Applied through cgroup v2 when
+# SESSION_CGROUP_ROOT is writable, else as an rlimit on the display processes.
+SESSION_MEMORY_LIMIT_MB = int(os.getenv("SESSION_MEMORY_LIMIT_MB", "0"))
+SESSION_CPU_LIMIT = float(os.getenv("SESSION_CPU_LIMIT", "0"))
+SESSION_CGROUP_ROOT = os.getenv("SESSION_CGROUP_ROOT", "/sys/fs/cgroup/browser-sessions")
+
+# Key Vault access. SECRET_BACKEND=local swaps Key Vault for an in-memory
+# fake (optionally persisted to LOCAL_SECRETS_FILE) for offline runs.
+SECRET_BACKEND = os.getenv("SECRET_BACKEND", "azure")
+KEYVAULT_MAX_WORKERS = int(os.getenv("KEYVAULT_MAX_WORKERS", "16"))
+SECRET_CACHE_TTL = float(os.getenv("SECRET_CACHE_TTL", "300"))
+SECRET_CACHE_MAX_ENTRIES = int(os.getenv("SECRET_CACHE_MAX_ENTRIES", "10000"))
+LOCAL_SECRETS_FILE = os.getenv("LOCAL_SECRETS_FILE")
+BULK_PASSWORD_CONCURRENCY = int(os.getenv("BULK_PASSWORD_CONCURRENCY", "8"))
+KEYVAULT_LATENCY_TARGET = float(os.getenv("KEYVAULT_LATENCY_TARGET", "2"))
+# Seconds a vault lookup waits for a free slot before it is shed with a 503
+KEYVAULT_QUEUE_TIMEOUT = float(os.getenv("KEYVAULT_QUEUE_TIMEOUT", "10"))
+
+# Documents staged by planner-backend on the shared /app/tmp volume, one manifest per request
+DOCUMENT_STORE_DIR = os.getenv("DOCUMENT_STORE_DIR", "/app/tmp/documents")
+DOCUMENT_MANIFEST_CACHE_SIZE = int(os.getenv("DOCUMENT_MANIFEST_CACHE_SIZE", "1000"))
+
+# Screenshot write-behind buffer
+SCREENSHOT_BATCH_SIZE = int(os.getenv("SCREENSHOT_BATCH_SIZE", "5"))
+SCREENSHOT_BUFFER_MAX_BYTES = int(os.getenv("SCREENSHOT_BUFFER_MAX_BYTES", str(8 * 1024 * 1024)))
+SCREENSHOT_FLUSH_INTERVAL = float(os.getenv("SCREENSHOT_FLUSH_INTERVAL", "2"))
+
+# Storage formats (HISTORY_CODEC: zstd | json, SCREENSHOT_FORMAT: webp | png)
+HISTORY_CODEC = os.getenv("HISTORY_CODEC", "zstd")
+HISTORY_ZSTD_LEVEL = int(os.getenv("HISTORY_ZSTD_LEVEL", "3"))
+SCREENSHOT_FORMAT = os.getenv("SCREENSHOT_FORMAT", "webp")
+SCREENSHOT_WEBP_QUALITY = int(os.getenv("SCREENSHOT_WEBP_QUALITY", "80"))
+
+# Agent cache (per-session agents kept in memory; memory is an estimate from serialized state)
+AGENT_CACHE_MAX_AGENTS = int(os.getenv("AGENT_CACHE_MAX_AGENTS", "50"))
+AGENT_CACHE_MAX_MEMORY_MB = float(os.getenv("AGENT_CACHE_MAX_MEMORY_MB", "512"))
+AGENT_HISTORY_KEEP_STEPS = int(os.getenv("AGENT_HISTORY_KEEP_STEPS", "30"))
@@ -1,8 +1,10 @@
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 
 from typing import Optional
+import logging
 import os
 from dotenv import load_dotenv
+from pymongo.errors import OperationFailure
 
 load_dotenv()
 
@@ -21,3 +23,14 @@ def get_db() -> AsyncIOMotorDatabase:
     if db is None:
         raise RuntimeError("Database not initialized. Call init_db() first.")
     return db
+
+
+async def ensure_indexes():
+    """Create the indexes the API relies on. Safe to run on every startup."""
+    await db["sessions"].create_index([("created_at", -1), ("_id", -1)])
+    await db["tasks"].create_index([("session_id", 1), ("created_at", -1)])
+    try:
+        await db["screenshots"].create_index([("session_id", 1), ("step_number", 1)], unique=True)
+    except OperationFailure as e:
+        # Existing duplicate screenshots block the unique index; writes still upsert on the pair.
+        logging.warning(f"Could not create unique screenshot index: {e}")
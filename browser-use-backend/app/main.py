@@ -1,14 +1,27 @@
+import asyncio
 import os
 from contextlib import asynccontextmanager
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.staticfiles import StaticFiles
-from api import session,task,status,screenshots,auth
+from api import session,task,tasks,status,screenshots,auth,metrics
 from api.password import router as password_router
 
 from app.core.config import SESSION_DIR
-from app.db.mongo import init_db
+from app.db.mongo import ensure_indexes, init_db
+from app.services.browser_manager import AGENTS
+from app.services.browser_pool import browser_pool
+from app.services.screenshot_writer import screenshot_writer
+from app.services.session_reaper import session_reaper
+from app.services.session_registry import session_registry
+from app.services.session_router import session_router
+from app.services.task_queue import task_queue
+from app.services.session_lifecycle import (
+    adopt_orphaned_sessions, is_display_owner_alive, mark_session_degraded, persist_evicted_agent, reclaim_display,
+)
+from app.utility.display_allocation import display_allocator, reap_display_leases
+from app.utility.process_supervisor import process_supervisor
 
 
 @asynccontextmanager
@@ -17,10 +30,30 @@ async def lifespan(app: FastAPI):
     # Code to run on startup
     print("Starting up...")
     init_db()
+    await ensure_indexes()
+    orphaned = display_allocator.rebuild_from_processes()
+    print(f"Display allocator rebuilt, {orphaned} display(s) still running")
+    print(f"Session registry restored: {await session_registry.restore()}")
+    await browser_pool.start()
+    display_reaper = asyncio.create_task(reap_display_leases(is_display_owner_alive, reclaim_display))
+    process_monitor = asyncio.create_task(process_supervisor.monitor(mark_session_degraded))
+    idle_reaper = asyncio.create_task(session_reaper.run())
+    await screenshot_writer.start()
+    await task_queue.start()
+    session_router.on_rebalance = adopt_orphaned_sessions
+    AGENTS.on_evict = persist_evicted_agent
+    await session_router.start()
 
     yield
     # Code to run on shutdown
     print("Shutting down...")
+    await session_router.shutdown()
+    await task_queue.shutdown()
+    await screenshot_writer.shutdown()
+    display_reaper.cancel()
+    process_monitor.cancel()
+    idle_reaper.cancel()
+    await browser_pool.shutdown()
 app = FastAPI(lifespan=lifespan,root_path="/api")
 app.add_middleware(
     CORSMiddleware,
@@ -43,8 +76,15 @@ os.makedirs(SESSION_DIR, exist_ok=True)
 app.mount("/static", StaticFiles(directory=os.path.join(os.path.dirname(__file__), "static")), name="static")
 app.include_router(session.router,prefix="/sessions",tags=["Session"])
 app.include_router(task.router,prefix="/task",tags=["Task"])
+app.include_router(tasks.router,prefix="/tasks",tags=["Task"])
 app.include_router(status.router, tags=["Agent"])
 
 app.include_router(password_router, prefix="/api", tags=["passwords"])
 app.include_router(screenshots.router,prefix="/screenshots",tags=["Screenshots"])
 app.include_router(auth.router, prefix="/auth", tags=["Auth"])
+app.include_router(metrics.router, prefix="/metrics", tags=["Metrics"])
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "worker_id": session_router.self_id}
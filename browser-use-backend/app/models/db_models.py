@@ -4,6 +4,7 @@ from datetime import datetime
 from enum import Enum
 
 class TaskStatus(str, Enum):
+    QUEUED = "queued"
     IN_PROGRESS = "in_progress"
     COMPLETED = "completed"
     ERROR = "error"
@@ -12,6 +13,8 @@ class SessionStatus(str, Enum):
     ACTIVE = "active"
     DELETED = "deleted"
     INITIALIZING = "initializing"  # Fixed typo: was "INTIALIZING"
+    DEGRADED = "degraded"  # A display process (Xvfb/x11vnc/websockify) crashed
+    HIBERNATED = "hibernated"  # Idle: processes stopped, profile and agent state kept
 
 
 class TaskDocument(BaseModel):
@@ -21,6 +24,7 @@ class TaskDocument(BaseModel):
     prompt: str
     result: Optional[str] = None  # Made optional since it might not exist initially
     session_id: str
+    request_id: Optional[str] = None
     created_at: Optional[datetime] = Field(default_factory=datetime.now)
     updated_at: Optional[datetime] = Field(default_factory=datetime.now)
 
@@ -41,6 +45,7 @@ class SessionDocument(BaseModel):
     status: SessionStatus = SessionStatus.INITIALIZING  # Fixed typo
     is_active: bool = False  # Added default value
     vnc_url: Optional[str] = None  # Made optional since it might not be set initially
+    worker_id: Optional[str] = None
     last_error: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
@@ -59,7 +64,8 @@ class ScreenshotDocument(BaseModel):
     step_number: int
     url: str
     title: str
-    screenshot_base64: str
+    screenshot: bytes
+    screenshot_format: str = "png"
     created_at: datetime = Field(default_factory=datetime.now)
     agent_id: str
     tabs: Optional[List[Any]] = Field(default_factory=list)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 
 class PasswordRetrieveRequest(BaseModel):
@@ -24,3 +24,23 @@ class PasswordResponse(BaseModel):
 class SaveResponse(BaseModel):
     success: bool
     message: str
+
+
+class BulkPasswordRetrieveRequest(BaseModel):
+    items: List[PasswordRetrieveRequest] = Field(..., min_length=1, max_length=500)
+    warm_only: bool = False  # only load the cache, do not return passwords
+
+
+class BulkPasswordItem(BaseModel):
+    organization_name: str
+    login_url: str
+    username: str
+    success: bool
+    password: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BulkPasswordResponse(BaseModel):
+    results: List[BulkPasswordItem]
+    succeeded: int
+    failed: int
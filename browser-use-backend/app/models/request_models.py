@@ -4,6 +4,7 @@ from typing import Optional
 class TaskRequest(BaseModel):
     task: str
     session_id: Optional[str] = None
+    request_id: Optional[str] = None  # preauth request whose staged documents the agent may upload
 
 class SessionStatusRequest(BaseModel):
     session_id: str
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import psutil
+
+from app.core.config import (
+    ADMISSION_MAX_CPU_PERCENT, ADMISSION_MIN_AVAILABLE_MEMORY_MB, ADMISSION_SESSION_MEMORY_MB,
+    ADMISSION_MAX_SESSIONS, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT, ADMISSION_RETRY_AFTER,
+)
+from app.services.browser_pool import browser_pool
+from app.services.session_reaper import session_reaper
+from app.utility.display_allocation import VNC_DISPLAYS, display_allocator
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Decides whether the host can take one more browser session.
+
+    A session is admitted while CPU is below ADMISSION_MAX_CPU_PERCENT, while
+    available memory stays above ADMISSION_MIN_AVAILABLE_MEMORY_MB after one
+    more session, and while a display slot (or a warm pooled browser) is free.
+    The memory cost of a session is the mean RSS measured by the session reaper,
+    or ADMISSION_SESSION_MEMORY_MB before anything has been measured.
+    Sessions being admitted right now are counted too, so a burst of
+    create_session calls cannot all squeeze through one gap.
+
+    Requests that do not fit wait in a queue of ADMISSION_QUEUE_SIZE for up to
+    ADMISSION_QUEUE_TIMEOUT seconds. Past that they are rejected with a
+    Retry-After.
+    """
+
+    def __init__(self):
+        self._admitting = 0
+        self._waiting = 0
+        self._changed = asyncio.Condition()
+        self.admitted = 0
+        self.rejected = 0
+        self._cpu = (0.0, 0.0)  # (sampled_at, percent)
+        psutil.cpu_percent(interval=None)  # prime the CPU baseline
+
+    async def admit(self) -> "Admission":
+        deadline = time.monotonic() + ADMISSION_QUEUE_TIMEOUT
+        async with self._changed:
+            reason = self._blocked_reason()
+            if reason and self._waiting >= ADMISSION_QUEUE_SIZE:
+                self.rejected += 1
+                raise AdmissionRejected(f"{reason}; admission queue full", ADMISSION_RETRY_AFTER)
+            self._waiting += 1
+            try:
+                while reason:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise AdmissionRejected(reason, ADMISSION_RETRY_AFTER)
+                    try:
+                        # Woken when an admission finishes; otherwise re-check the host every second.
+                        await asyncio.wait_for(self._changed.wait(), timeout=min(remaining, 1.0))
+                    except asyncio.TimeoutError:
+                        pass
+                    reason = self._blocked_reason()
+            finally:
+                self._waiting -= 1
+            self._admitting += 1
+            self.admitted += 1
+        return Admission(self)
+
+    async def _done(self):
+        async with self._changed:
+            self._admitting -= 1
+            self._changed.notify_all()
+
+    def _blocked_reason(self, capacity: Optional[dict] = None) -> Optional[str]:
+        capacity = capacity or self.capacity()
+        if capacity["cpu_percent"] >= ADMISSION_MAX_CPU_PERCENT:
+            return f"CPU at {capacity['cpu_percent']}%"
+        if capacity["available_memory_mb"] - capacity["session_memory_mb"] * (self._admitting + 1) < ADMISSION_MIN_AVAILABLE_MEMORY_MB:
+            return f"only {capacity['available_memory_mb']} MB memory available"
+        if capacity["free_sessions"] <= 0:
+            return "no free display slots"
+        return None
+
+    def capacity(self) -> dict:
+        memory = psutil.virtual_memory()
+        displays = display_allocator.stats()
+        pool = browser_pool.metrics()
+        usage = list(session_reaper.usage.values())
+        measured = [u["rss_mb"] for u in usage if u.get("rss_mb")]
+        session_memory_mb = round(sum(measured) / len(measured), 1) if measured else ADMISSION_SESSION_MEMORY_MB
+        available_mb = round(memory.available / MB, 1)
+
+        free_sessions = displays["free"] + pool["idle"] - self._admitting
+        if ADMISSION_MAX_SESSIONS > 0:
+            free_sessions = min(free_sessions, ADMISSION_MAX_SESSIONS - len(VNC_DISPLAYS) - self._admitting)
+        by_memory = int(max(0.0, available_mb - ADMISSION_MIN_AVAILABLE_MEMORY_MB) // max(session_memory_mb, 1))
+        return {
+            "cpu_count": psutil.cpu_count(),
+            "cpu_percent": self._cpu_percent(),
+            "load_average": [round(load, 2) for load in psutil.getloadavg()],
+            "available_memory_mb": available_mb,
+            "total_memory_mb": round(memory.total / MB, 1),
+            "session_memory_mb": session_memory_mb,
+            "active_sessions": len(VNC_DISPLAYS),
+            "free_display_slots": displays["free"],
+            "warm_browsers": pool["idle"],
+            "free_sessions": max(0, free_sessions),
+            "estimated_headroom": max(0, min(free_sessions, by_memory)),
+            "admitting": self._admitting,
+            "waiting": self._waiting,
+        }
+
+    def _cpu_percent(self) -> float:
+        # cpu_percent(None) measures since the previous call; back-to-back calls
+        # would read ~0, so keep a sample for at least a second.
+        sampled_at, percent = self._cpu
+        if time.monotonic() - sampled_at >= 1.0:
+            percent = psutil.cpu_percent(interval=None)
+            self._cpu = (time.monotonic(), percent)
+        return percent
+
+    def stats(self) -> dict:
+        capacity = self.capacity()
+        reason = self._blocked_reason(capacity)
+        return {
+            **capacity,
+            "accepting": reason is None,
+            "blocked_reason": reason,
+            "retry_after": ADMISSION_RETRY_AFTER if reason else 0,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "limits": {
+                "max_cpu_percent": ADMISSION_MAX_CPU_PERCENT,
+                "min_available_memory_mb": ADMISSION_MIN_AVAILABLE_MEMORY_MB,
+                "max_sessions": ADMISSION_MAX_SESSIONS or None,
+            },
+        }
+
+
+class Admission:
+    """Held while a session is being created; releases its reservation on exit."""
+
+    def __init__(self, controller: AdmissionController):
+        self._controller = controller
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._controller._done()
+
+
+admission_controller = AdmissionController()
@@ -0,0 +1,170 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Iterator, Optional, Set
+
+from browser_use.agent.message_manager.views import HistoryItem
+from browser_use.agent.service import Agent
+
+from app.core.config import AGENT_CACHE_MAX_AGENTS, AGENT_CACHE_MAX_MEMORY_MB, AGENT_HISTORY_KEEP_STEPS
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class AgentCache(MutableMapping):
+    """
+    The live Agent of each session, bounded by count and by estimated memory.
+
+    A dict-compatible replacement for the old module-level AGENTS dict. Reads
+    mark an agent as recently used. Once there are more than
+    AGENT_CACHE_MAX_AGENTS agents, or their estimated size passes
+    AGENT_CACHE_MAX_MEMORY_MB, the least recently used agents that are not
+    running a task are evicted: `on_evict` compacts and saves their state, and
+    the session's next task rehydrates a new agent from it.
+
+    An agent's size is the serialized size of its state and step history,
+    measured when a task on it finishes. Agents are compacted to their last
+    AGENT_HISTORY_KEEP_STEPS steps at that point too, so a long-lived session
+    does not grow without bound even if it is never evicted.
+    """
+
+    def __init__(self, max_agents: int, max_memory_mb: float):
+        self.max_agents = max_agents
+        self.max_bytes = int(max_memory_mb * MB)
+        self._agents: "OrderedDict[str, Agent]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._in_use: Dict[str, int] = {}
+        self._evicting: Dict[str, asyncio.Task] = {}
+        self.evicted: Set[str] = set()
+        self.on_evict: Optional[Callable[[str, Agent], Awaitable]] = None
+        self.evictions = 0
+        self.compactions = 0
+
+    def __getitem__(self, session_id: str) -> Agent:
+        agent = self._agents[session_id]
+        self._agents.move_to_end(session_id)
+        return agent
+
+    def __setitem__(self, session_id: str, agent: Agent):
+        self._agents[session_id] = agent
+        self._agents.move_to_end(session_id)
+        self._sizes.setdefault(session_id, 0)
+        self.evicted.discard(session_id)
+        self._enforce()
+
+    def __delitem__(self, session_id: str):
+        del self._agents[session_id]
+        self._sizes.pop(session_id, None)
+
+    def __contains__(self, session_id) -> bool:
+        return session_id in self._agents  # no LRU touch
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._agents))
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+    def forget(self, session_id: str) -> Optional[Agent]:
+        """Drop every trace of a session that is being torn down. Returns its agent, if cached."""
+        self.evicted.discard(session_id)
+        return self.pop(session_id, None)
+
+    @asynccontextmanager
+    async def in_use(self, session_id: str):
+        """Held while a task runs on the session's agent, which keeps it from being evicted."""
+        self._in_use[session_id] = self._in_use.get(session_id, 0) + 1
+        try:
+            yield
+        finally:
+            self._in_use[session_id] -= 1
+            if not self._in_use[session_id]:
+                del self._in_use[session_id]
+            agent = self._agents.get(session_id)
+            if agent is not None:
+                if compact_agent(agent, AGENT_HISTORY_KEEP_STEPS):
+                    self.compactions += 1
+                self._sizes[session_id] = await asyncio.to_thread(estimate_agent_bytes, agent)
+                self._enforce()
+
+    async def wait_evicted(self, session_id: str):
+        """Wait until an eviction of this session's agent has finished saving its state."""
+        task = self._evicting.get(session_id)
+        if task:
+            await asyncio.shield(task)
+
+    def _enforce(self):
+        for session_id in list(self._agents):
+            if len(self._agents) <= self.max_agents and sum(self._sizes.values()) <= self.max_bytes:
+                return
+            if session_id in self._in_use:
+                continue
+            self._evict(session_id)
+
+    def _evict(self, session_id: str):
+        agent = self._agents.pop(session_id)
+        size = self._sizes.pop(session_id, 0)
+        self.evicted.add(session_id)
+        self.evictions += 1
+        # The session's browser outlives the agent; never let its collection close the browser.
+        agent.browser_session.browser_profile.keep_alive = True
+        logger.info(f"Evicting agent of session {session_id} (~{size / MB:.1f} MB)")
+        if self.on_evict:
+            task = asyncio.create_task(self.on_evict(session_id, agent))
+            self._evicting[session_id] = task
+            task.add_done_callback(lambda _: self._evicting.pop(session_id, None))
+
+    def stats(self) -> dict:
+        return {
+            "agents": len(self._agents),
+            "max_agents": self.max_agents,
+            "estimated_memory_mb": round(sum(self._sizes.values()) / MB, 1),
+            "max_memory_mb": round(self.max_bytes / MB, 1),
+            "in_use": len(self._in_use),
+            "evicted_sessions": len(self.evicted),
+            "evictions": self.evictions,
+            "compactions": self.compactions,
+            "sizes_mb": {session_id: round(size / MB, 2) for session_id, size in self._sizes.items()},
+        }
+
+
+def compact_agent(agent: Agent, keep_steps: int) -> bool:
+    """
+    Trim an agent to its last `keep_steps` steps: the step history kept on
+    the agent and the step summaries in its message state. The initial item
+    stays and a note records how many steps were dropped. Returns whether
+    anything was trimmed.
+    """
+    compacted = False
+    history = agent.history.history
+    if len(history) > keep_steps:
+        del history[:-keep_steps]
+        compacted = True
+
+    state = agent.state.message_manager_state
+    items = state.agent_history_items
+    if len(items) > keep_steps + 2:
+        dropped = len(items) - keep_steps - 1
+        state.agent_history_items = [
+            items[0],
+            HistoryItem(system_message=f"{dropped} earlier steps were compacted away"),
+            *items[-keep_steps:],
+        ]
+        compacted = True
+    # Rebuilt before every step; it can hold a screenshot.
+    state.history.state_message = None
+    return compacted
+
+
+def estimate_agent_bytes(agent: Agent) -> int:
+    size = len(agent.state.model_dump_json())
+    size += len(json.dumps(agent.history.model_dump(), default=str))
+    return size
+
+
+agent_cache = AgentCache(AGENT_CACHE_MAX_AGENTS, AGENT_CACHE_MAX_MEMORY_MB)
@@ -3,16 +3,26 @@ import os
 import asyncio
 import json
 from concurrent.futures import ThreadPoolExecutor
-from typing import Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 from azure.keyvault.secrets import SecretClient
 from azure.identity import ClientSecretCredential
 from dotenv import load_dotenv
 
+from app.core.config import (
+    SECRET_BACKEND, KEYVAULT_MAX_WORKERS, SECRET_CACHE_TTL, SECRET_CACHE_MAX_ENTRIES, LOCAL_SECRETS_FILE,
+    BULK_PASSWORD_CONCURRENCY, KEYVAULT_LATENCY_TARGET, KEYVAULT_QUEUE_TIMEOUT,
+)
+from app.utility.resilience import RESILIENCE_MAX_LIMIT, DependencyUnavailable, dependency
+from app.utility.secret_cache import SecretCache
+
 # Load environment variables
 load_dotenv()
 
 
-class AzureKeyVaultService:
+class AzureSecretBackend:
+    """Secrets in one Azure Key Vault per organization."""
+
     def __init__(self):
         self.client_id = os.getenv("AZURE_CLIENT_ID")
         self.client_secret = os.getenv("AZURE_CLIENT_SECRET")
@@ -27,7 +37,6 @@ class AzureKeyVaultService:
         
         # Store clients for different organizations
         self._clients = {}
-        self._executor = ThreadPoolExecutor(max_workers=4)
     
     def _get_key_vault_url(self, organization_name: str) -> str:
         """Generate Key Vault URL based on organization name"""
@@ -46,37 +55,119 @@ class AzureKeyVaultService:
                 credential=self.credential
             )
         return self._clients[organization_name]
-    
+
+    def get_secret(self, organization_name: str, secret_name: str) -> str:
+        return self._get_client(organization_name).get_secret(secret_name).value
+
+    def set_secret(self, organization_name: str, secret_name: str, value: str):
+        # Set secret with content type as password
+        self._get_client(organization_name).set_secret(secret_name, value, content_type="Password")
+
+
+class LocalSecretBackend:
+    """
+    In-memory stand-in for Key Vault (SECRET_BACKEND=local) for running and
+    testing offline. Set LOCAL_SECRETS_FILE to persist secrets as JSON.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._secrets: Dict[str, Dict[str, str]] = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self._secrets = json.load(f)
+
+    def get_secret(self, organization_name: str, secret_name: str) -> str:
+        try:
+            return self._secrets[organization_name][secret_name]
+        except KeyError:
+            raise LookupError(f"Secret {secret_name} not found for {organization_name}")
+
+    def set_secret(self, organization_name: str, secret_name: str, value: str):
+        self._secrets.setdefault(organization_name, {})[secret_name] = value
+        if self.path:
+            with open(self.path, "w") as f:
+                json.dump(self._secrets, f)
+
+
+def _vault_failure(error: Exception) -> bool:
+    # A missing secret is an answer, not a sign of an unhealthy vault
+    return not isinstance(error, LookupError) and getattr(error, "status_code", None) != 404
+
+
+# Starts at the executor size so a burst queues for a slot (as it queued on the
+# executor) and is only shed after KEYVAULT_QUEUE_TIMEOUT.
+keyvault = dependency(
+    "keyvault", latency_target=KEYVAULT_LATENCY_TARGET, is_failure=_vault_failure,
+    initial_limit=KEYVAULT_MAX_WORKERS, max_limit=max(RESILIENCE_MAX_LIMIT, KEYVAULT_MAX_WORKERS),
+    max_wait=KEYVAULT_QUEUE_TIMEOUT,
+)
+
+
+@lru_cache(maxsize=4096)
+def secret_name_for(login_url: str, username: str) -> str:
+    """Key Vault secret name for a login; derived once per (login_url, username)."""
+    return _sanitize_secret_name(_generate_key(login_url, username))
+
+
+def _generate_key(login_url: str, username: str) -> str:
+    """Generate SHA256 hash key from login_url + username"""
+    combined = f"{login_url}{username}"
+    return hashlib.sha256(combined.encode()).hexdigest()
+
+
+def _sanitize_secret_name(name: str) -> str:
+    """Sanitize secret name to be compatible with Azure Key Vault naming rules"""
+    # Azure Key Vault secret names can only contain alphanumeric characters and hyphens
+    # and must be 1-127 characters long
+    sanitized = ''.join(c if c.isalnum() else '-' for c in name)
+    # Remove consecutive hyphens
+    while '--' in sanitized:
+        sanitized = sanitized.replace('--', '-')
+    # Remove leading/trailing hyphens
+    sanitized = sanitized.strip('-')
+    # Ensure it's not empty and not too long
+    if not sanitized:
+        sanitized = 'secret'
+    if len(sanitized) > 127:
+        sanitized = sanitized[:127].rstrip('-')
+    return sanitized
+
+
+class AzureKeyVaultService:
+    """
+    Password storage on Key Vault (or the local fake backend).
+
+    Retrieved passwords are kept in an encrypted in-memory cache for
+    SECRET_CACHE_TTL seconds and dropped when save_password overwrites them.
+    Concurrent misses for the same login share a single vault call. Vault
+    calls go through the "keyvault" circuit breaker and concurrency limit,
+    so a slow vault fails lookups fast instead of filling the executor.
+    """
+
+    def __init__(self, backend=None):
+        if backend is None:
+            backend = LocalSecretBackend(LOCAL_SECRETS_FILE) if SECRET_BACKEND == "local" else AzureSecretBackend()
+        self.backend = backend
+        self._executor = ThreadPoolExecutor(max_workers=KEYVAULT_MAX_WORKERS, thread_name_prefix="keyvault")
+        self.cache = SecretCache(SECRET_CACHE_TTL, SECRET_CACHE_MAX_ENTRIES)
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._generations: Dict[Tuple[str, str], int] = {}
+        self.coalesced = 0
+        self.vault_reads = 0
+
     def _generate_key(self, login_url: str, username: str) -> str:
         """Generate SHA256 hash key from login_url + username"""
-        combined = f"{login_url}{username}"
-        return hashlib.sha256(combined.encode()).hexdigest()
+        return _generate_key(login_url, username)
     
     def _sanitize_secret_name(self, name: str) -> str:
         """Sanitize secret name to be compatible with Azure Key Vault naming rules"""
-        # Azure Key Vault secret names can only contain alphanumeric characters and hyphens
-        # and must be 1-127 characters long
-        sanitized = ''.join(c if c.isalnum() else '-' for c in name)
-        # Remove consecutive hyphens
-        while '--' in sanitized:
-            sanitized = sanitized.replace('--', '-')
-        # Remove leading/trailing hyphens
-        sanitized = sanitized.strip('-')
-        # Ensure it's not empty and not too long
-        if not sanitized:
-            sanitized = 'secret'
-        if len(sanitized) > 127:
-            sanitized = sanitized[:127].rstrip('-')
-        return sanitized
+        return _sanitize_secret_name(name)
     
     def _save_password_sync(self, organization_name: str, login_url: str, username: str, password: str) -> bool:
         """Synchronous password save operation"""
         try:
-            # Get the client for this organization
-            client = self._get_client(organization_name)
-            
-            key = self._generate_key(login_url, username)
-            secret_name = self._sanitize_secret_name(key)
+            secret_name = secret_name_for(login_url, username)
             
             # Store the password with metadata
             secret_value = {
@@ -89,8 +180,7 @@ class AzureKeyVaultService:
             # Convert to string for storage
             secret_json = json.dumps(secret_value)
             
-            # Set secret with content type as password
-            client.set_secret(secret_name, secret_json, content_type="Password")
+            self.backend.set_secret(organization_name, secret_name, secret_json)
             return True
         except Exception as e:
             print(f"Error saving password: {str(e)}")
@@ -98,42 +188,101 @@ class AzureKeyVaultService:
 
     async def save_password(self, organization_name: str, login_url: str, username: str, password: str) -> bool:
         """Save password to Azure Key Vault"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            self._executor,
-            self._save_password_sync,
-            organization_name,
-            login_url,
-            username,
-            password
-        )
+        key = (organization_name, secret_name_for(login_url, username))
+        self._invalidate(key)
+        loop = asyncio.get_running_loop()
+        async with keyvault.guard() as call:
+            saved = await loop.run_in_executor(
+                self._executor,
+                self._save_password_sync,
+                organization_name,
+                login_url,
+                username,
+                password
+            )
+            if not saved:
+                call.fail()
+        # Invalidate again: a read that started during the write may have cached the old value.
+        self._invalidate(key)
+        return saved
     
-    def _get_password_sync(self, organization_name: str, login_url: str, username: str) -> Optional[str]:
+    def _get_password_sync(self, organization_name: str, secret_name: str) -> Optional[str]:
         """Synchronous password retrieval operation"""
+        self.vault_reads += 1
+        secret_value = self.backend.get_secret(organization_name, secret_name)
+        # Parse the JSON value
+        secret_data = json.loads(secret_value)
+        return secret_data.get("password")
+
+    async def fetch_password(self, organization_name: str, login_url: str, username: str) -> Optional[str]:
+        """Retrieve a password through the cache, raising on vault errors."""
+        key = (organization_name, secret_name_for(login_url, username))
+        password = self.cache.get(key)
+        if password is not None:
+            return password
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        generation = self._generations.get(key, 0)
+        loop = asyncio.get_running_loop()
+        async with keyvault.guard():
+            future = loop.run_in_executor(self._executor, self._get_password_sync, organization_name, key[1])
+            self._inflight[key] = future
+            try:
+                password = await asyncio.shield(future)
+            finally:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+        if password is not None and self._generations.get(key, 0) == generation:
+            self.cache.put(key, password)
+        return password
+
+    async def get_password(self, organization_name: str, login_url: str, username: str) -> Optional[str]:
+        """Retrieve password from Azure Key Vault; None if not found, DependencyUnavailable if shed"""
         try:
-            # Get the client for this organization
-            client = self._get_client(organization_name)
-            
-            key = self._generate_key(login_url, username)
-            secret_name = self._sanitize_secret_name(key)
-            
-            secret = client.get_secret(secret_name)
-            
-            # Parse the JSON value
-            secret_data = json.loads(secret.value)
-            
-            return secret_data.get("password")
+            return await self.fetch_password(organization_name, login_url, username)
+        except DependencyUnavailable:
+            raise
         except Exception as e:
             print(f"Error retrieving password: {str(e)}")
             return None
 
-    async def get_password(self, organization_name: str, login_url: str, username: str) -> Optional[str]:
-        """Retrieve password from Azure Key Vault"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            self._executor,
-            self._get_password_sync,
-            organization_name,
-            login_url,
-            username
-        )
+    async def fetch_passwords(self, logins: List[Tuple[str, str, str]]) -> List[Tuple[Optional[str], Optional[str]]]:
+        """
+        Retrieve many (organization_name, login_url, username) passwords at once,
+        at most BULK_PASSWORD_CONCURRENCY vault calls at a time. Returns one
+        (password, error) pair per login, in order; a failed login does not fail
+        the others. Every password found is left in the cache.
+        """
+        semaphore = asyncio.Semaphore(BULK_PASSWORD_CONCURRENCY)
+
+        async def fetch(organization_name: str, login_url: str, username: str):
+            async with semaphore:
+                try:
+                    password = await self.fetch_password(organization_name, login_url, username)
+                except Exception as e:
+                    return None, str(e)
+            return (password, None) if password is not None else (None, "Password not found")
+
+        return await asyncio.gather(*(fetch(*login) for login in logins))
+
+    def _invalidate(self, key: Tuple[str, str]):
+        self._generations[key] = self._generations.get(key, 0) + 1
+        self._inflight.pop(key, None)
+        self.cache.invalidate(key)
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "executor_workers": KEYVAULT_MAX_WORKERS,
+            "inflight": len(self._inflight),
+            "coalesced": self.coalesced,
+            "vault_reads": self.vault_reads,
+            "cache": self.cache.stats(),
+        }
+
+
+azure_service = AzureKeyVaultService()
@@ -2,13 +2,16 @@ import logging
 import os
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Optional
  
 from browser_use.agent.service import Agent, Controller 
 from browser_use.browser.types import async_playwright
-from browser_use.agent.views import ActionResult
+from browser_use.agent.views import ActionResult, AgentState
 from browser_use.browser import BrowserSession
 from browser_use.llm.openai.chat import ChatOpenAI
 from browser_use.llm.google.chat import ChatGoogle
+from app.services.agent_cache import agent_cache
+from app.services.document_manifest import document_manifests
 from app.utility.blob_log import save_agent_history_to_blob
 
 # Set up logging
@@ -18,7 +21,8 @@ logger = logging.getLogger(__name__)
 BROWSERS = {}
 CONTEXTS = {}
 SESSION_PAGES={}
-AGENTS ={}
+AGENTS = agent_cache
+SESSION_PROFILES = {}
 USER_DATA_DIR_BASE = "/app/tmp/browser_profiles"
 playwright = None
 extension_path = "/app/extensions/capsolver"
@@ -26,44 +30,14 @@ controller= Controller()
 
 @controller.action('Upload file to interactive element with file path')
 async def upload_file(index: int, path: str, browser_session: BrowserSession, available_file_paths: list[str]):
-	# Allow files in the available_file_paths list OR files created by the agent in its temp directory
-	is_allowed_file = (path in available_file_paths or 
-					   'browser_use_agent_' in path or 
-					   'browseruse_agent_data' in path or
-					   path.endswith('.txt') or 
-					   path.endswith('.pdf'))
-	
-	# If the path is relative, try to find it in the /app directory or /app/tmp
-	absolute_path = path
-	if not os.path.isabs(path):
-		# Try various locations for the file
-		possible_paths = [
-			f'/app/{path}',
-			f'/app/tmp/{path}',
-			f'/tmp/{path}',
-			os.path.join('/app', path)
-		]
-		
-		for possible_path in possible_paths:
-			if os.path.exists(possible_path):
-				absolute_path = possible_path
-				break
-		else:
-			# If file doesn't exist anywhere, create a dummy file
-			absolute_path = f'/app/tmp/{path}'
-			os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
-			if path.endswith('.pdf'):
-				# Create a simple PDF-like file
-				with open(absolute_path, 'w') as f:
-					f.write('%PDF-1.4\n1 0 obj\n<<\n/Type /Catalog\n/Pages 2 0 R\n>>\nendobj\n2 0 obj\n<<\n/Type /Pages\n/Kids [3 0 R]\n/Count 1\n>>\nendobj\n3 0 obj\n<<\n/Type /Page\n/Parent 2 0 R\n/MediaBox [0 0 612 792]\n>>\nendobj\nxref\n0 4\n0000000000 65535 f \n0000000010 00000 n \n0000000079 00000 n \n0000000173 00000 n \ntrailer\n<<\n/Size 4\n/Root 1 0 R\n>>\nstartxref\n301\n%%EOF')
-			else:
-				# Create a simple text file
-				with open(absolute_path, 'w') as f:
-					f.write(f'Test file content for {path} - created for upload functionality.')
-	
-	logger.info(f"Upload attempt - Path: {path}, Absolute path: {absolute_path}, Is allowed: {is_allowed_file}, Exists: {os.path.exists(absolute_path)}")
-	
-	if not is_allowed_file:
+	# Documents come from the manifest planner-backend published for the task's request
+	absolute_path = path if path in available_file_paths else document_manifests.resolve(path, available_file_paths)
+	if absolute_path is None and ('browser_use_agent_' in path or 'browseruse_agent_data' in path):
+		absolute_path = path  # written by the agent itself
+
+	logger.info(f"Upload attempt - Path: {path}, Resolved path: {absolute_path}")
+
+	if absolute_path is None:
 		return ActionResult(error=f'File path {path} is not available. Available paths: {available_file_paths}')
 
 	if not os.path.exists(absolute_path):
@@ -129,32 +103,44 @@ async def upload_file(index: int, path: str, browser_session: BrowserSession, av
 		logger.info(msg)
 		return ActionResult(error=msg)
 
-async def setup_browser_for_session(session_id:str,display:str):
+async def launch_browser_context(profile_dir: str, display: str):
+    """
+    Launch a persistent Chromium context with the capsolver extension on the given display.
+    """
     global playwright
     if playwright is None:
         playwright = await  async_playwright().start()
-    if session_id not in BROWSERS:
+    Path(profile_dir).mkdir(parents=True, exist_ok=True)
+    return await playwright.chromium.launch_persistent_context(
+        user_data_dir=profile_dir,
+        headless=False,
+        args=[
+            "--no-sandbox",
+            f"--display={display}",
+            f"--disable-extensions-except={extension_path}",
+            f"--load-extension={extension_path}"
+        ]
+    )
+
+
+async def setup_browser_for_session(session_id:str,display:str):
+    if session_id not in CONTEXTS:
+        # Sessions leased from the warm pool already have a context; this is the cold path.
         profile_dir = os.path.join(USER_DATA_DIR_BASE, session_id)
-        Path(profile_dir).mkdir(parents=True, exist_ok=True)
-        context = await playwright.chromium.launch_persistent_context(
-            user_data_dir=profile_dir,
-            headless=False,
-            args=[
-                "--no-sandbox",
-                f"--display={display}",
-                f"--disable-extensions-except={extension_path}",
-                f"--load-extension={extension_path}"
-            ]
-        )
+        context = await launch_browser_context(profile_dir, display)
  
         BROWSERS[session_id] = context.browser  # context.browser is the actual browser instance
         CONTEXTS[session_id] = context
+        SESSION_PROFILES[session_id] = profile_dir
     return CONTEXTS[session_id]
  
  
-async def run_task(task: str, session_id: str, display: str):
+async def run_task(task: str, session_id: str, display: str, agent_state: Optional[AgentState] = None, on_step_end=None,
+                   request_id: Optional[str] = None):
     """
     Run the task in the browser for the given session and store screenshots to MongoDB.
+    `agent_state` continues a previous agent of the session (e.g. after a restart).
+    `request_id` selects the staged documents the agent may upload.
     """
     try:
         api_key = os.getenv("OPENAI_API_KEY")
@@ -167,8 +153,9 @@ async def run_task(task: str, session_id: str, display: str):
         await page.bring_to_front()
         SESSION_PAGES[session_id] = page
         
-        # Use absolute paths for file uploads
-        available_file_paths = ['/app/tmp/dummy_upload_file.pdf', '/app/tmp/test_document.txt']
+        # Documents planner-backend staged for the request; without a request there is nothing to upload
+        documents = await document_manifests.load(request_id) if request_id else None
+        available_file_paths = documents.paths if documents else []
         
         extended_prompt ="""
         You are a browser automation agent that interacts with websites like a human.
@@ -182,56 +169,23 @@ async def run_task(task: str, session_id: str, display: str):
 
         """
         
-        # Ensure the tmp directory exists and create dummy files
-        os.makedirs('/app/tmp', exist_ok=True)
-        
-        for file_path in available_file_paths:
-            if not os.path.exists(file_path):
-                if file_path.endswith('.pdf'):
-                    # Create a simple PDF file
-                    with open(file_path, 'w') as f:
-                        f.write('%PDF-1.4\n1 0 obj\n<<\n/Type /Catalog\n/Pages 2 0 R\n>>\nendobj\n2 0 obj\n<<\n/Type /Pages\n/Kids [3 0 R]\n/Count 1\n>>\nendobj\n3 0 obj\n<<\n/Type /Page\n/Parent 2 0 R\n/MediaBox [0 0 612 792]\n>>\nendobj\nxref\n0 4\n0000000000 65535 f \n0000000010 00000 n \n0000000079 00000 n \n0000000173 00000 n \ntrailer\n<<\n/Size 4\n/Root 1 0 R\n>>\nstartxref\n301\n%%EOF')
-                elif file_path.endswith('.txt'):
-                    # Create a medical document
-                    with open(file_path, 'w') as f:
-                        f.write("""MEDICAL DOCUMENT - PRIOR AUTHORIZATION SUPPORT
-
-Patient: Anurag Sinha
-DOB: 01/07/2001
-Member ID: 12345
-
-SERVICE REQUEST:
-Service Type: MRI
-CPT Code: 72148
-Diagnosis: Persistent pain
-Clinical Justification: Required to rule out structural abnormalities
-Urgency: Urgent
-Requested Date: 01/01/2025
-
-This document supports the prior authorization request for the above patient.
-Generated for browser automation testing.
-
-Medical Provider Signature: [Electronic Signature]
-License Number: [Provider License]
-""")
-                else:
-                    # Default text content
-                    with open(file_path, 'w') as f:
-                        f.write(f'Test file content for {os.path.basename(file_path)} - created for upload functionality.')
-                
-                logger.info(f"Created file at: {file_path}")
-
         # Run agent
+        resumed = bool(agent_state and agent_state.message_manager_state.history.get_messages())
         agent = Agent(
             task=task,
             llm=ChatOpenAI(model='gpt-4.1-mini', temperature=0.5, api_key=api_key),
             page=page,
             extend_system_message=extended_prompt,
             controller=controller,
+            available_file_paths=available_file_paths,
             custom_context={'available_file_paths': available_file_paths,'request_description': 'example_request_id' + str(os.getpid())},
+            injected_agent_state=agent_state,
         )
+        if resumed:
+            # A restored message history does not pick up the constructor task.
+            agent.add_new_task(task)
         AGENTS[session_id] = agent
-        result_agent = await agent.run()
+        result_agent = await agent.run(on_step_end=on_step_end)
         save_agent_history_to_blob(agent, session_id)
         return {"result":result_agent}
  
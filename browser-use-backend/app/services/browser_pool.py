@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from app.core.config import BROWSER_POOL_SIZE, BROWSER_POOL_HEALTH_INTERVAL, BROWSER_POOL_HEALTH_TIMEOUT
+from app.services.browser_manager import (
+    BROWSERS, CONTEXTS, SESSION_PROFILES, USER_DATA_DIR_BASE, launch_browser_context,
+)
+from app.utility.display_allocation import display_allocator
+from app.utility.process_supervisor import X11_SOCKET_DIR, process_supervisor
+from app.utility.resource_limits import resource_limits
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PooledBrowser:
+    """A ready-to-use Xvfb display, VNC proxy and Chromium context."""
+    owner: str
+    display_num: int
+    web_port: int
+    vnc_port: int
+    profile_dir: str
+    context: Any
+    created_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def display(self) -> str:
+        return f":{self.display_num}"
+
+
+class BrowserPool:
+    """
+    Keeps `size` browsers warm so that a new session does not pay the Xvfb,
+    VNC and Chromium cold start. Leased browsers are never handed to a second
+    session: on release they are torn down and replaced with a fresh profile.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: deque[PooledBrowser] = deque()
+        self._leased: Dict[str, PooledBrowser] = {}
+        self._warming = 0
+        self._lock = asyncio.Lock()
+        self._health_task: Optional[asyncio.Task] = None
+        self._lease_latencies: deque[float] = deque(maxlen=500)
+        self._hits = 0
+        self._misses = 0
+        self._discarded = 0
+
+    async def start(self):
+        if self.size <= 0:
+            logger.info("Browser pool disabled (BROWSER_POOL_SIZE=0)")
+            return
+        await self._replenish()
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def shutdown(self):
+        if self._health_task:
+            self._health_task.cancel()
+        while self._idle:
+            await self._destroy(self._idle.popleft())
+        for session_id in list(self._leased):
+            await self.release(session_id)
+
+    async def lease(self, session_id: str) -> PooledBrowser:
+        """
+        Hand a warm browser to `session_id`, falling back to a cold launch when
+        the pool is empty. The session maps in browser_manager are filled in so
+        that run_task picks the context up.
+        """
+        started = time.perf_counter()
+        pooled = None
+        async with self._lock:
+            while self._idle and pooled is None:
+                candidate = self._idle.popleft()
+                if await self._is_healthy(candidate):
+                    pooled = candidate
+                else:
+                    self._discarded += 1
+                    asyncio.create_task(self._destroy(candidate))
+        if pooled:
+            self._hits += 1
+        else:
+            self._misses += 1
+            pooled = await self._create()
+
+        display_allocator.reassign(pooled.owner, session_id)
+        process_supervisor.reassign(pooled.owner, session_id)
+        pooled.owner = session_id
+        self._leased[session_id] = pooled
+        CONTEXTS[session_id] = pooled.context
+        BROWSERS[session_id] = pooled.context.browser
+        SESSION_PROFILES[session_id] = pooled.profile_dir
+        self._lease_latencies.append(time.perf_counter() - started)
+        asyncio.create_task(self._replenish())
+        return pooled
+
+    def get_lease(self, session_id: str) -> Optional[PooledBrowser]:
+        return self._leased.get(session_id)
+
+    def owns(self, owner: str) -> bool:
+        return owner in self._leased or any(pooled.owner == owner for pooled in self._idle)
+
+    async def release(self, session_id: str, keep_profile: bool = False) -> bool:
+        """Tear down the browser leased to `session_id` and warm a replacement."""
+        pooled = self._leased.pop(session_id, None)
+        if not pooled:
+            return False
+        CONTEXTS.pop(session_id, None)
+        BROWSERS.pop(session_id, None)
+        SESSION_PROFILES.pop(session_id, None)
+        await self._destroy(pooled, keep_profile)
+        asyncio.create_task(self._replenish())
+        return True
+
+    def metrics(self) -> dict:
+        latencies = sorted(self._lease_latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "leased": len(self._leased),
+            "warming": self._warming,
+            "hits": self._hits,
+            "misses": self._misses,
+            "discarded_unhealthy": self._discarded,
+            "lease_latency_ms": {
+                "count": len(latencies),
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "max": round(latencies[-1] * 1000, 2) if latencies else None,
+            },
+        }
+
+    async def _replenish(self):
+        while len(self._idle) + self._warming < self.size:
+            self._warming += 1
+            try:
+                pooled = await self._create()
+                self._idle.append(pooled)
+            except Exception as e:
+                logger.error(f"Failed to warm pooled browser: {e}")
+                return
+            finally:
+                self._warming -= 1
+
+    async def _create(self) -> PooledBrowser:
+        owner = f"pool-{uuid.uuid4().hex}"
+        lease = display_allocator.acquire(owner)
+        profile_dir = os.path.join(USER_DATA_DIR_BASE, owner)
+        try:
+            display = await process_supervisor.start_display(owner, lease.display_num, lease.vnc_port, lease.web_port)
+            context = await launch_browser_context(profile_dir, display)
+            await asyncio.to_thread(resource_limits.apply_to_browser, lease.display_num, profile_dir)
+        except Exception:
+            await self._free_display(owner)
+            await asyncio.to_thread(shutil.rmtree, profile_dir, True)
+            raise
+        return PooledBrowser(owner, lease.display_num, lease.web_port, lease.vnc_port, profile_dir, context)
+
+    async def _destroy(self, pooled: PooledBrowser, keep_profile: bool = False):
+        try:
+            await pooled.context.close()
+        except Exception as e:
+            logger.warning(f"Error closing pooled context on :{pooled.display_num}: {e}")
+        await self._free_display(pooled.owner)
+        if not keep_profile:
+            await asyncio.to_thread(shutil.rmtree, pooled.profile_dir, True)
+
+    @staticmethod
+    async def _free_display(owner: str):
+        await process_supervisor.stop(owner)
+        display_allocator.release(owner)
+
+    async def _is_healthy(self, pooled: PooledBrowser) -> bool:
+        if process_supervisor.is_degraded(pooled.owner):
+            return False
+        if not os.path.exists(os.path.join(X11_SOCKET_DIR, f"X{pooled.display_num}")):
+            return False
+        try:
+            page = pooled.context.pages[0] if pooled.context.pages else await pooled.context.new_page()
+            await asyncio.wait_for(page.evaluate("1"), timeout=BROWSER_POOL_HEALTH_TIMEOUT)
+            return True
+        except Exception as e:
+            logger.warning(f"Pooled browser on :{pooled.display_num} failed health check: {e}")
+            return False
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(BROWSER_POOL_HEALTH_INTERVAL)
+            try:
+                # Check a snapshot without the lock so lease() is not blocked for the whole sweep
+                async with self._lock:
+                    idle = list(self._idle)
+                dead = []
+                for pooled in idle:
+                    if pooled not in self._idle:
+                        continue  # leased meanwhile
+                    if await self._is_healthy(pooled):
+                        display_allocator.touch(pooled.owner)
+                    else:
+                        dead.append(pooled)
+                async with self._lock:
+                    dead = [pooled for pooled in dead if pooled in self._idle]
+                    for pooled in dead:
+                        self._idle.remove(pooled)
+                for pooled in dead:
+                    self._discarded += 1
+                    await self._destroy(pooled)
+                await self._replenish()
+            except Exception as e:
+                logger.error(f"Browser pool health check failed: {e}")
+
+
+browser_pool = BrowserPool(BROWSER_POOL_SIZE)
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import DOCUMENT_STORE_DIR, DOCUMENT_MANIFEST_CACHE_SIZE
+
+
+class RequestDocuments:
+    """One request's manifest, indexed by every name the agent may use for a document."""
+
+    def __init__(self, request_id: str, root: str, manifest: dict):
+        self.request_id = request_id
+        self.paths: List[str] = []
+        self._by_key: Dict[str, str] = {}
+        for document in manifest.get("documents", []):
+            staged = os.path.join(root, document["path"])
+            self.paths.append(staged)
+            keys = [staged, document["path"], document["name"]]
+            if document.get("source"):
+                keys += [document["source"], os.path.basename(document["source"])]
+            for key in keys:
+                self._by_key.setdefault(key, staged)
+
+    def resolve(self, path: str) -> Optional[str]:
+        return self._by_key.get(path) or self._by_key.get(os.path.basename(path))
+
+
+class DocumentManifests:
+    """
+    Reads the per-request manifests planner-backend publishes on the shared
+    volume (planner-backend services/document_store.py) and resolves the
+    path an agent passes to upload_file to a staged file with dictionary
+    lookups. A manifest is re-read only when its mtime changes.
+    """
+
+    def __init__(self, root: str, max_requests: int):
+        self.root = root
+        self.max_requests = max_requests
+        self._requests: "OrderedDict[str, Tuple[float, RequestDocuments]]" = OrderedDict()
+        self._by_path: Dict[str, RequestDocuments] = {}
+        self.loads = 0
+        self.reuses = 0
+
+    async def load(self, request_id: str) -> Optional[RequestDocuments]:
+        """The documents staged for a request, or None if it has none."""
+        if os.path.basename(request_id) != request_id or request_id.startswith("."):
+            return None
+        path = os.path.join(self.root, "requests", request_id, "manifest.json")
+        try:
+            mtime = await asyncio.to_thread(os.path.getmtime, path)
+        except OSError:
+            self._forget(request_id)
+            return None
+        cached = self._requests.get(request_id)
+        if cached and cached[0] == mtime:
+            self._requests.move_to_end(request_id)
+            self.reuses += 1
+            return cached[1]
+        try:
+            manifest = await asyncio.to_thread(self._read, path)
+        except (OSError, ValueError):
+            return cached[1] if cached else None
+        self.loads += 1
+        documents = RequestDocuments(request_id, self.root, manifest)
+        self._forget(request_id)
+        self._requests[request_id] = (mtime, documents)
+        for staged in documents.paths:
+            self._by_path[staged] = documents
+        while len(self._requests) > self.max_requests:
+            self._forget(next(iter(self._requests)))
+        return documents
+
+    def resolve(self, path: str, available_file_paths: List[str]) -> Optional[str]:
+        """
+        Staged file for `path` (a staged path, a document name or the path it
+        was staged from) among the documents of `available_file_paths`.
+        """
+        if path in self._by_path:
+            return path if path in available_file_paths else None
+        documents = self._by_path.get(available_file_paths[0]) if available_file_paths else None
+        return documents.resolve(path) if documents else None
+
+    def _forget(self, request_id: str):
+        cached = self._requests.pop(request_id, None)
+        if cached:
+            for staged in cached[1].paths:
+                self._by_path.pop(staged, None)
+
+    @staticmethod
+    def _read(path: str) -> dict:
+        with open(path) as f:
+            return json.load(f)
+
+    def stats(self) -> dict:
+        return {
+            "root": self.root,
+            "requests": len(self._requests),
+            "documents": len(self._by_path),
+            "loads": self.loads,
+            "reuses": self.reuses,
+        }
+
+
+document_manifests = DocumentManifests(DOCUMENT_STORE_DIR, DOCUMENT_MANIFEST_CACHE_SIZE)
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from app.core.config import SCREENSHOT_BATCH_SIZE, SCREENSHOT_BUFFER_MAX_BYTES, SCREENSHOT_FLUSH_INTERVAL
+from app.db.mongo import get_db
+
+logger = logging.getLogger(__name__)
+
+
+class ScreenshotWriter:
+    """
+    Write-behind buffer for step screenshots.
+
+    Screenshots are buffered per session and written in small batches: when a
+    session has SCREENSHOT_BATCH_SIZE screenshots waiting, when its buffer
+    exceeds SCREENSHOT_BUFFER_MAX_BYTES (the step then waits for the write, so
+    memory per session stays bounded), every SCREENSHOT_FLUSH_INTERVAL seconds,
+    and when the task ends. Each write is an upsert on the unique
+    (session_id, step_number) index, so a retried or duplicated step can never
+    create a second document. Until its write has finished, a screenshot is
+    served from the buffer (see `buffered`), so the image URL of a step event
+    works as soon as the event is published.
+    """
+
+    def __init__(self):
+        self._buffers: Dict[str, List[dict]] = defaultdict(list)
+        self._bytes: Dict[str, int] = defaultdict(int)
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._writing: Dict[str, List[dict]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.failed_batches = 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+        await self.flush_all()
+
+    async def add(self, doc: dict):
+        session_id = doc["session_id"]
+        self._buffers[session_id].append(doc)
+        self._bytes[session_id] += len(doc.get("screenshot") or b"")
+        if (len(self._buffers[session_id]) >= SCREENSHOT_BATCH_SIZE
+                or self._bytes[session_id] >= SCREENSHOT_BUFFER_MAX_BYTES):
+            await self.flush(session_id)
+
+    def buffered(self, session_id: str, step_number: int) -> Optional[dict]:
+        """The screenshot of a step that is waiting to be written, or being written."""
+        for doc in self._buffers.get(session_id, []) + self._writing.get(session_id, []):
+            if doc["step_number"] == step_number:
+                return doc
+        return None
+
+    async def flush(self, session_id: str):
+        async with self._locks[session_id]:
+            batch = self._buffers.pop(session_id, [])
+            self._bytes.pop(session_id, None)
+            if not batch:
+                return
+            self._writing[session_id] = batch
+            try:
+                await get_db()["screenshots"].bulk_write([
+                    UpdateOne(
+                        {"session_id": doc["session_id"], "step_number": doc["step_number"]},
+                        {"$setOnInsert": doc},
+                        upsert=True,
+                    )
+                    for doc in batch
+                ], ordered=False)
+                self.written += len(batch)
+            except Exception as e:
+                self.failed_batches += 1
+                logger.error(f"Failed to write {len(batch)} screenshot(s) of session {session_id}: {e}")
+            finally:
+                self._writing.pop(session_id, None)
+                if session_id not in self._buffers:
+                    self._locks.pop(session_id, None)
+
+    async def flush_all(self):
+        for session_id in list(self._buffers):
+            await self.flush(session_id)
+
+    def stats(self) -> dict:
+        return {
+            "buffered_sessions": len(self._buffers),
+            "buffered_screenshots": sum(len(batch) for batch in self._buffers.values()),
+            "buffered_bytes": sum(self._bytes.values()),
+            "written": self.written,
+            "failed_batches": self.failed_batches,
+        }
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(SCREENSHOT_FLUSH_INTERVAL)
+            try:
+                await self.flush_all()
+            except Exception as e:
+                logger.error(f"Screenshot flush failed: {e}")
+
+
+screenshot_writer = ScreenshotWriter()
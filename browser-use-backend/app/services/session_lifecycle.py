@@ -0,0 +1,180 @@
+import asyncio
+import datetime
+import logging
+import os
+import shutil
+from typing import Optional, Set
+
+from app.core.config import AGENT_HISTORY_KEEP_STEPS
+from app.db.mongo import get_db
+from app.models.db_models import SessionStatus
+from app.services.agent_cache import compact_agent
+from app.services.browser_manager import AGENTS, BROWSERS, CONTEXTS, SESSION_PAGES, SESSION_PROFILES, USER_DATA_DIR_BASE
+from app.services.browser_pool import browser_pool
+from app.services.session_registry import session_registry
+from app.services.session_router import session_router
+from app.utility.blob_log import save_agent_history_to_blob
+from app.utility.display_allocation import (
+    DisplayLease, VNC_DISPLAYS, VNC_PORTS, cleanup_session_processes, release_display,
+)
+from app.utility.process_supervisor import process_supervisor
+
+logger = logging.getLogger(__name__)
+
+
+async def release_session_browser(session_id: str, keep_profile: bool = False) -> str:
+    """
+    Close the browser of a session and stop and free its display. Returns the
+    profile directory, which is deleted unless `keep_profile` is set.
+    """
+    page = SESSION_PAGES.pop(session_id, None)
+    if page:
+        await page.close()
+    VNC_PORTS.pop(session_id, None)
+    display_num = VNC_DISPLAYS.pop(session_id, None)
+    profile_dir = SESSION_PROFILES.get(session_id, os.path.join(USER_DATA_DIR_BASE, session_id))
+    if not await browser_pool.release(session_id, keep_profile):
+        SESSION_PROFILES.pop(session_id, None)
+        context = CONTEXTS.pop(session_id, None)
+        if context:
+            await context.close()
+        browser = BROWSERS.pop(session_id, None)
+        if browser:
+            await browser.close()
+        if process_supervisor.pids(session_id):
+            await process_supervisor.stop(session_id)
+        elif display_num:
+            cleanup_session_processes(display_num)
+        release_display(session_id)
+    if not keep_profile and os.path.exists(profile_dir):
+        shutil.rmtree(profile_dir)
+        logging.info(f"Deleted browser profile directory: {profile_dir}")
+    return profile_dir
+
+
+async def teardown_session(session_id: str):
+    """
+    Close the browser, free the display and delete the profile of a session,
+    then mark it deleted in MongoDB.
+    """
+    await release_session_browser(session_id)
+    hibernated_profile = session_registry.hibernated.get(session_id)
+    if hibernated_profile:
+        shutil.rmtree(hibernated_profile, ignore_errors=True)
+
+    await session_registry.unregister(session_id)
+    await get_db()["sessions"].update_one(
+        {"_id": session_id},
+        {
+            "$set": {
+                "status": SessionStatus.DELETED,
+                "is_active": False,
+                "updated_at": datetime.datetime.now()
+            }
+        }
+    )
+    agent = AGENTS.forget(session_id)
+    if agent:
+        agent.stop()
+
+
+def is_display_owner_alive(owner: str) -> bool:
+    return owner in VNC_DISPLAYS or browser_pool.owns(owner)
+
+
+async def reclaim_display(lease: DisplayLease):
+    """Display reaper hook: a session whose display lease expired is torn down entirely."""
+    logger.warning(f"Display lease for session {lease.owner} expired, tearing the session down")
+    await teardown_session(lease.owner)
+
+
+async def mark_session_degraded(owner: str, process_name: str, returncode: Optional[int]):
+    """Process supervisor hook: record that a session lost one of its display processes."""
+    if owner not in VNC_DISPLAYS:
+        return
+    await get_db()["sessions"].update_one(
+        {"_id": owner},
+        {
+            "$set": {
+                "status": SessionStatus.DEGRADED,
+                "last_error": f"{process_name} exited unexpectedly (code={returncode})",
+                "updated_at": datetime.datetime.now()
+            }
+        }
+    )
+
+
+async def adopt_orphaned_sessions(lost_workers: Set[str]):
+    """
+    Session router hook: take over the active sessions of lost workers that now
+    hash to this worker. The old browser is gone, so each adopted session gets a
+    fresh browser and display; its queued tasks then run here.
+    """
+    db = get_db()
+    cursor = db["sessions"].find({"is_active": True, "worker_id": {"$in": list(lost_workers)}}, {"_id": 1, "worker_id": 1})
+    async for session in cursor:
+        session_id = session["_id"]
+        if await session_router.owner(session_id) != session_router.self_id:
+            continue
+        claimed = await db["sessions"].update_one(
+            {"_id": session_id, "worker_id": session["worker_id"]},
+            {"$set": {"worker_id": session_router.self_id}}
+        )
+        if not claimed.modified_count:
+            continue
+        try:
+            pooled = await browser_pool.lease(session_id)
+        except Exception as e:
+            logger.error(f"Could not adopt session {session_id}: {e}")
+            continue
+        VNC_PORTS[session_id] = pooled.web_port
+        VNC_DISPLAYS[session_id] = pooled.display_num
+        await session_registry.register(session_id, pooled.display_num, pooled.web_port, pooled.vnc_port, pooled.profile_dir)
+        vnc_url = f"{os.getenv('BASE_URL','http://host.docker.internal')}:{pooled.web_port}/vnc.html?autoconnect=1"
+        await db["sessions"].update_one(
+            {"_id": session_id},
+            {
+                "$set": {
+                    "status": SessionStatus.ACTIVE,
+                    "vnc_url": vnc_url,
+                    "last_error": f"Moved from lost worker {session['worker_id']}",
+                    "updated_at": datetime.datetime.now()
+                }
+            }
+        )
+        logger.warning(f"Adopted session {session_id} from lost worker {session['worker_id']}")
+
+
+async def persist_evicted_agent(session_id: str, agent):
+    """AGENTS.on_evict: save a compacted copy of the agent's state so the session's next task can rehydrate it."""
+    try:
+        compact_agent(agent, AGENT_HISTORY_KEEP_STEPS)
+        await asyncio.to_thread(save_agent_history_to_blob, agent, session_id)
+        await session_registry.mark_agent(session_id)
+    except Exception as e:
+        logger.error(f"Failed to save evicted agent of session {session_id}: {e}")
+
+
+async def hibernate_session(session_id: str):
+    """
+    Park an idle session: save its agent state, stop its browser and display
+    processes, and keep its profile. The next task for the session wakes it
+    (see SessionRegistry.wake).
+    """
+    agent = AGENTS.pop(session_id, None)
+    if agent:
+        await asyncio.to_thread(save_agent_history_to_blob, agent, session_id)
+        await session_registry.mark_agent(session_id)
+        agent.stop()
+    profile_dir = await release_session_browser(session_id, keep_profile=True)
+    await session_registry.hibernate(session_id, profile_dir)
+    await get_db()["sessions"].update_one(
+        {"_id": session_id},
+        {
+            "$set": {
+                "status": SessionStatus.HIBERNATED,
+                "updated_at": datetime.datetime.now()
+            }
+        }
+    )
+    logger.info(f"Hibernated idle session {session_id}")
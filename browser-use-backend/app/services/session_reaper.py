@@ -0,0 +1,175 @@
+import asyncio
+import datetime
+import logging
+import time
+from typing import Dict, List, Optional
+
+import psutil
+from pymongo import UpdateOne
+
+from app.core.config import IDLE_SESSION_TTL, IDLE_SESSION_ACTION, IDLE_REAPER_INTERVAL
+from app.db.mongo import get_db
+from app.models.db_models import TaskStatus
+from app.services.browser_manager import SESSION_PROFILES
+from app.services.session_lifecycle import hibernate_session, teardown_session
+from app.services.task_queue import task_queue
+from app.utility.display_allocation import VNC_DISPLAYS, VNC_PORTS, display_allocator
+from app.utility.process_supervisor import process_supervisor
+from app.utility.resource_limits import USER_DATA_DIR_FLAG
+
+logger = logging.getLogger(__name__)
+
+
+class SessionReaper:
+    """
+    Reclaims sessions nobody is using and accounts for what each session costs.
+
+    A session's last activity is the `last_seen` of its display lease, which
+    /task/execute, /status and the task runner already touch. The reaper also
+    touches it while a noVNC viewer is connected to the session's websockify.
+    Sessions idle for longer than IDLE_SESSION_TTL with no running or queued
+    task are hibernated (or torn down, per IDLE_SESSION_ACTION).
+
+    Every pass also samples CPU and RSS of each session's Chromium process tree
+    plus its Xvfb, x11vnc and websockify, and records them on the session document.
+    """
+
+    def __init__(self):
+        self._processes: Dict[int, psutil.Process] = {}  # kept so cpu_percent() has a baseline
+        self._browser_pids: Dict[str, int] = {}
+        self.usage: Dict[str, dict] = {}
+        self.reclaimed = 0
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(IDLE_REAPER_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Session reaper pass failed: {e}")
+
+    async def sweep(self):
+        session_ids = list(VNC_DISPLAYS)
+        self.usage = await asyncio.to_thread(self._sample, session_ids)
+        await self._record_usage()
+
+        now = time.monotonic()
+        idle = []
+        for session_id in session_ids:
+            lease = display_allocator.get(session_id)
+            if lease is None or task_queue.is_busy(session_id):
+                continue
+            if self.usage.get(session_id, {}).get("vnc_viewers"):
+                display_allocator.touch(session_id)
+                continue
+            if now - lease.last_seen > IDLE_SESSION_TTL:
+                idle.append(session_id)
+        if not idle:
+            return
+        queued = set(await get_db()["tasks"].distinct("session_id", {"session_id": {"$in": idle}, "status": TaskStatus.QUEUED}))
+        for session_id in idle:
+            if session_id in queued:
+                continue
+            logger.warning(f"Session {session_id} idle for over {IDLE_SESSION_TTL:.0f}s, reclaiming ({IDLE_SESSION_ACTION})")
+            try:
+                if IDLE_SESSION_ACTION == "teardown":
+                    await teardown_session(session_id)
+                else:
+                    await hibernate_session(session_id)
+                self.reclaimed += 1
+            except Exception as e:
+                logger.error(f"Failed to reclaim idle session {session_id}: {e}")
+            self._browser_pids.pop(session_id, None)
+            self.usage.pop(session_id, None)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        sessions = {}
+        for session_id, usage in self.usage.items():
+            lease = display_allocator.get(session_id)
+            sessions[session_id] = {
+                **usage,
+                "idle_seconds": round(now - lease.last_seen, 1) if lease else None,
+            }
+        return {
+            "idle_ttl_seconds": IDLE_SESSION_TTL,
+            "action": IDLE_SESSION_ACTION,
+            "reclaimed": self.reclaimed,
+            "sessions": sessions,
+        }
+
+    def _sample(self, session_ids: List[str]) -> Dict[str, dict]:
+        if any(s not in self._browser_pids for s in session_ids):
+            self._find_browser_pids(session_ids)
+        usage = {}
+        seen = set()
+        for session_id in session_ids:
+            pids = list(process_supervisor.pids(session_id).values())
+            browser_pid = self._browser_pids.get(session_id)
+            if browser_pid:
+                pids.append(browser_pid)
+                try:
+                    pids.extend(child.pid for child in self._process(browser_pid).children(recursive=True))
+                except psutil.Error:
+                    self._browser_pids.pop(session_id, None)
+            cpu = rss = 0.0
+            for pid in pids:
+                try:
+                    proc = self._process(pid)
+                    cpu += proc.cpu_percent(interval=None)
+                    rss += proc.memory_info().rss
+                    seen.add(pid)
+                except psutil.Error:
+                    self._processes.pop(pid, None)
+            usage[session_id] = {
+                "cpu_percent": round(cpu, 1),
+                "rss_mb": round(rss / (1024 * 1024), 1),
+                "processes": len(pids),
+                "vnc_viewers": self._vnc_viewers(session_id),
+            }
+        self._processes = {pid: proc for pid, proc in self._processes.items() if pid in seen}
+        return usage
+
+    def _process(self, pid: int) -> psutil.Process:
+        proc = self._processes.get(pid)
+        if proc is None:
+            proc = self._processes[pid] = psutil.Process(pid)
+        return proc
+
+    def _find_browser_pids(self, session_ids: List[str]):
+        """One process table scan to map each session's profile to its Chromium browser process."""
+        wanted = {SESSION_PROFILES[s]: s for s in session_ids if s in SESSION_PROFILES}
+        for proc in psutil.process_iter(['pid', 'cmdline']):
+            try:
+                cmdline = proc.info.get('cmdline') or []
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+            if any(arg.startswith("--type=") for arg in cmdline):
+                continue
+            for arg in cmdline:
+                if arg.startswith(USER_DATA_DIR_FLAG) and arg[len(USER_DATA_DIR_FLAG):] in wanted:
+                    self._browser_pids[wanted[arg[len(USER_DATA_DIR_FLAG):]]] = proc.info['pid']
+                    break
+
+    def _vnc_viewers(self, session_id: str) -> int:
+        pid: Optional[int] = process_supervisor.pids(session_id).get("websockify")
+        web_port = VNC_PORTS.get(session_id)
+        if not pid or not web_port:
+            return 0
+        try:
+            connections = self._process(pid).net_connections(kind="tcp")
+        except psutil.Error:
+            return 0
+        return sum(1 for c in connections if c.status == psutil.CONN_ESTABLISHED and c.laddr.port == web_port)
+
+    async def _record_usage(self):
+        if not self.usage:
+            return
+        now = datetime.datetime.now()
+        await get_db()["sessions"].bulk_write([
+            UpdateOne({"_id": session_id}, {"$set": {"resource_usage": {**usage, "sampled_at": now}}})
+            for session_id, usage in self.usage.items()
+        ], ordered=False)
+
+
+session_reaper = SessionReaper()
@@ -0,0 +1,220 @@
+import asyncio
+import datetime
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from browser_use.agent.views import AgentState
+
+from app.db.mongo import get_db
+from app.models.db_models import SessionStatus
+from app.services.browser_manager import BROWSERS, CONTEXTS, SESSION_PROFILES, USER_DATA_DIR_BASE, launch_browser_context
+from app.services.session_router import session_router
+from app.utility.blob_log import load_agent_history_from_blob
+from app.utility.display_allocation import VNC_DISPLAYS, VNC_PORTS, display_allocator
+from app.utility.process_supervisor import X11_SOCKET_DIR, process_supervisor
+from app.utility.profile_gc import collect_stale_profiles
+from app.utility.resource_limits import resource_limits
+
+logger = logging.getLogger(__name__)
+
+
+class SessionRegistry:
+    """
+    Persists what a live session is made of: its display, ports, profile directory, display process pids,
+    and whether its agent has history saved in blob storage. It lives in the
+    `session_registry` collection. This lets a restarted API process pick its
+    sessions back up instead of orphaning them.
+    """
+
+    def __init__(self):
+        self.last_restore: dict = {}
+        self.hibernated: Dict[str, str] = {}  # session_id -> profile_dir
+
+    @property
+    def collection(self):
+        return get_db()["session_registry"]
+
+    async def register(self, session_id: str, display_num: int, web_port: int, vnc_port: int, profile_dir: str):
+        await self.collection.update_one(
+            {"_id": session_id},
+            {
+                "$set": {
+                    "worker_id": session_router.self_id,
+                    "display_num": display_num,
+                    "web_port": web_port,
+                    "vnc_port": vnc_port,
+                    "profile_dir": profile_dir,
+                    "pids": process_supervisor.pids(session_id),
+                    "hibernated": False,
+                    "updated_at": datetime.datetime.now(),
+                },
+                "$setOnInsert": {"has_agent": False},
+            },
+            upsert=True,
+        )
+
+    async def mark_agent(self, session_id: str):
+        """Record that the session's agent state has been saved and can be rehydrated."""
+        await self.collection.update_one(
+            {"_id": session_id},
+            {"$set": {"has_agent": True, "updated_at": datetime.datetime.now()}}
+        )
+
+    async def unregister(self, session_id: str):
+        self.hibernated.pop(session_id, None)
+        await self.collection.delete_one({"_id": session_id})
+
+    async def hibernate(self, session_id: str, profile_dir: str):
+        self.hibernated[session_id] = profile_dir
+        await self.collection.update_one(
+            {"_id": session_id},
+            {"$set": {"hibernated": True, "profile_dir": profile_dir, "pids": {}, "updated_at": datetime.datetime.now()}}
+        )
+
+    async def wake(self, session_id: str):
+        """Bring a hibernated session back on a fresh display with its old profile."""
+        entry = await self.collection.find_one({"_id": session_id})
+        if not entry:
+            raise Exception(f"Session {session_id} is not registered on this worker.")
+        await self._relaunch(entry)
+        self.hibernated.pop(session_id, None)
+        await get_db()["sessions"].update_one(
+            {"_id": session_id},
+            {"$set": {"status": SessionStatus.ACTIVE, "updated_at": datetime.datetime.now()}}
+        )
+        logger.info(f"Woke hibernated session {session_id}")
+
+    async def load_agent_state(self, session_id: str) -> Optional[AgentState]:
+        """Latest saved agent state of a session whose agent is not in memory, if any."""
+        entry = await self.collection.find_one({"_id": session_id}, {"has_agent": 1})
+        if not entry or not entry.get("has_agent"):
+            return None
+        snapshots = await asyncio.to_thread(load_agent_history_from_blob, session_id)
+        if not snapshots:
+            return None
+        try:
+            state = AgentState.model_validate(snapshots[-1])
+        except Exception as e:
+            logger.warning(f"Saved agent state of {session_id} is unreadable, starting a fresh agent: {e}")
+            return None
+        state.paused = state.stopped = False
+        return state
+
+    async def restore(self) -> dict:
+        """
+        Reattach the sessions registered by this worker before it restarted. This must run after
+        display_allocator.rebuild_from_processes() and before the browser pool
+        starts warming.
+
+        A session whose display processes survived keeps its display and VNC
+        URL. Otherwise it gets a fresh display. Either way Chromium is relaunched
+        on the session's existing profile, so logins and cookies survive. Agents
+        are rehydrated lazily from blob history on the session's next task.
+        Profile directories that belong to no restored session are then
+        garbage-collected in bulk.
+        """
+        started = time.perf_counter()
+        db = get_db()
+        entries = await self.collection.find({"worker_id": session_router.self_id}).to_list(length=None)
+        active_ids = set(await db["sessions"].distinct(
+            "_id", {"_id": {"$in": [e["_id"] for e in entries]}, "is_active": True}
+        ))
+
+        reattached, relaunched, dropped = [], [], []
+        for entry in entries:
+            session_id = entry["_id"]
+            if session_id not in active_ids:
+                dropped.append(session_id)
+                continue
+            if entry.get("hibernated"):
+                self.hibernated[session_id] = entry["profile_dir"]
+                continue
+            try:
+                if await self._reattach(entry):
+                    reattached.append(session_id)
+                else:
+                    await self._relaunch(entry)
+                    relaunched.append(session_id)
+            except Exception as e:
+                logger.error(f"Could not restore session {session_id}: {e}")
+                await process_supervisor.stop(session_id)
+                display_allocator.release(session_id)
+                dropped.append(session_id)
+                await db["sessions"].update_one(
+                    {"_id": session_id},
+                    {
+                        "$set": {
+                            "status": SessionStatus.DEGRADED,
+                            "last_error": f"Lost on restart: {e}",
+                            "updated_at": datetime.datetime.now()
+                        }
+                    }
+                )
+        if dropped:
+            await self.collection.delete_many({"_id": {"$in": dropped}})
+
+        keep = {os.path.basename(SESSION_PROFILES[s]) for s in set(reattached) | set(relaunched)}
+        keep.update(os.path.basename(p) for p in self.hibernated.values())
+        keep_prefix = None
+        if session_router.enabled:
+            # Other workers on this host share the profile directory.
+            others = await self.collection.distinct("profile_dir", {"worker_id": {"$ne": session_router.self_id}})
+            keep.update(os.path.basename(p) for p in others)
+            keep_prefix = "pool-"
+        gc = await asyncio.to_thread(collect_stale_profiles, USER_DATA_DIR_BASE, keep, keep_prefix)
+        self.last_restore = {
+            "reattached": len(reattached),
+            "relaunched": len(relaunched),
+            "dropped": len(dropped),
+            "hibernated": len(self.hibernated),
+            "stale_profiles": gc.removed,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        return self.last_restore
+
+    async def _reattach(self, entry: dict) -> bool:
+        session_id, display_num = entry["_id"], entry["display_num"]
+        if not os.path.exists(os.path.join(X11_SOCKET_DIR, f"X{display_num}")):
+            return False
+        if not display_allocator.claim(display_num, session_id):
+            return False
+        process_supervisor.adopt(session_id, entry.get("pids") or {})
+        if len(process_supervisor.pids(session_id)) < 3:
+            # Part of the display stack died with the old process; start over.
+            await process_supervisor.stop(session_id)
+            display_allocator.release(session_id)
+            return False
+        await self._attach_browser(session_id, display_num, entry["web_port"], entry["profile_dir"])
+        return True
+
+    async def _relaunch(self, entry: dict):
+        session_id = entry["_id"]
+        await process_supervisor.stop(session_id)
+        lease = display_allocator.acquire(session_id)
+        try:
+            await process_supervisor.start_display(session_id, lease.display_num, lease.vnc_port, lease.web_port)
+        except Exception:
+            display_allocator.release(session_id)
+            raise
+        await self._attach_browser(session_id, lease.display_num, lease.web_port, entry["profile_dir"])
+        vnc_url = f"{os.getenv('BASE_URL','http://host.docker.internal')}:{lease.web_port}/vnc.html?autoconnect=1"
+        await get_db()["sessions"].update_one(
+            {"_id": session_id},
+            {"$set": {"vnc_url": vnc_url, "updated_at": datetime.datetime.now()}}
+        )
+        await self.register(session_id, lease.display_num, lease.web_port, lease.vnc_port, entry["profile_dir"])
+
+    @staticmethod
+    async def _attach_browser(session_id: str, display_num: int, web_port: int, profile_dir: str):
+        context = await launch_browser_context(profile_dir, f":{display_num}")
+        await asyncio.to_thread(resource_limits.apply_to_browser, display_num, profile_dir)
+        CONTEXTS[session_id] = context
+        BROWSERS[session_id] = context.browser
+        SESSION_PROFILES[session_id] = profile_dir
+        VNC_PORTS[session_id] = web_port
+        VNC_DISPLAYS[session_id] = display_num
+
+
+session_registry = SessionRegistry()
@@ -0,0 +1,224 @@
+import asyncio
+import bisect
+import hashlib
+import hmac
+import logging
+from typing import Callable, Dict, List, Optional, Set
+
+import httpx
+from fastapi import Request, Response
+
+from app.core.config import (
+    SHARD_SELF, SHARD_WORKERS, SHARD_VNODES, SHARD_HEALTH_INTERVAL, SHARD_FAILURE_THRESHOLD, SHARD_SECRET,
+)
+from app.db.mongo import get_db
+
+logger = logging.getLogger(__name__)
+
+FORWARDED_HEADER = "x-shard-forwarded"
+SECRET_HEADER = "x-shard-secret"
+HOP_BY_HOP_HEADERS = {"host", "content-length", "connection", "keep-alive", "transfer-encoding"}
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring with `vnodes` virtual nodes per worker."""
+
+    def __init__(self, vnodes: int):
+        self.vnodes = vnodes
+        self._keys: List[int] = []
+        self._nodes: Dict[int, str] = {}
+
+    def add(self, worker_id: str):
+        for i in range(self.vnodes):
+            point = _hash(f"{worker_id}#{i}")
+            if point not in self._nodes:
+                bisect.insort(self._keys, point)
+                self._nodes[point] = worker_id
+
+    def remove(self, worker_id: str):
+        for i in range(self.vnodes):
+            point = _hash(f"{worker_id}#{i}")
+            if self._nodes.get(point) == worker_id:
+                del self._nodes[point]
+                self._keys.pop(bisect.bisect_left(self._keys, point))
+
+    def get(self, key: str) -> Optional[str]:
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[self._keys[index]]
+
+
+class SessionRouter:
+    """
+    Routes each browser session to one worker process or host.
+
+    New sessions are placed on the ring by consistent hashing and the owner is
+    recorded on the session document, so a session stays on its worker for its
+    whole life. When a worker fails SHARD_FAILURE_THRESHOLD health checks in a
+    row it leaves the ring, and its sessions move to the ring's next owner,
+    which adopts them (see `on_rebalance`).
+
+    With no SHARD_WORKERS configured every session is local and nothing is forwarded.
+    A request counts as forwarded only if it names a known peer and carries
+    SHARD_SECRET, so clients cannot pose as a peer; peers cannot be
+    registered without a secret.
+    """
+
+    def __init__(self, self_id: str, vnodes: int, secret: str = ""):
+        self.self_id = self_id
+        self.secret = secret
+        self.ring = HashRing(vnodes)
+        self.ring.add(self_id)
+        self._endpoints: Dict[str, str] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._live: Set[str] = {self_id}
+        self._failures: Dict[str, int] = {}
+        self._assignments: Dict[str, str] = {}
+        self._health_task: Optional[asyncio.Task] = None
+        self.on_rebalance: Optional[Callable[[Set[str]], "asyncio.Future"]] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._endpoints)
+
+    def register_worker(self, worker_id: str, base_url: str, transport: Optional[httpx.AsyncBaseTransport] = None):
+        """
+        Add a peer worker. `transport` lets tests route a worker to an in-process
+        app (e.g. httpx.ASGITransport) instead of the network.
+        """
+        if worker_id == self.self_id:
+            return
+        if not self.secret:
+            raise RuntimeError("Sharding needs SHARD_SECRET: without it any client could pose as a peer worker")
+        self._endpoints[worker_id] = base_url.rstrip("/")
+        self._clients[worker_id] = httpx.AsyncClient(base_url=self._endpoints[worker_id], transport=transport, timeout=None)
+        self._live.add(worker_id)
+        self.ring.add(worker_id)
+
+    async def start(self):
+        if self.enabled:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def shutdown(self):
+        if self._health_task:
+            self._health_task.cancel()
+        for client in self._clients.values():
+            await client.aclose()
+
+    def place(self, session_id: str) -> str:
+        """Pick the owner for a new session."""
+        owner = self.ring.get(session_id) or self.self_id
+        self._assignments[session_id] = owner
+        return owner
+
+    async def owner(self, session_id: str) -> str:
+        if not self.enabled:
+            return self.self_id
+        owner = self._assignments.get(session_id)
+        if owner is None:
+            session = await get_db()["sessions"].find_one({"_id": session_id}, {"worker_id": 1})
+            owner = (session or {}).get("worker_id")
+        if owner not in self._live:
+            owner = self.ring.get(session_id) or self.self_id
+        self._assignments[session_id] = owner
+        return owner
+
+    def assign(self, session_id: str, worker_id: str):
+        self._assignments[session_id] = worker_id
+
+    def is_forwarded(self, request: Request) -> bool:
+        """Whether a peer worker forwarded this request."""
+        if not self.secret or request.headers.get(FORWARDED_HEADER) not in self._endpoints:
+            return False
+        return hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret)
+
+    async def forward_if_remote(self, request: Request, session_id: str) -> Optional[Response]:
+        """
+        Proxy the request to the worker owning `session_id`. Returns None when the
+        session is local (or the request was already forwarded once).
+        """
+        if not self.enabled or self.is_forwarded(request):
+            return None
+        owner = await self.owner(session_id)
+        if owner == self.self_id:
+            return None
+        return await self.forward(request, owner)
+
+    async def forward(self, request: Request, worker_id: str, params: Optional[dict] = None) -> Response:
+        path = request.url.path
+        root_path = request.scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        headers[FORWARDED_HEADER] = self.self_id
+        headers[SECRET_HEADER] = self.secret
+        try:
+            upstream = await self._clients[worker_id].request(
+                request.method,
+                path,
+                params={**request.query_params, **(params or {})},
+                content=await request.body(),
+                headers=headers,
+            )
+        except httpx.HTTPError as e:
+            logger.error(f"Forwarding {request.method} {path} to {worker_id} failed: {e}")
+            return Response(status_code=502, content=f"Worker {worker_id} unavailable")
+        response_headers = {k: v for k, v in upstream.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        return Response(content=upstream.content, status_code=upstream.status_code, headers=response_headers)
+
+    def stats(self) -> dict:
+        return {
+            "self": self.self_id,
+            "workers": {worker_id: worker_id in self._live for worker_id in [self.self_id, *self._endpoints]},
+            "tracked_sessions": len(self._assignments),
+        }
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(SHARD_HEALTH_INTERVAL)
+            lost, recovered = set(), set()
+            for worker_id, client in self._clients.items():
+                try:
+                    healthy = (await client.get("/health", timeout=SHARD_HEALTH_INTERVAL)).status_code == 200
+                except httpx.HTTPError:
+                    healthy = False
+                if healthy:
+                    self._failures[worker_id] = 0
+                    if worker_id not in self._live:
+                        recovered.add(worker_id)
+                else:
+                    self._failures[worker_id] = self._failures.get(worker_id, 0) + 1
+                    if worker_id in self._live and self._failures[worker_id] >= SHARD_FAILURE_THRESHOLD:
+                        lost.add(worker_id)
+            for worker_id in recovered:
+                logger.info(f"Worker {worker_id} is back, adding it to the ring")
+                self._live.add(worker_id)
+                self.ring.add(worker_id)
+            for worker_id in lost:
+                logger.warning(f"Worker {worker_id} lost, rebalancing its sessions")
+                self._live.discard(worker_id)
+                self.ring.remove(worker_id)
+                self._assignments = {s: w for s, w in self._assignments.items() if w != worker_id}
+            if lost and self.on_rebalance:
+                try:
+                    await self.on_rebalance(lost)
+                except Exception as e:
+                    logger.error(f"Rebalance after losing {lost} failed: {e}")
+
+
+def _parse_workers(spec: str) -> Dict[str, str]:
+    workers = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        worker_id, _, url = entry.partition("=")
+        workers[worker_id.strip()] = url.strip()
+    return workers
+
+
+session_router = SessionRouter(SHARD_SELF, SHARD_VNODES, SHARD_SECRET)
+for _worker_id, _url in _parse_workers(SHARD_WORKERS).items():
+    session_router.register_worker(_worker_id, _url)
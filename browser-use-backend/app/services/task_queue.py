@@ -0,0 +1,230 @@
+import asyncio
+import datetime
+import logging
+import os
+import socket
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+from pymongo import ReturnDocument
+
+from app.core.config import TASK_WORKERS, TASK_LEASE_SECONDS, TASK_POLL_INTERVAL, TASK_MAX_ATTEMPTS
+from app.db.mongo import get_db
+from app.models.db_models import TaskDocument, TaskStatus
+from app.services.session_registry import session_registry
+from app.services.session_router import session_router
+from app.services.task_runner import execute_task
+from app.utility.display_allocation import VNC_DISPLAYS
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+TERMINAL_STATUSES = {TaskStatus.COMPLETED.value, TaskStatus.ERROR.value}
+
+
+class TaskEvents:
+    """In-process fan-out of task status changes to SSE subscribers."""
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[asyncio.Queue]] = defaultdict(list)
+
+    def subscribe(self, task_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers[task_id].append(queue)
+        return queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(task_id, [])
+        if queue in subscribers:
+            subscribers.remove(queue)
+        if not subscribers:
+            self._subscribers.pop(task_id, None)
+
+    def publish(self, task_id: str, event: dict):
+        for queue in self._subscribers.get(task_id, []):
+            queue.put_nowait(event)
+
+
+class TaskQueue:
+    """
+    Durable task queue on the `tasks` collection.
+
+    /execute inserts a task in `queued` state and returns. Up to TASK_WORKERS
+    workers claim tasks oldest-first, running at most one task per session at a
+    time so tasks within a session keep their order. A claimed task carries a
+    lease that its worker renews while it runs; tasks whose lease expired
+    (their worker died) are put back in the queue and run again.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.events = TaskEvents()
+        self._wakeup = asyncio.Event()
+        self._running: Dict[str, str] = {}  # task_id -> session_id
+        self._busy_sessions: Set[str] = set()
+        self._claim_lock = asyncio.Lock()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        await self.recover()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._renew_leases()))
+
+    async def shutdown(self):
+        running = list(self._running)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        # Give running tasks back to the queue so the next process resumes them.
+        if running:
+            await get_db()["tasks"].update_many(
+                {"_id": {"$in": running}, "worker_id": WORKER_ID},
+                {"$set": {"status": TaskStatus.QUEUED, "worker_id": None, "lease_expires_at": None}}
+            )
+
+    async def enqueue(self, session_id: str, task: str, request_id: Optional[str] = None) -> str:
+        task_id = str(uuid.uuid4())
+        now = datetime.datetime.now()
+        task_doc = TaskDocument(
+            _id=task_id,
+            name=task,
+            status=TaskStatus.QUEUED,
+            prompt=task,
+            session_id=session_id,
+            request_id=request_id,
+            created_at=now,
+            updated_at=now,
+        )
+        await get_db()["tasks"].insert_one({**task_doc.model_dump(by_alias=True), "attempts": 0})
+        self._wakeup.set()
+        return task_id
+
+    async def recover(self) -> int:
+        """Requeue in-progress tasks whose worker stopped renewing the lease."""
+        result = await get_db()["tasks"].update_many(
+            {
+                "status": TaskStatus.IN_PROGRESS,
+                "$or": [
+                    {"lease_expires_at": {"$lt": datetime.datetime.now()}},
+                    {"lease_expires_at": None},  # also matches a missing field
+                ],
+            },
+            {"$set": {"status": TaskStatus.QUEUED, "worker_id": None, "lease_expires_at": None}}
+        )
+        if result.modified_count:
+            logger.warning(f"Requeued {result.modified_count} interrupted task(s)")
+            self._wakeup.set()
+        return result.modified_count
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "running": len(self._running), "worker_id": WORKER_ID}
+
+    def is_busy(self, session_id: str) -> bool:
+        return session_id in self._busy_sessions
+
+    async def _claim(self) -> Optional[dict]:
+        async with self._claim_lock:
+            claimed = await self._claim_next()
+            if claimed:
+                self._running[claimed["_id"]] = claimed["session_id"]
+                self._busy_sessions.add(claimed["session_id"])
+            return claimed
+
+    async def _claim_next(self) -> Optional[dict]:
+        db = get_db()
+        busy = set(self._busy_sessions)
+        busy.update(await db["tasks"].distinct("session_id", {"status": TaskStatus.IN_PROGRESS}))
+        session_filter = {"$nin": list(busy)}
+        if session_router.enabled:
+            # Only this worker has the browsers of its own sessions.
+            local_sessions = [*VNC_DISPLAYS, *session_registry.hibernated]
+            session_filter["$in"] = [s for s in local_sessions if s not in busy]
+        cursor = db["tasks"].find(
+            {"status": TaskStatus.QUEUED, "session_id": session_filter},
+            {"_id": 1, "session_id": 1},
+        ).sort("created_at", 1)
+        seen: Set[str] = set()
+        async for candidate in cursor:
+            if candidate["session_id"] in seen:
+                continue
+            seen.add(candidate["session_id"])
+            # Only the oldest queued task of a session may run.
+            claimed = await db["tasks"].find_one_and_update(
+                {"_id": candidate["_id"], "status": TaskStatus.QUEUED},
+                {
+                    "$set": {
+                        "status": TaskStatus.IN_PROGRESS,
+                        "worker_id": WORKER_ID,
+                        "lease_expires_at": datetime.datetime.now() + datetime.timedelta(seconds=TASK_LEASE_SECONDS),
+                        "updated_at": datetime.datetime.now(),
+                    },
+                    "$inc": {"attempts": 1},
+                },
+                return_document=ReturnDocument.AFTER,
+            )
+            if claimed:
+                return claimed
+        return None
+
+    async def _worker(self, index: int):
+        while True:
+            try:
+                task_doc = await self._claim()
+            except Exception as e:
+                logger.error(f"Task worker {index} failed to claim: {e}")
+                task_doc = None
+            if task_doc is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=TASK_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(task_doc)
+
+    async def _run(self, task_doc: dict):
+        task_id, session_id = task_doc["_id"], task_doc["session_id"]
+        self.events.publish(task_id, {"status": TaskStatus.IN_PROGRESS.value})
+        cancelled = False
+        try:
+            if task_doc.get("attempts", 1) > TASK_MAX_ATTEMPTS:
+                raise Exception(f"Task abandoned after {TASK_MAX_ATTEMPTS} interrupted attempts.")
+            output = await execute_task(task_doc, lambda event: self.events.publish(task_id, event))
+            self.events.publish(task_id, {"status": TaskStatus.COMPLETED.value, "output": output})
+        except Exception as e:
+            await get_db()["tasks"].update_one(
+                {"_id": task_id, "status": {"$ne": TaskStatus.ERROR}},
+                {"$set": {"status": TaskStatus.ERROR, "error": str(e), "updated_at": datetime.datetime.now()}}
+            )
+            self.events.publish(task_id, {"status": TaskStatus.ERROR.value, "error": str(e)})
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            # A cancelled task keeps its lease: shutdown() requeues it, or recover() once the lease expires.
+            if not cancelled:
+                await get_db()["tasks"].update_one(
+                    {"_id": task_id}, {"$set": {"worker_id": None, "lease_expires_at": None}}
+                )
+            self._running.pop(task_id, None)
+            self._busy_sessions.discard(session_id)
+            self._wakeup.set()
+
+    async def _renew_leases(self):
+        while True:
+            await asyncio.sleep(TASK_LEASE_SECONDS / 3)
+            try:
+                # Also picks up tasks of workers in other processes that died.
+                await self.recover()
+                if not self._running:
+                    continue
+                await get_db()["tasks"].update_many(
+                    {"_id": {"$in": list(self._running)}, "worker_id": WORKER_ID},
+                    {"$set": {"lease_expires_at": datetime.datetime.now() + datetime.timedelta(seconds=TASK_LEASE_SECONDS)}}
+                )
+            except Exception as e:
+                logger.error(f"Failed to renew task leases: {e}")
+
+
+task_queue = TaskQueue(TASK_WORKERS)
@@ -0,0 +1,223 @@
+import asyncio
+import datetime
+import logging
+from datetime import timezone
+from typing import Callable, Optional
+
+from browser_use.agent.views import AgentHistory, AgentState
+from fastapi.encoders import jsonable_encoder
+
+from app.db.mongo import get_db
+from app.models.db_models import SessionStatus, TaskStatus, ScreenshotDocument
+from app.services.browser_manager import run_task, AGENTS
+from app.services.document_manifest import document_manifests
+from app.services.screenshot_writer import screenshot_writer
+from app.services.session_registry import session_registry
+from app.utility.blob_log import save_agent_history_to_blob
+from app.utility.storage_codec import encode_screenshot
+from app.utility.display_allocation import VNC_DISPLAYS, display_allocator
+
+
+async def store_step_screenshot(session_id: str, step_number: int, history_item, screenshot_b64: str):
+    """Queue the screenshot of one finished agent step for writing."""
+    state = history_item.state
+    screenshot, screenshot_format = await asyncio.to_thread(encode_screenshot, screenshot_b64)
+    doc = ScreenshotDocument(
+        session_id=session_id,
+        step_number=step_number,
+        url=state.url,
+        title=state.title,
+        screenshot=screenshot,
+        screenshot_format=screenshot_format,
+        created_at=datetime.datetime.now(timezone.utc),
+        agent_id=session_id,
+        tabs=getattr(state, "tabs", []),
+        interacted_element=getattr(state, "interacted_element", None)
+    ).model_dump(by_alias=True)
+    await screenshot_writer.add(doc)
+
+
+def build_step_event(task_id: str, session_id: str, step_number: int, history_item, has_screenshot: bool) -> dict:
+    """What the dashboard sees of one agent step."""
+    model_output = history_item.model_output
+    results = history_item.result or []
+    return jsonable_encoder({
+        "type": "step",
+        "task_id": task_id,
+        "session_id": session_id,
+        "step_number": step_number,
+        "url": history_item.state.url,
+        "title": history_item.state.title,
+        "next_goal": getattr(model_output, "next_goal", None),
+        "actions": [action.model_dump(exclude_none=True) for action in model_output.action] if model_output else [],
+        "extracted_content": [r.extracted_content for r in results if r.extracted_content],
+        "errors": [r.error for r in results if r.error],
+        "is_done": any(r.is_done for r in results),
+        "screenshot_url": f"/screenshots/{session_id}/{step_number}/image" if has_screenshot else None,
+    })
+
+
+def make_step_hook(task_id: str, session_id: str, on_step: Optional[Callable[[dict], None]], db):
+    """
+    on_step_end hook for agent.run(): stores the step's screenshot as soon as
+    the step finishes and reports the step to `on_step` and the task document.
+    """
+    last_step = [None]
+
+    async def on_step_end(agent):
+        if not agent.history.history:
+            return
+        history_item = agent.history.history[-1]
+        metadata = history_item.metadata
+        step_number = metadata.step_number if metadata else len(agent.history.history)
+        if step_number == last_step[0]:
+            return  # the step failed before producing a history item
+        last_step[0] = step_number
+        try:
+            screenshot_b64 = await asyncio.to_thread(history_item.state.get_screenshot)
+            if screenshot_b64:
+                await store_step_screenshot(session_id, step_number, history_item, screenshot_b64)
+            event = build_step_event(task_id, session_id, step_number, history_item, bool(screenshot_b64))
+            await db["tasks"].update_one(
+                {"_id": task_id},
+                {"$set": {"last_step": event, "updated_at": datetime.datetime.now()}, "$inc": {"steps": 1}}
+            )
+            if on_step:
+                on_step(event)
+        except Exception as step_error:
+            logging.warning(f"⚠️ Failed to record step {step_number} of task {task_id}: {step_error}")
+
+    return on_step_end
+
+
+async def execute_task(task_doc: dict, on_step: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Run one queued task to completion on its session's browser and record the
+    outcome on the task and session documents. Each finished step is passed to
+    `on_step` as it happens. Returns the task output.
+    """
+    db = get_db()
+    session_id = task_doc["session_id"]
+    task_id = task_doc["_id"]
+    task = task_doc["prompt"]
+    request_id = task_doc.get("request_id")
+
+    try:
+        if session_id not in VNC_DISPLAYS and session_id in session_registry.hibernated:
+            await session_registry.wake(session_id)
+        if session_id not in VNC_DISPLAYS:
+            raise Exception(f"Session {session_id} has no display on this worker.")
+        display = f":{VNC_DISPLAYS[session_id]}"
+        display_allocator.touch(session_id)
+
+        await db["sessions"].update_one(
+            {"_id": session_id},
+            {
+                "$set": {
+                    "status": SessionStatus.ACTIVE,
+                    "updated_at": datetime.datetime.now(),
+                    "is_active": True
+                }
+            }
+        )
+
+        on_step_end = make_step_hook(task_id, session_id, on_step, db)
+        # Check if an agent already exists for this session
+        async with AGENTS.in_use(session_id):
+            if session_id in AGENTS:
+                agent = AGENTS[session_id]
+                if request_id:
+                    documents = await document_manifests.load(request_id)
+                    agent.available_file_paths = documents.paths if documents else []
+                agent.add_new_task(task)
+                result = await agent.run(on_step_end=on_step_end)
+                await asyncio.to_thread(save_agent_history_to_blob, agent, session_id)
+            else:
+                # An agent evicted from the cache is rehydrated from the state it saved.
+                await AGENTS.wait_evicted(session_id)
+                agent_state = await session_registry.load_agent_state(session_id)
+                if agent_state is None:
+                    # Continue the session's step numbering so screenshots keep unique step numbers.
+                    last = await db.screenshots.find_one(
+                        {"session_id": session_id}, {"step_number": 1}, sort=[("step_number", -1)]
+                    )
+                    if last:
+                        agent_state = AgentState(n_steps=last["step_number"] + 1)
+                result_data = await run_task(task, session_id, display, agent_state, on_step_end, request_id)
+                result = result_data["result"]
+                agent = AGENTS.get(session_id)
+        await session_registry.mark_agent(session_id)
+
+        # Mark session completed
+        await db["sessions"].update_one(
+            {"_id": session_id},
+            {
+                "$set": {
+                    "status": SessionStatus.ACTIVE,
+                    "updated_at": datetime.datetime.now(),
+                    "is_active": True,
+                    "agent_id": agent.state.agent_id if hasattr(agent, 'state') else None
+                }
+            }
+        )
+
+        last_item: AgentHistory = result.history[-1] if result.history else None
+
+        if last_item and last_item.result:
+            status_flag: bool = last_item.result[0].is_done
+            success_flag: bool = last_item.result[0].success
+            model_output = last_item.model_output
+            result_send = last_item.result
+            metadata = last_item.metadata
+        else:
+            status_flag = success_flag = False
+            model_output = None
+            result_send = []
+            metadata = {}
+
+        output = jsonable_encoder({
+            "status": "completed" if status_flag and success_flag else "in_progress",
+            "model_output": model_output,
+            "session_id": session_id,
+            "metadata": metadata,
+            "result": result_send
+        })
+        await db["tasks"].update_one(
+            {"_id": task_id},
+            {
+                "$set": {
+                    "status": TaskStatus.COMPLETED,
+                    "updated_at": datetime.datetime.now(),
+                    "result": result_send[0].extracted_content if result_send else None,
+                    "output": output,
+                }
+            }
+        )
+        return output
+
+    except Exception as task_error:
+        logging.error(f"❌ Task {task_id} failed for session {session_id}: {task_error}")
+        await db["sessions"].update_one(
+            {"_id": session_id},
+            {
+                "$set": {
+                    "status": SessionStatus.ACTIVE,
+                    "error": str(task_error),
+                    "is_active": True,
+                    "updated_at": datetime.datetime.now()
+                }
+            }
+        )
+        await db["tasks"].update_one(
+            {"_id": task_id},
+            {
+                "$set": {
+                    "status": TaskStatus.ERROR,
+                    "updated_at": datetime.datetime.now(),
+                    "error": str(task_error)
+                }
+            }
+        )
+        raise
+    finally:
+        await screenshot_writer.flush(session_id)
@@ -1,8 +1,9 @@
 import os
-import json
-from azure.storage.blob import BlobServiceClient
+from azure.storage.blob import BlobServiceClient, ContentSettings
 from browser_use.agent.service import Agent
 
+from app.utility.storage_codec import decode_history, encode_history
+
 AZURE_STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 
 def get_blob_client(container_name: str, blob_name: str):
@@ -18,7 +19,7 @@ def save_agent_history_to_blob(agent: Agent, session_id: str):
 
     try:
         existing_blob = blob_client.download_blob()
-        existing_data = json.loads(existing_blob.readall())
+        existing_data = decode_history(existing_blob.readall())
     except Exception:
         existing_data = []  # Start fresh if blob doesn't exist
 
@@ -28,10 +29,11 @@ def save_agent_history_to_blob(agent: Agent, session_id: str):
     # Append the new snapshot
     existing_data.append(new_data)
 
+    data, content_encoding = encode_history(existing_data)
     blob_client.upload_blob(
-        json.dumps(existing_data, indent=2),
+        data,
         overwrite=True,
-        content_type="application/json"
+        content_settings=ContentSettings(content_type="application/json", content_encoding=content_encoding or None)
     )
 
     print(f"✅ Agent state saved to blob: {blob_name}")
@@ -45,7 +47,7 @@ def load_agent_history_from_blob(session_id: str) -> list[dict]:
     try:
         existing_blob = blob_client.download_blob()
         content = existing_blob.readall()
-        return json.loads(content)
+        return decode_history(content)
     except Exception:
         print(f"⚠️ No previous history found for session {session_id}")
         return []
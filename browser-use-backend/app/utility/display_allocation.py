@@ -1,42 +1,240 @@
-import subprocess
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
 
 import psutil
 
+from app.core.config import (
+    DISPLAY_BASE, DISPLAY_SLOT_START, DISPLAY_SLOT_COUNT, WEB_PORT_BASE, VNC_PORT_BASE,
+    DISPLAY_LEASE_TTL, DISPLAY_ORPHAN_GRACE, DISPLAY_REAPER_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
 
 VNC_PORTS={}
 VNC_DISPLAYS={}
-USED_PORTS=set()
-USED_DISPLAY=set()
-def get_next_display_port():
-    base_display = 100  # Xvfb :100, :101, etc.
-    base_port = 6080
-    for i in range(1, 100):
-        display_num = base_display + i
-        port = base_port + i
-        if display_num not in USED_DISPLAY and port not in USED_PORTS:
-            USED_DISPLAY.add(display_num)
-            USED_PORTS.add(port)
-
-            return display_num, port
-    raise Exception("No available VNC displays/ports")
-def start_novnc_proxy(vnc_port: int, web_port: int):
-    subprocess.Popen([
-        "websockify", str(web_port), f"host.docker.internal:{vnc_port}",
-        "--web", "/usr/share/novnc",
-        "--cert=/dev/null"  # remove if you have SSL certs
-    ])
-def start_vnc_session(display_num: int, port: int):
-    display = f":{display_num}"
-    screen = "1280x720x24"
-    subprocess.Popen(["Xvfb", display, "-screen", "0", screen])
-    subprocess.Popen(["x11vnc", "-display", display, "-nopw", "-forever", "-rfbport", str(port)])
-    return display
+
+
+@dataclass
+class DisplayLease:
+    slot: int
+    owner: Optional[str]
+    leased_at: float = field(default_factory=time.monotonic)
+    last_seen: float = field(default_factory=time.monotonic)
+
+    @property
+    def display_num(self) -> int:
+        return DISPLAY_BASE + self.slot
+
+    @property
+    def web_port(self) -> int:
+        return WEB_PORT_BASE + self.slot
+
+    @property
+    def vnc_port(self) -> int:
+        return VNC_PORT_BASE + self.slot
+
+
+class DisplayAllocator:
+    """
+    Free-list allocator for Xvfb displays and their VNC/noVNC ports.
+
+    Slot `i` maps to display `DISPLAY_BASE + i`, VNC port `VNC_PORT_BASE + i` and
+    web port `WEB_PORT_BASE + i`. Acquire and release are O(1) and safe to call
+    from any thread. Released slots go to the back of the free list so that a
+    display is not handed out again while its old processes are still exiting.
+    """
+
+    def __init__(self, first_slot: int, slot_count: int):
+        self._lock = threading.Lock()
+        self._slots = range(first_slot, first_slot + slot_count)
+        self._free: deque[int] = deque(self._slots)
+        self._leases: Dict[int, DisplayLease] = {}
+        self._by_owner: Dict[str, int] = {}
+
+    def acquire(self, owner: str) -> DisplayLease:
+        with self._lock:
+            if owner in self._by_owner:
+                return self._leases[self._by_owner[owner]]
+            if not self._free:
+                raise Exception("No available VNC displays/ports")
+            lease = DisplayLease(slot=self._free.popleft(), owner=owner)
+            self._leases[lease.slot] = lease
+            self._by_owner[owner] = lease.slot
+            return lease
+
+    def release(self, owner: str) -> Optional[DisplayLease]:
+        with self._lock:
+            slot = self._by_owner.get(owner)
+            return self._release_slot(slot) if slot is not None else None
+
+    def release_slot(self, slot: int) -> Optional[DisplayLease]:
+        with self._lock:
+            return self._release_slot(slot)
+
+    def release_lease(self, lease: DisplayLease) -> bool:
+        """Free the slot of `lease`, unless it was released (and maybe handed out again) meanwhile."""
+        with self._lock:
+            if self._leases.get(lease.slot) is not lease:
+                return False
+            self._release_slot(lease.slot)
+            return True
+
+    def _release_slot(self, slot: int) -> Optional[DisplayLease]:
+        lease = self._leases.pop(slot, None)
+        if lease is None:
+            return None
+        if lease.owner is not None:
+            self._by_owner.pop(lease.owner, None)
+        self._free.append(slot)
+        return lease
+
+    def reassign(self, old_owner: str, new_owner: str) -> DisplayLease:
+        """Move a lease to a new owner, e.g. from a warm pool slot to a session."""
+        with self._lock:
+            slot = self._by_owner.pop(old_owner)
+            lease = self._leases[slot]
+            lease.owner = new_owner
+            lease.last_seen = time.monotonic()
+            self._by_owner[new_owner] = slot
+            return lease
+
+    def claim(self, display_num: int, owner: str) -> Optional[DisplayLease]:
+        """Attach an owner to a slot found live at startup (see rebuild_from_processes)."""
+        slot = display_num - DISPLAY_BASE
+        with self._lock:
+            lease = self._leases.get(slot)
+            if lease is None or (lease.owner is not None and lease.owner != owner):
+                return None
+            lease.owner = owner
+            lease.last_seen = time.monotonic()
+            self._by_owner[owner] = slot
+            return lease
+
+    def touch(self, owner: str):
+        with self._lock:
+            slot = self._by_owner.get(owner)
+            if slot is not None:
+                self._leases[slot].last_seen = time.monotonic()
+
+    def get(self, owner: str) -> Optional[DisplayLease]:
+        with self._lock:
+            slot = self._by_owner.get(owner)
+            return self._leases.get(slot) if slot is not None else None
+
+    def leases(self) -> List[DisplayLease]:
+        with self._lock:
+            return list(self._leases.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "capacity": len(self._slots),
+                "free": len(self._free),
+                "leased": len(self._leases),
+                "orphaned": sum(1 for lease in self._leases.values() if lease.owner is None),
+            }
+
+    def rebuild_from_processes(self) -> int:
+        """
+        Mark slots whose Xvfb, x11vnc or websockify processes are still running as
+        taken. Such slots have no owner until a session claims them; the reaper
+        frees them after DISPLAY_ORPHAN_GRACE. Returns the number of slots taken.
+        """
+        live_slots = set()
+        for proc in psutil.process_iter(['cmdline']):
+            try:
+                slot = _slot_for_cmdline(proc.info.get('cmdline') or [])
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+            if slot is not None and slot in self._slots:
+                live_slots.add(slot)
+
+        with self._lock:
+            self._leases = {slot: DisplayLease(slot=slot, owner=None) for slot in live_slots}
+            self._by_owner = {}
+            self._free = deque(slot for slot in self._slots if slot not in live_slots)
+        return len(live_slots)
+
+
+def _slot_for_cmdline(cmdline: List[str]) -> Optional[int]:
+    if not cmdline:
+        return None
+    program = os.path.basename(cmdline[0])
+    args = cmdline[1:]
+    if program == "Xvfb":
+        return _display_slot(args[0] if args else "")
+    if program == "x11vnc" and "-display" in args[:-1]:
+        return _display_slot(args[args.index("-display") + 1])
+    if any(os.path.basename(part) == "websockify" for part in cmdline[:2]):
+        port = next((arg for arg in args if arg.isdigit()), None)
+        return int(port) - WEB_PORT_BASE if port else None
+    return None
+
+
+def _display_slot(display: str) -> Optional[int]:
+    if display[:1] == ":" and display[1:].isdigit():
+        return int(display[1:]) - DISPLAY_BASE
+    return None
+
+
+display_allocator = DisplayAllocator(DISPLAY_SLOT_START, DISPLAY_SLOT_COUNT)
+
+
+def allocate_display(owner: str) -> DisplayLease:
+    return display_allocator.acquire(owner)
+
+
+def release_display(owner: str) -> Optional[DisplayLease]:
+    return display_allocator.release(owner)
+
+
+async def reap_display_leases(is_owner_alive: Callable[[str], bool],
+                              on_reclaim: Optional[Callable[[DisplayLease], "asyncio.Future"]] = None):
+    """
+    Periodically reclaim displays whose owner is gone, whose lease has not been
+    touched for DISPLAY_LEASE_TTL, or that were found orphaned at startup and
+    never claimed within DISPLAY_ORPHAN_GRACE. A display whose reclaim fails
+    keeps its lease, so it is not handed out while its old Xvfb/VNC processes
+    may still run, and is retried on the next pass.
+    """
+    while True:
+        await asyncio.sleep(DISPLAY_REAPER_INTERVAL)
+        now = time.monotonic()
+        for lease in display_allocator.leases():
+            if lease.owner is None:
+                expired = now - lease.leased_at > DISPLAY_ORPHAN_GRACE
+            else:
+                expired = now - lease.last_seen > DISPLAY_LEASE_TTL or not is_owner_alive(lease.owner)
+            if not expired:
+                continue
+            logger.warning(f"Reclaiming display :{lease.display_num} (owner={lease.owner})")
+            try:
+                if on_reclaim and lease.owner is not None:
+                    await on_reclaim(lease)
+                else:
+                    cleanup_session_processes(lease.display_num)
+            except Exception as e:
+                logger.error(f"Failed to reclaim display :{lease.display_num}, retrying next pass: {e}")
+                continue
+            display_allocator.release_lease(lease)
+
 
 def cleanup_session_processes(display_num: int):
+    """
+    Kill processes for a display that the process supervisor does not own,
+    i.e. ones left behind by a previous API process. O(all processes), so it is
+    only used for orphaned displays.
+    """
     for proc in psutil.process_iter(['pid', 'cmdline']):
         try:
             cmdline = proc.info.get('cmdline')
-            if cmdline and any(f":{display_num}" in arg for arg in cmdline):
+            if cmdline and _slot_for_cmdline(cmdline) == display_num - DISPLAY_BASE:
                 proc.kill()
         except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
             pass
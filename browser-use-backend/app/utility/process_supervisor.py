@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import PROCESS_READY_TIMEOUT, PROCESS_STOP_TIMEOUT, PROCESS_MONITOR_INTERVAL
+from app.utility.resource_limits import resource_limits
+
+logger = logging.getLogger(__name__)
+
+X11_SOCKET_DIR = "/tmp/.X11-unix"
+SCREEN = "1280x720x24"
+
+
+@dataclass
+class SessionProcesses:
+    """Child processes owned by one session (or one warm pool slot)."""
+    owner: str
+    procs: Dict[str, subprocess.Popen] = field(default_factory=dict)
+    adopted_pids: Dict[str, int] = field(default_factory=dict)
+    display_num: Optional[int] = None
+    degraded: bool = False
+    stopping: bool = False
+
+    def pids(self) -> List[int]:
+        return [p.pid for p in self.procs.values()] + list(self.adopted_pids.values())
+
+
+class ProcessSupervisor:
+    """
+    Owns the Xvfb, x11vnc and websockify processes of each session. Every child
+    runs in its own process group so teardown can signal exactly the processes
+    we started, without scanning the process table.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, SessionProcesses] = {}
+
+    def _spawn(self, owner: str, name: str, args: List[str]) -> subprocess.Popen:
+        proc = subprocess.Popen(args, start_new_session=True)
+        self._sessions.setdefault(owner, SessionProcesses(owner)).procs[name] = proc
+        return proc
+
+    async def start_display(self, owner: str, display_num: int, vnc_port: int, web_port: int) -> str:
+        """
+        Start Xvfb, x11vnc and websockify for `owner`, waiting for each to be
+        ready before starting the next so the browser never races the display.
+        """
+        display = f":{display_num}"
+        try:
+            self._spawn(owner, "xvfb", ["Xvfb", display, "-screen", "0", SCREEN])
+            await self._wait_until(owner, "xvfb", lambda: os.path.exists(os.path.join(X11_SOCKET_DIR, f"X{display_num}")))
+            self._spawn(owner, "x11vnc", ["x11vnc", "-display", display, "-nopw", "-forever", "-rfbport", str(vnc_port)])
+            await self._wait_for_port(owner, "x11vnc", vnc_port)
+            self._spawn(owner, "websockify", [
+                "websockify", str(web_port), f"host.docker.internal:{vnc_port}",
+                "--web", "/usr/share/novnc",
+                "--cert=/dev/null"  # remove if you have SSL certs
+            ])
+            await self._wait_for_port(owner, "websockify", web_port)
+        except Exception:
+            await self.stop(owner)
+            raise
+        entry = self._sessions[owner]
+        entry.display_num = display_num
+        resource_limits.apply(display_num, entry.pids())
+        return display
+
+    async def _wait_until(self, owner: str, name: str, probe: Callable[[], bool]):
+        proc = self._sessions[owner].procs[name]
+        deadline = time.monotonic() + PROCESS_READY_TIMEOUT
+        while not probe():
+            if proc.poll() is not None:
+                raise RuntimeError(f"{name} for {owner} exited with code {proc.returncode} during startup")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{name} for {owner} not ready after {PROCESS_READY_TIMEOUT}s")
+            await asyncio.sleep(0.1)
+
+    async def _wait_for_port(self, owner: str, name: str, port: int):
+        proc = self._sessions[owner].procs[name]
+        deadline = time.monotonic() + PROCESS_READY_TIMEOUT
+        while True:
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.close()
+                return
+            except OSError:
+                pass
+            if proc.poll() is not None:
+                raise RuntimeError(f"{name} for {owner} exited with code {proc.returncode} during startup")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{name} for {owner} not listening on {port} after {PROCESS_READY_TIMEOUT}s")
+            await asyncio.sleep(0.1)
+
+    def adopt(self, owner: str, pids: Dict[str, int]):
+        """Take ownership of processes started by a previous API process."""
+        entry = self._sessions.setdefault(owner, SessionProcesses(owner))
+        entry.adopted_pids.update({name: pid for name, pid in pids.items() if _pid_alive(pid)})
+
+    def reassign(self, old_owner: str, new_owner: str):
+        entry = self._sessions.pop(old_owner, None)
+        if entry:
+            entry.owner = new_owner
+            self._sessions[new_owner] = entry
+
+    def pids(self, owner: str) -> Dict[str, int]:
+        entry = self._sessions.get(owner)
+        if not entry:
+            return {}
+        return {**{name: p.pid for name, p in entry.procs.items()}, **entry.adopted_pids}
+
+    def is_degraded(self, owner: str) -> bool:
+        entry = self._sessions.get(owner)
+        return bool(entry and entry.degraded)
+
+    async def stop(self, owner: str):
+        """SIGTERM each process group of `owner`, then SIGKILL whatever is left after PROCESS_STOP_TIMEOUT."""
+        entry = self._sessions.pop(owner, None)
+        if not entry:
+            return
+        entry.stopping = True
+        pids = entry.pids()
+        for pid in pids:
+            _signal_group(pid, signal.SIGTERM)
+
+        def any_alive() -> bool:
+            return (any(proc.poll() is None for proc in entry.procs.values())
+                    or any(_pid_alive(pid) for pid in entry.adopted_pids.values()))
+
+        deadline = time.monotonic() + PROCESS_STOP_TIMEOUT
+        while time.monotonic() < deadline and any_alive():
+            await asyncio.sleep(0.1)
+        if any_alive():
+            for pid in pids:
+                _signal_group(pid, signal.SIGKILL)
+        for proc in entry.procs.values():
+            try:
+                proc.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Process {proc.pid} of {owner} did not exit after SIGKILL")
+        if entry.display_num is not None:
+            resource_limits.release(entry.display_num)
+
+    async def monitor(self, on_crash: Callable[[str, str, Optional[int]], Awaitable[None]]):
+        """Poll owned processes and report the first crash of each session once."""
+        while True:
+            await asyncio.sleep(PROCESS_MONITOR_INTERVAL)
+            for entry in list(self._sessions.values()):
+                if entry.stopping or entry.degraded:
+                    continue
+                crashed = [(name, proc.poll()) for name, proc in entry.procs.items() if proc.poll() is not None]
+                crashed += [(name, None) for name, pid in entry.adopted_pids.items() if not _pid_alive(pid)]
+                if not crashed:
+                    continue
+                entry.degraded = True
+                name, code = crashed[0]
+                logger.error(f"{name} for {entry.owner} exited unexpectedly (code={code})")
+                try:
+                    await on_crash(entry.owner, name, code)
+                except Exception as e:
+                    logger.error(f"Crash handler failed for {entry.owner}: {e}")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _signal_group(pid: int, sig: int):
+    try:
+        # Only signal the whole group when the process leads it, so an adopted
+        # process that shares our group never takes the API down with it.
+        if os.getpgid(pid) == pid:
+            os.killpg(pid, sig)
+        else:
+            os.kill(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+process_supervisor = ProcessSupervisor()
@@ -0,0 +1,73 @@
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+TRASH_PREFIX = ".trash-"
+
+
+@dataclass
+class ProfileGCResult:
+    kept: int
+    removed: int
+    trash_dir: str
+    duration_ms: float
+
+
+def collect_stale_profiles(base_dir: str, keep: Iterable[str], keep_prefix: Optional[str] = None,
+                           background: bool = True) -> ProfileGCResult:
+    """
+    Remove every profile directory under `base_dir` whose name is not in `keep`
+    and does not start with `keep_prefix`.
+
+    Deleting hundreds of Chromium profiles one rmtree at a time would hold up
+    startup for seconds. Instead, each stale directory is renamed into a
+    single trash directory in one pass over `base_dir` (a rename is O(1) on the
+    same filesystem), and the trash is deleted on a daemon thread. Trash left
+    over from an earlier run that was interrupted is deleted the same way.
+    """
+    started = time.perf_counter()
+    keep = set(keep)
+    trash_dir = os.path.join(base_dir, f"{TRASH_PREFIX}{uuid.uuid4().hex}")
+    kept = removed = 0
+    leftovers = []
+    try:
+        entries = list(os.scandir(base_dir))
+    except FileNotFoundError:
+        return ProfileGCResult(0, 0, trash_dir, 0.0)
+
+    for entry in entries:
+        if entry.name.startswith(TRASH_PREFIX):
+            leftovers.append(entry.path)
+            continue
+        if not entry.is_dir(follow_symlinks=False):
+            continue
+        if entry.name in keep or (keep_prefix and entry.name.startswith(keep_prefix)):
+            kept += 1
+            continue
+        if not removed:
+            os.makedirs(trash_dir, exist_ok=True)
+        try:
+            os.rename(entry.path, os.path.join(trash_dir, entry.name))
+            removed += 1
+        except OSError as e:
+            logger.warning(f"Could not move stale profile {entry.path} to trash: {e}")
+
+    to_delete = leftovers + ([trash_dir] if removed else [])
+    if to_delete:
+        if background:
+            threading.Thread(target=_delete_all, args=(to_delete,), name="profile-gc", daemon=True).start()
+        else:
+            _delete_all(to_delete)
+    return ProfileGCResult(kept, removed, trash_dir, round((time.perf_counter() - started) * 1000, 2))
+
+
+def _delete_all(paths: Iterable[str]):
+    for path in paths:
+        shutil.rmtree(path, ignore_errors=True)
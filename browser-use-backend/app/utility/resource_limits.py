@@ -0,0 +1,110 @@
+import logging
+import os
+import resource
+from typing import Iterable, Optional
+
+import psutil
+
+from app.core.config import SESSION_MEMORY_LIMIT_MB, SESSION_CPU_LIMIT, SESSION_CGROUP_ROOT
+
+logger = logging.getLogger(__name__)
+
+CPU_PERIOD_US = 100000
+USER_DATA_DIR_FLAG = "--user-data-dir="
+
+
+class ResourceLimits:
+    """
+    Optional per-display caps on memory and CPU.
+
+    With a writable cgroup v2 hierarchy every display gets its own cgroup
+    (`SESSION_CGROUP_ROOT/display-<n>`) holding Xvfb, x11vnc, websockify and the
+    Chromium browser process; renderers Chromium forks later inherit it.
+    Without cgroups only the memory cap can be applied, as an RLIMIT_AS on the
+    display processes; Chromium reserves far more address space than it uses,
+    so it is left uncapped in that mode.
+    """
+
+    def __init__(self):
+        self.enabled = SESSION_MEMORY_LIMIT_MB > 0 or SESSION_CPU_LIMIT > 0
+        self._cgroups: Optional[bool] = None
+
+    @property
+    def cgroups(self) -> bool:
+        if self._cgroups is None:
+            self._cgroups = self.enabled and _init_cgroup_root()
+            if self.enabled and not self._cgroups:
+                logger.warning(f"cgroup v2 not writable at {SESSION_CGROUP_ROOT}, falling back to rlimits")
+        return self._cgroups
+
+    def apply(self, display_num: int, pids: Iterable[int], browser: bool = False):
+        if not self.enabled:
+            return
+        pids = list(pids)
+        if self.cgroups:
+            path = os.path.join(SESSION_CGROUP_ROOT, f"display-{display_num}")
+            try:
+                os.makedirs(path, exist_ok=True)
+                if SESSION_MEMORY_LIMIT_MB > 0:
+                    _write(path, "memory.max", str(SESSION_MEMORY_LIMIT_MB * 1024 * 1024))
+                if SESSION_CPU_LIMIT > 0:
+                    _write(path, "cpu.max", f"{int(SESSION_CPU_LIMIT * CPU_PERIOD_US)} {CPU_PERIOD_US}")
+                for pid in pids:
+                    _write(path, "cgroup.procs", str(pid))
+            except OSError as e:
+                logger.warning(f"Could not apply cgroup limits to display :{display_num}: {e}")
+        elif SESSION_MEMORY_LIMIT_MB > 0 and not browser:
+            limit = SESSION_MEMORY_LIMIT_MB * 1024 * 1024
+            for pid in pids:
+                try:
+                    psutil.Process(pid).rlimit(resource.RLIMIT_AS, (limit, limit))
+                except (psutil.Error, OSError) as e:
+                    logger.warning(f"Could not set rlimit on pid {pid}: {e}")
+
+    def apply_to_browser(self, display_num: int, profile_dir: str):
+        """Cap the Chromium browser running `profile_dir`. Costs one process table scan."""
+        if not self.enabled or not self.cgroups:
+            return
+        pid = find_browser_pid(profile_dir)
+        if pid:
+            self.apply(display_num, [pid], browser=True)
+
+    def release(self, display_num: int):
+        if self.enabled and self.cgroups:
+            try:
+                os.rmdir(os.path.join(SESSION_CGROUP_ROOT, f"display-{display_num}"))
+            except OSError:
+                pass
+
+
+def find_browser_pid(profile_dir: str) -> Optional[int]:
+    flag = f"{USER_DATA_DIR_FLAG}{profile_dir}"
+    for proc in psutil.process_iter(['pid', 'cmdline']):
+        try:
+            cmdline = proc.info.get('cmdline') or []
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            continue
+        if flag in cmdline and not any(arg.startswith("--type=") for arg in cmdline):
+            return proc.info['pid']
+    return None
+
+
+def _init_cgroup_root() -> bool:
+    parent = os.path.dirname(SESSION_CGROUP_ROOT)
+    if not os.path.exists(os.path.join(parent, "cgroup.controllers")):
+        return False
+    try:
+        os.makedirs(SESSION_CGROUP_ROOT, exist_ok=True)
+        _write(parent, "cgroup.subtree_control", "+memory +cpu")
+        _write(SESSION_CGROUP_ROOT, "cgroup.subtree_control", "+memory +cpu")
+        return True
+    except OSError:
+        return False
+
+
+def _write(path: str, name: str, value: str):
+    with open(os.path.join(path, name), "w") as f:
+        f.write(value)
+
+
+resource_limits = ResourceLimits()
@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+
+class SecretCache:
+    """
+    Process-local LRU cache of secrets with a TTL.
+
+    Values are held Fernet-encrypted under a key that only exists in this
+    process's memory, so secrets do not sit in plaintext in the heap (or in a
+    core dump) for the whole TTL.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._fernet = Fernet(Fernet.generate_key())
+        self._entries: "OrderedDict[Hashable, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            token = entry[1]
+        try:
+            return self._fernet.decrypt(token).decode()
+        except InvalidToken:
+            self.invalidate(key)
+            return None
+
+    def put(self, key: Hashable, value: str):
+        if self.ttl <= 0:
+            return
+        token = self._fernet.encrypt(value.encode())
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, token)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "ttl_seconds": self.ttl}
@@ -0,0 +1,61 @@
+import base64
+import io
+import json
+from typing import Tuple
+
+import zstandard
+from PIL import Image
+
+from app.core.config import HISTORY_CODEC, HISTORY_ZSTD_LEVEL, SCREENSHOT_FORMAT, SCREENSHOT_WEBP_QUALITY
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+IMAGE_MEDIA_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+_compressor = zstandard.ZstdCompressor(level=HISTORY_ZSTD_LEVEL)
+_decompressor = zstandard.ZstdDecompressor()
+
+
+def encode_history(snapshots: list) -> Tuple[bytes, str]:
+    """Serialize agent history snapshots. Returns (data, content_encoding)."""
+    data = json.dumps(snapshots, separators=(",", ":")).encode()
+    if HISTORY_CODEC == "zstd":
+        return _compressor.compress(data), "zstd"
+    return data, ""
+
+
+def decode_history(data: bytes) -> list:
+    """Read history in any format ever written: zstd or plain (possibly indented) JSON."""
+    if data[:4] == ZSTD_MAGIC:
+        data = _decompressor.decompress(data)
+    return json.loads(data)
+
+
+def is_compressed_history(data: bytes) -> bool:
+    return data[:4] == ZSTD_MAGIC
+
+
+def encode_screenshot(screenshot_b64: str) -> Tuple[bytes, str]:
+    """Turn a base64 PNG screenshot into stored bytes. Returns (data, format)."""
+    png = base64.b64decode(screenshot_b64)
+    if SCREENSHOT_FORMAT != "webp":
+        return png, "png"
+    with Image.open(io.BytesIO(png)) as image:
+        out = io.BytesIO()
+        image.save(out, format="WEBP", quality=SCREENSHOT_WEBP_QUALITY, method=4)
+    return out.getvalue(), "webp"
+
+
+def screenshot_bytes(doc: dict) -> Tuple[bytes, str]:
+    """The image bytes and format of a screenshot document, old or new layout."""
+    if doc.get("screenshot") is not None:
+        return bytes(doc["screenshot"]), doc.get("screenshot_format", "png")
+    return base64.b64decode(doc.get("screenshot_base64") or ""), "png"
+
+
+def decode_screenshot(doc: dict) -> dict:
+    """Present a screenshot document the way the API always has, with `screenshot_base64`."""
+    if doc.get("screenshot") is not None:
+        data = doc.pop("screenshot")
+        doc["screenshot_base64"] = base64.b64encode(data).decode()
+    doc.setdefault("screenshot_format", "png")
+    return doc
@@ -0,0 +1,74 @@
+"""
+Startup cost of clearing stale browser profiles.
+
+Creates N fake Chromium profiles and compares deleting them one rmtree at a
+time (what teardown does per session) with collect_stale_profiles, which moves
+them to a trash directory and deletes it off the startup path.
+
+    python benchmarks/profile_gc_benchmark.py --profiles 500
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.utility.profile_gc import collect_stale_profiles  # noqa: E402
+
+PROFILE_LAYOUT = {
+    "Default": 20,
+    "Default/Cache/Cache_Data": 40,
+    "Default/Local Storage/leveldb": 8,
+    "Default/IndexedDB": 6,
+    "ShaderCache": 6,
+}
+
+
+def make_profiles(base_dir: str, count: int, file_size: int):
+    payload = os.urandom(file_size)
+    for i in range(count):
+        for sub_dir, files in PROFILE_LAYOUT.items():
+            path = os.path.join(base_dir, f"stale-{i:04d}", sub_dir)
+            os.makedirs(path, exist_ok=True)
+            for j in range(files):
+                with open(os.path.join(path, f"f{j}"), "wb") as f:
+                    f.write(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=500)
+    parser.add_argument("--file-size", type=int, default=4096)
+    parser.add_argument("--keep", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        base_dir = os.path.join(root, "serial")
+        make_profiles(base_dir, args.profiles, args.file_size)
+        started = time.perf_counter()
+        for name in os.listdir(base_dir):
+            shutil.rmtree(os.path.join(base_dir, name))
+        serial = time.perf_counter() - started
+
+        base_dir = os.path.join(root, "bulk")
+        make_profiles(base_dir, args.profiles, args.file_size)
+        keep = {f"stale-{i:04d}" for i in range(args.keep)}
+        result = collect_stale_profiles(base_dir, keep, background=True)
+        started = time.perf_counter()
+        while any(name.startswith(".trash-") for name in os.listdir(base_dir)):
+            time.sleep(0.01)
+        background = time.perf_counter() - started
+
+    files = sum(PROFILE_LAYOUT.values())
+    print(f"{args.profiles} profiles x {files} files x {args.file_size} bytes")
+    print(f"{'serial rmtree (blocks startup)':<42}{serial * 1000:9.1f} ms")
+    print(f"{'collect_stale_profiles (blocks startup)':<42}{result.duration_ms:9.1f} ms"
+          f"  ({result.removed} moved, {result.kept} kept)")
+    print(f"{'  background trash deletion':<42}{background * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
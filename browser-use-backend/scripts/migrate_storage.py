@@ -0,0 +1,116 @@
+"""
+Rewrite stored agent history and screenshots into the compact formats.
+
+Agent history blobs written as (indented) JSON are recompressed with zstd and
+screenshot documents still holding `screenshot_base64` are converted to binary
+PNG/WebP (per HISTORY_CODEC / SCREENSHOT_FORMAT). The API reads both layouts,
+so this can run against a live deployment: work is done in small throttled
+batches, and every write is conditional, so a document or blob the service
+changed in the meantime is skipped rather than overwritten.
+
+    python scripts/migrate_storage.py --screenshots --blobs --batch-size 200 --pause 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceModifiedError
+from azure.storage.blob import BlobServiceClient, ContentSettings
+from pymongo import UpdateOne
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.db.mongo import get_db, init_db  # noqa: E402
+from app.utility.blob_log import AZURE_STORAGE_CONNECTION_STRING  # noqa: E402
+from app.utility.storage_codec import decode_history, encode_history, encode_screenshot, is_compressed_history  # noqa: E402
+
+
+def _convert_batch(docs: list):
+    updates = []
+    size = 0
+    for doc in docs:
+        screenshot, screenshot_format = encode_screenshot(doc["screenshot_base64"])
+        size += len(screenshot)
+        updates.append(UpdateOne(
+            {"_id": doc["_id"], "screenshot_base64": {"$exists": True}},
+            {"$set": {"screenshot": screenshot, "screenshot_format": screenshot_format},
+             "$unset": {"screenshot_base64": ""}},
+        ))
+    return updates, size
+
+
+async def migrate_screenshots(batch_size: int, pause: float) -> dict:
+    collection = get_db()["screenshots"]
+    converted = before = after = 0
+    last_id = None
+    while True:
+        query = {"screenshot_base64": {"$exists": True}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = await collection.find(query, {"screenshot_base64": 1}).sort("_id", 1).limit(batch_size).to_list(length=None)
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+        updates, size = await asyncio.to_thread(_convert_batch, docs)
+        before += sum(len(doc["screenshot_base64"]) for doc in docs)
+        after += size
+        result = await collection.bulk_write(updates, ordered=False)
+        converted += result.modified_count
+        print(f"screenshots: {converted} converted, {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+        await asyncio.sleep(pause)
+    return {"converted": converted, "bytes_before": before, "bytes_after": after}
+
+
+def migrate_blobs(pause: float) -> dict:
+    container_name = os.getenv('BLOB_CONTAINER_NAME', 'agent-states')
+    container = BlobServiceClient.from_connection_string(AZURE_STORAGE_CONNECTION_STRING).get_container_client(container_name)
+    converted = skipped = before = after = 0
+    for blob in container.list_blobs():
+        blob_client = container.get_blob_client(blob.name)
+        downloader = blob_client.download_blob()
+        content = downloader.readall()
+        if is_compressed_history(content):
+            continue
+        data, content_encoding = encode_history(decode_history(content))
+        try:
+            # Only replace the blob if the service has not saved a new snapshot since we read it.
+            blob_client.upload_blob(
+                data,
+                overwrite=True,
+                etag=downloader.properties.etag,
+                match_condition=MatchConditions.IfNotModified,
+                content_settings=ContentSettings(content_type="application/json", content_encoding=content_encoding or None),
+            )
+        except ResourceModifiedError:
+            skipped += 1
+            continue
+        converted += 1
+        before += len(content)
+        after += len(data)
+        print(f"blobs: {converted} converted ({blob.name}), {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+        time.sleep(pause)
+    return {"converted": converted, "skipped_modified": skipped, "bytes_before": before, "bytes_after": after}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--screenshots", action="store_true", help="convert screenshot documents")
+    parser.add_argument("--blobs", action="store_true", help="recompress agent history blobs")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--pause", type=float, default=0.5, help="seconds to wait between batches")
+    args = parser.parse_args()
+
+    if args.screenshots:
+        init_db()
+        print(f"Screenshots done: {await migrate_screenshots(args.batch_size, args.pause)}")
+    if args.blobs:
+        print(f"Blobs done: {await asyncio.to_thread(migrate_blobs, args.pause / 10)}")
+    if not (args.screenshots or args.blobs):
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
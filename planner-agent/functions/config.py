@@ -5,4 +5,12 @@ import os
 
 # ---------- GEMINI SETUP ----------
 GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")
-openai_key = os.getenv("OPEN_AI_KEY")
\ No newline at end of file
+openai_key = os.getenv("OPEN_AI_KEY")
+
+# ---------- PLANNER BACKEND ----------
+PLANNER_BACKEND_URL = os.getenv("PLANNER_BACKEND_URL", "http://host.docker.internal:8001")
+PAYER_CATALOG_TTL_SECONDS = float(os.getenv("PAYER_CATALOG_TTL_SECONDS", "300"))
+PLANNER_BACKEND_LATENCY_TARGET_SECONDS = float(os.getenv("PLANNER_BACKEND_LATENCY_TARGET_SECONDS", "5"))
+
+# ---------- LLM PROVIDERS ----------
+LLM_LATENCY_TARGET_SECONDS = float(os.getenv("LLM_LATENCY_TARGET_SECONDS", "10"))
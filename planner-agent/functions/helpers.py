@@ -1,7 +1,7 @@
 from functions.table_files import PAYERS
 from functions.schema import ResponseModel
 from functions.table_files import pre_auth_req_data
-from functions.prompts import PAYER_NAME_TO_ID
+from functions.payer_catalog import payer_catalog, planner_backend
 import httpx
 
 # ---------- PLACEHOLDER FUNCTION ----------
@@ -22,14 +22,16 @@ def get_patient_details(patient_id: str, request_id: str) -> dict | None:
     }
 
     try:
-        with httpx.Client() as client:
+        with httpx.Client() as client, planner_backend.guard_sync() as call:
             response = client.post(
                 "http://host.docker.internal:8001/api/tools/get-patient-details",
                 json=payload,
                 timeout=30.0
             )
-            response.raise_for_status()
-            api_response = response.json()
+            if response.is_server_error:
+                call.fail()
+        response.raise_for_status()
+        api_response = response.json()
     except Exception as e:
         return {"error": f"Failed to fetch patient details: {str(e)}"}
 
@@ -49,10 +51,12 @@ def get_payer_details_api(payer_id: str, request_id: str) -> dict:
     params = {"request_id": request_id}
 
     try:
-        with httpx.Client() as client:
+        with httpx.Client() as client, planner_backend.guard_sync() as call:
             response = client.get(url, params=params, timeout=20.0)
-            response.raise_for_status()
-            payer_response = response.json()
+            if response.is_server_error:
+                call.fail()
+        response.raise_for_status()
+        payer_response = response.json()
     except Exception as e:
         return {"error": f"Failed to fetch payer details: {str(e)}"}
 
@@ -91,14 +95,16 @@ def trigger_n8n(patient_id: str, payer: str, user_id: str, request_id:str) -> di
     # print(f"n8n payload is : {n8n_payload}")
     # Step 4: Call the APIs service at port 8001
     try:
-        with httpx.Client() as client:
+        with httpx.Client() as client, planner_backend.guard_sync() as call:
             response = client.post(
                 "http://host.docker.internal:8001/api/tools/trigger-n8n",
                 json=n8n_payload,
                 timeout=30.0
             )
-            response.raise_for_status()
-            n8n_response = response.json()
+            if response.is_server_error:
+                call.fail()
+        response.raise_for_status()
+        n8n_response = response.json()
     except Exception as e:
         n8n_response = {"error": f"Failed to trigger N8N API: {str(e)}"}
 
@@ -169,10 +175,12 @@ def start_request(user_id: str, prompt: str) -> dict:
     }
 
     try:
-        with httpx.Client() as client:
+        with httpx.Client() as client, planner_backend.guard_sync() as call:
             response = client.post(url, json=payload, timeout=20.0)
-            response.raise_for_status()
-            api_response  = response.json()
+            if response.is_server_error:
+                call.fail()
+        response.raise_for_status()
+        api_response  = response.json()
     except Exception as e:
         return {f"Failed to call start-request API: {str(e)}"}
         # Ensure status is CREATED
@@ -188,10 +196,8 @@ def start_request(user_id: str, prompt: str) -> dict:
 
 def get_payer_id_by_name(payer_name: str) -> str | None:
     """
-    Returns the payer_id corresponding to the given payer_name.
-    Case-insensitive match. Returns None if not found.
+    Returns the payer_id corresponding to the given payer_name, from the
+    planner-backend payer catalog. Case- and punctuation-insensitive match.
+    Returns None if not found.
     """
-    for name, pid in PAYER_NAME_TO_ID.items():
-        if name.lower() == payer_name.lower():
-            return pid
-    return None
\ No newline at end of file
+    return payer_catalog.resolve(payer_name)
\ No newline at end of file
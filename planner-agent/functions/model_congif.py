@@ -2,25 +2,38 @@ from google import genai
 from openai import OpenAI
 from google.genai import types
 from functions.prompts import SYSTEM_PROMPT
-from functions.config import GEMINI_API_KEY, openai_key
+from functions.config import GEMINI_API_KEY, openai_key, LLM_LATENCY_TARGET_SECONDS
+from functions.resilience import dependency
 from functions.schema import OutputSchemaPurpose, PurposeClass
 
 client = genai.Client(api_key=GEMINI_API_KEY)
 openclient = OpenAI(api_key=openai_key)
 
+
+def _provider_failure(error: Exception) -> bool:
+    # A request the provider rejected (4xx) says nothing about its health, except timeouts and rate limits
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return not isinstance(status, int) or status >= 500 or status in (408, 429)
+
+
+# Fail fast with DependencyUnavailable instead of waiting on a provider that is down or saturated
+gemini_dependency = dependency("gemini", latency_target=LLM_LATENCY_TARGET_SECONDS, is_failure=_provider_failure)
+openai_dependency = dependency("openai", latency_target=LLM_LATENCY_TARGET_SECONDS, is_failure=_provider_failure)
+
 # ---------- LLM FUNCTIONS ----------
 def detect_intent_gemini(user_query: str) -> OutputSchemaPurpose:
     """Classify intent using Gemini."""
     model='gemini-2.0-flash-001'
-    response = client.models.generate_content(
-        model='gemini-2.0-flash-001',
-        contents=user_query,
-        config=types.GenerateContentConfig(
-            system_instruction=SYSTEM_PROMPT,
-            response_mime_type='application/json',
-            response_schema=list[PurposeClass],
-        ),
-    )
+    with gemini_dependency.guard_sync():
+        response = client.models.generate_content(
+            model='gemini-2.0-flash-001',
+            contents=user_query,
+            config=types.GenerateContentConfig(
+                system_instruction=SYSTEM_PROMPT,
+                response_mime_type='application/json',
+                response_schema=list[PurposeClass],
+            ),
+        )
     print(f"model used is : {model}")
     return response.parsed[0].items[0]  # OutputSchemaPurpose instance
 
@@ -28,13 +41,14 @@ def detect_intent_gemini(user_query: str) -> OutputSchemaPurpose:
 def detect_intent_openai(user_query: str) -> OutputSchemaPurpose:
     """Classify intent using OpenAI."""
     model="gpt-4.1-mini"
-    response = openclient.responses.parse(
-        model=model,
-        input=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_query},
-        ],
-        text_format=OutputSchemaPurpose,
-    )
+    with openai_dependency.guard_sync():
+        response = openclient.responses.parse(
+            model=model,
+            input=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": user_query},
+            ],
+            text_format=OutputSchemaPurpose,
+        )
     print(f"model used is : {model}")
     return response.output_parsed  
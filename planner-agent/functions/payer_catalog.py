@@ -0,0 +1,72 @@
+import re
+import threading
+import time
+
+import httpx
+
+from functions.config import PLANNER_BACKEND_URL, PAYER_CATALOG_TTL_SECONDS, PLANNER_BACKEND_LATENCY_TARGET_SECONDS
+from functions.prompts import PAYER_NAME_TO_ID
+from functions.resilience import dependency
+
+planner_backend = dependency("planner-backend", latency_target=PLANNER_BACKEND_LATENCY_TARGET_SECONDS)
+
+
+def normalize_payer_name(name: str) -> str:
+    # Same normalization as planner-backend's payer catalog
+    return re.sub(r"[^0-9a-z]", "", name.casefold())
+
+
+class PayerCatalogClient:
+    """
+    Local copy of planner-backend's payer catalog (GET /api/payers/catalog).
+
+    The catalog is revalidated at most every PAYER_CATALOG_TTL_SECONDS with
+    its version as If-None-Match, so an unchanged catalog costs one 304.
+    If the backend cannot be reached before the first load, names are
+    resolved against PAYER_NAME_TO_ID instead.
+    """
+
+    def __init__(self, base_url: str, ttl: float):
+        self.url = f"{base_url}/api/payers/catalog"
+        self.ttl = ttl
+        self.version = None
+        self._by_name = {}
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def resolve(self, payer_name: str) -> str | None:
+        self._revalidate()
+        key = normalize_payer_name(payer_name)
+        if self.version is not None:
+            return self._by_name.get(key)
+        for name, pid in PAYER_NAME_TO_ID.items():
+            if normalize_payer_name(name) == key:
+                return pid
+        return None
+
+    def _revalidate(self):
+        with self._lock:
+            if self._checked_at is not None and time.monotonic() - self._checked_at < self.ttl:
+                return
+            self._checked_at = time.monotonic()
+            headers = {"If-None-Match": f'"{self.version}"'} if self.version else {}
+            try:
+                with httpx.Client() as client, planner_backend.guard_sync() as call:
+                    response = client.get(self.url, headers=headers, timeout=10.0)
+                    if response.is_server_error:
+                        call.fail()
+                if response.status_code == 304:
+                    return
+                response.raise_for_status()
+                catalog = response.json()
+            except Exception as e:
+                print(f"Payer catalog refresh failed, keeping version {self.version}: {e}")
+                return
+            self._by_name = {
+                normalize_payer_name(payer["name"]): payer["id"]
+                for payer in catalog["payers"] if payer.get("name")
+            }
+            self.version = catalog["version"]
+
+
+payer_catalog = PayerCatalogClient(PLANNER_BACKEND_URL, PAYER_CATALOG_TTL_SECONDS)
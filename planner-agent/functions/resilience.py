@@ -0,0 +1,331 @@
+"""
+Circuit breakers and adaptive concurrency limits for downstream calls.
+
+The same file lives in planner-backend (services/resilience.py),
+planner-agent (functions/resilience.py) and browser-use-backend
+(app/utility/resilience.py); each service is built from its own directory,
+so change all three copies together. scripts/check_shared_modules.py at the
+repository root fails when they differ (--sync copies this one over the
+others).
+
+Every downstream dependency (n8n, the validation endpoint, an LLM provider,
+Key Vault, ...) gets one Dependency, shared by all callers in the process:
+
+- a CircuitBreaker that opens when at least RESILIENCE_FAILURE_RATE of the
+  last RESILIENCE_WINDOW calls failed (once RESILIENCE_MIN_CALLS were seen).
+  While open, calls fail at once with DependencyUnavailable. After
+  RESILIENCE_OPEN_SECONDS a single probe call is let through; it closes the
+  breaker again or keeps it open for another period.
+- an AIMD concurrency limit: each call that succeeds within the
+  dependency's latency target raises the limit by 1/limit (about one per
+  round of calls), each failed or slower call multiplies it by
+  RESILIENCE_BACKOFF. A call beyond the limit waits up to max_wait seconds
+  (RESILIENCE_MAX_WAIT_SECONDS, 0 by default) for a slot and is then shed
+  instead of queueing behind a slow dependency.
+
+Usage:
+
+    n8n = dependency("n8n", latency_target=5.0)
+
+    async with n8n.guard() as call:
+        response = await client.post(...)
+        if response.status_code >= 500:
+            call.fail()
+
+guard_sync() is the same for blocking code. dependency_status() lists every
+dependency for a status endpoint.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict, List, Optional
+
+RESILIENCE_FAILURE_RATE = float(os.getenv("RESILIENCE_FAILURE_RATE", "0.5"))
+RESILIENCE_MIN_CALLS = int(os.getenv("RESILIENCE_MIN_CALLS", "10"))
+RESILIENCE_WINDOW = int(os.getenv("RESILIENCE_WINDOW", "50"))
+RESILIENCE_OPEN_SECONDS = float(os.getenv("RESILIENCE_OPEN_SECONDS", "30"))
+RESILIENCE_INITIAL_LIMIT = float(os.getenv("RESILIENCE_INITIAL_LIMIT", "10"))
+RESILIENCE_MIN_LIMIT = float(os.getenv("RESILIENCE_MIN_LIMIT", "1"))
+RESILIENCE_MAX_LIMIT = float(os.getenv("RESILIENCE_MAX_LIMIT", "100"))
+RESILIENCE_BACKOFF = float(os.getenv("RESILIENCE_BACKOFF", "0.7"))
+RESILIENCE_MAX_WAIT_SECONDS = float(os.getenv("RESILIENCE_MAX_WAIT_SECONDS", "0"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class DependencyUnavailable(Exception):
+    """Raised instead of calling a dependency whose breaker is open or whose limit is reached."""
+
+    def __init__(self, name: str, reason: str, retry_after: float = 0.0):
+        super().__init__(f"{name} unavailable: {reason}")
+        self.name = name
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, failure_rate: float, min_calls: int, window: int, open_seconds: float):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._outcomes = deque(maxlen=window)
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record(self, ok: bool):
+        if self.state == HALF_OPEN:
+            self._probing = False
+            if ok:
+                self.state = CLOSED
+                self._outcomes.clear()
+            else:
+                self._open()
+            return
+        if self.state == OPEN:
+            return  # a call admitted before the breaker opened
+        self._outcomes.append(ok)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+            self._open()
+
+    def cancel_probe(self):
+        self._probing = False
+
+    def retry_after(self) -> float:
+        return max(0.0, self.open_seconds - (time.monotonic() - self.opened_at)) if self.state == OPEN else 0.0
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._outcomes.clear()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": self._outcomes.count(False),
+            "retry_after_seconds": round(self.retry_after(), 3),
+            "times_opened": self.times_opened,
+        }
+
+
+class AIMDLimit:
+    def __init__(self, initial: float, min_limit: float, max_limit: float, backoff: float,
+                 latency_target: Optional[float]):
+        self.limit = max(min_limit, min(max_limit, initial))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.inflight = 0
+
+    def try_acquire(self) -> bool:
+        if self.inflight >= int(self.limit):
+            return False
+        self.inflight += 1
+        return True
+
+    def release(self, ok: bool, latency: float):
+        self.inflight -= 1
+        if not ok or (self.latency_target is not None and latency > self.latency_target):
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def cancel(self):
+        self.inflight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "inflight": self.inflight,
+            "latency_target_seconds": self.latency_target,
+        }
+
+
+class Call:
+    """Handed to the guarded block; call fail() for a response that counts as a failure."""
+
+    def __init__(self):
+        self.ok = True
+        self.started = time.monotonic()
+
+    def fail(self):
+        self.ok = False
+
+
+class Dependency:
+    def __init__(self, name: str, latency_target: Optional[float] = None,
+                 is_failure: Optional[Callable[[BaseException], bool]] = None,
+                 failure_rate: float = RESILIENCE_FAILURE_RATE, min_calls: int = RESILIENCE_MIN_CALLS,
+                 window: int = RESILIENCE_WINDOW, open_seconds: float = RESILIENCE_OPEN_SECONDS,
+                 initial_limit: float = RESILIENCE_INITIAL_LIMIT, min_limit: float = RESILIENCE_MIN_LIMIT,
+                 max_limit: float = RESILIENCE_MAX_LIMIT, backoff: float = RESILIENCE_BACKOFF,
+                 max_wait: float = RESILIENCE_MAX_WAIT_SECONDS):
+        self.name = name
+        self.max_wait = max_wait
+        self.is_failure = is_failure or (lambda error: True)
+        self.breaker = CircuitBreaker(failure_rate, min_calls, window, open_seconds)
+        self.limit = AIMDLimit(initial_limit, min_limit, max_limit, backoff, latency_target)
+        self._lock = threading.Lock()
+        self._waiters: List[Callable[[], None]] = []
+        self.calls = 0
+        self.failures = 0
+        self.rejected_open = 0
+        self.rejected_limit = 0
+        self.waits = 0
+        self._latency = 0.0
+
+    @asynccontextmanager
+    async def guard(self):
+        call = await self._acquire()
+        try:
+            yield call
+        except Exception as e:
+            if self.is_failure(e):
+                call.fail()
+            self._exit(call)
+            raise
+        except BaseException:
+            self._cancel()  # cancelled: says nothing about the dependency
+            raise
+        self._exit(call)
+
+    @contextmanager
+    def guard_sync(self):
+        call = self._acquire_sync()
+        try:
+            yield call
+        except Exception as e:
+            if self.is_failure(e):
+                call.fail()
+            self._exit(call)
+            raise
+        except BaseException:
+            self._cancel()
+            raise
+        self._exit(call)
+
+    async def _acquire(self) -> Call:
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            slot = loop.create_future()
+
+            def wake(slot=slot):
+                loop.call_soon_threadsafe(lambda: slot.done() or slot.set_result(None))
+
+            call = self._enter(wake if time.monotonic() < deadline else None)
+            if call is not None:
+                return call
+            try:
+                await asyncio.wait_for(slot, deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._forget(wake)
+
+    def _acquire_sync(self) -> Call:
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            slot = threading.Event()
+            call = self._enter(slot.set if time.monotonic() < deadline else None)
+            if call is not None:
+                return call
+            slot.wait(max(0.0, deadline - time.monotonic()))
+            self._forget(slot.set)
+
+    def _enter(self, wake: Optional[Callable[[], None]] = None) -> Optional[Call]:
+        """A Call, or None once `wake` is registered to be called when a slot frees up."""
+        with self._lock:
+            if not self.limit.try_acquire():
+                if wake is not None:
+                    self.waits += 1
+                    self._waiters.append(wake)
+                    return None
+                self.rejected_limit += 1
+                raise DependencyUnavailable(self.name, f"concurrency limit {int(self.limit.limit)} reached")
+            if not self.breaker.allow():
+                self.limit.cancel()
+                self.rejected_open += 1
+                raise DependencyUnavailable(self.name, "circuit open", self.breaker.retry_after())
+        return Call()
+
+    def _exit(self, call: Call):
+        latency = time.monotonic() - call.started
+        with self._lock:
+            self.calls += 1
+            self.failures += not call.ok
+            self._latency = latency if self.calls == 1 else 0.9 * self._latency + 0.1 * latency
+            self.limit.release(call.ok, latency)
+            self.breaker.record(call.ok)
+        self._wake_waiters()
+
+    def _cancel(self):
+        with self._lock:
+            self.limit.cancel()
+            self.breaker.cancel_probe()
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        # every waiter retries; those that lose the race register again
+        with self._lock:
+            waiters, self._waiters = self._waiters, []
+        for wake in waiters:
+            wake()
+
+    def _forget(self, wake: Callable[[], None]):
+        with self._lock:
+            if wake in self._waiters:
+                self._waiters.remove(wake)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                **self.breaker.stats(),
+                **self.limit.stats(),
+                "calls": self.calls,
+                "failures": self.failures,
+                "rejected_open": self.rejected_open,
+                "rejected_limit": self.rejected_limit,
+                "waits": self.waits,
+                "waiting": len(self._waiters),
+                "latency_seconds": round(self._latency, 3),  # moving average
+            }
+
+
+_dependencies: Dict[str, Dependency] = {}
+_registry_lock = threading.Lock()
+
+
+def dependency(name: str, **settings) -> Dependency:
+    """The process-wide Dependency called `name`; settings apply when it is first created."""
+    with _registry_lock:
+        if name not in _dependencies:
+            _dependencies[name] = Dependency(name, **settings)
+        return _dependencies[name]
+
+
+def dependency_status() -> List[dict]:
+    with _registry_lock:
+        dependencies = list(_dependencies.values())
+    return [dep.stats() for dep in dependencies]
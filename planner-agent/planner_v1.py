@@ -11,6 +11,7 @@ from functions.schema import UserInput, ResponseModel, Message, UserMessage
 from functions.config import GEMINI_API_KEY, openai_key
 from functions.model_congif import detect_intent_openai, detect_intent_gemini
 from functions.helpers import pre_authorization_workflow, handle_pre_authorization, start_request
+from functions.resilience import DependencyUnavailable, dependency_status
 from functions.sse_manager import ConnectionManager
 import asyncio
 import json
@@ -40,7 +41,10 @@ async def detect_intent(user_input: UserInput):
     #start a request
     request_id = start_request(user_input.user_id, user_input.query)
     print(f"req id is: {request_id}")
-    parsed = detect_intent_openai((user_input.query))
+    try:
+        parsed = detect_intent_openai((user_input.query))
+    except DependencyUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, int(e.retry_after)))})
     # print(f"llm output is : {parsed}")
     # parsed = detect_intent_gemini((user_input.query))
     Intent, patient_id, payer = parsed.Intent, parsed.patient_id, parsed.payer
@@ -62,6 +66,12 @@ async def detect_intent(user_input: UserInput):
         return handle_pre_authorization(Intent, patient_id, payer, user_input.user_id, request_id)
     
 
+@app.get("/dependencies")
+async def dependencies():
+    """Circuit breaker state and concurrency limit of the planner backend and LLM providers"""
+    return dependency_status()
+
+
 # ---------- SSE ENDPOINTS ----------
 @app.get("/")
 async def root():
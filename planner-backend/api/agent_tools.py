@@ -17,9 +17,20 @@ from db.config.connection import get_db
 from db.models.dbmodels.requestProgress import RequestProgress, RequestStatus
 from db.models.dbmodels.priorAuthRequest import priorAuthRequest
 from db.models.dbmodels.utility.httpResponseEnum import HttpResponseEnum
+from services.document_store import document_store
+from services.n8n_outbox import n8n_outbox
+from services.patient_source import PatientNotFound, patient_directory
+from services.payer_catalog import payer_catalog
+from services.progress_writer import progress_writer
+from services.request_cache import request_cache
+from services.resilience import DependencyUnavailable, dependency
 
 router = APIRouter()
 
+validation_dependency = dependency(
+    "validation", latency_target=float(os.getenv("VALIDATION_LATENCY_TARGET_SECONDS", "5"))
+)
+
 # ============================================================================
 # TOOL 1: Start New Request
 # ============================================================================
@@ -77,50 +88,33 @@ async def check_payer_onboarding(payer_id: str, request_id: str = Query(...)):
     Validates payer existence in the system
     """
     try:
-        db = get_db()
-        
         # Update request status
-        await db["requestProgress"].update_one(
-            {"requestId": request_id},
-            {
-                "$set": {
-                    "status": RequestStatus.PROCESSING,
-                    "lastUpdatedAt": datetime.now(),
-                    "remarks": f"Checking payer onboarding: {payer_id}"
-                }
-            }
-        )
+        await progress_writer.update(request_id, {
+            "status": RequestStatus.PROCESSING,
+            "lastUpdatedAt": datetime.now(),
+            "remarks": f"Checking payer onboarding: {payer_id}"
+        })
         
-        # Check payer in database
-        payer = await db["payers"].find_one({"id": payer_id}, {"_id": 0})
+        # Check payer in the catalog
+        payer = payer_catalog.get(payer_id)
         
         if payer:
-            await db["requestProgress"].update_one(
-                {"requestId": request_id},
-                {
-                    "$set": {
-                        "status": RequestStatus.PROCESSING,
-                        "lastUpdatedAt": datetime.now(),
-                        "remarks": "Payer validated successfully"
-                    }
-                }
-            )
+            await progress_writer.update(request_id, {
+                "status": RequestStatus.PROCESSING,
+                "lastUpdatedAt": datetime.now(),
+                "remarks": "Payer validated successfully"
+            }, wait=True)
             return PayerCheckResponse(
                 is_onboarded=True,
                 payer_details=payer,
                 message="Payer is onboarded and active"
             )
         else:
-            await db["requestProgress"].update_one(
-                {"requestId": request_id},
-                {
-                    "$set": {
-                        "status": RequestStatus.FAILED,
-                        "lastUpdatedAt": datetime.now(),
-                        "remarks": f"Payer {payer_id} not found"
-                    }
-                }
-            )
+            await progress_writer.update(request_id, {
+                "status": RequestStatus.FAILED,
+                "lastUpdatedAt": datetime.now(),
+                "remarks": f"Payer {payer_id} not found"
+            }, wait=True)
             return PayerCheckResponse(
                 is_onboarded=False,
                 payer_details=None,
@@ -128,16 +122,11 @@ async def check_payer_onboarding(payer_id: str, request_id: str = Query(...)):
             )
             
     except Exception as e:
-        await db["requestProgress"].update_one(
-            {"requestId": request_id},
-            {
-                "$set": {
-                    "status": RequestStatus.FAILED,
-                    "lastUpdatedAt": datetime.now(),
-                    "remarks": f"Error checking payer: {str(e)}"
-                }
-            }
-        )
+        await progress_writer.update(request_id, {
+            "status": RequestStatus.FAILED,
+            "lastUpdatedAt": datetime.now(),
+            "remarks": f"Error checking payer: {str(e)}"
+        }, wait=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 # ============================================================================
@@ -157,109 +146,54 @@ class PatientDetailsResponse(BaseModel):
 async def get_patient_details(req: PatientDetailsRequest):
     """
     TOOL 3: Get patient details JSON
-    Fetches patient information from external system or database
+    Fetches patient information from the configured patient source (services/patient_source.py)
     """
-    db = get_db()
-    
     try:
         # Update request status
-        await db["requestProgress"].update_one(
-            {"requestId": req.request_id},
-            {
-                "$set": {
-                    "status": RequestStatus.PROCESSING,
-                    "lastUpdatedAt": datetime.now(),
-                    "remarks": f"Fetching patient details for: {req.patient_id}"
-                }
-            }
-        )
+        await progress_writer.update(req.request_id, {
+            "status": RequestStatus.PROCESSING,
+            "lastUpdatedAt": datetime.now(),
+            "remarks": f"Fetching patient details for: {req.patient_id}"
+        })
         
-        # Here you would typically call an external patient API
-        # For now, we'll return mock data or fetch from local database
-        
-        # Example external API call:
-        # async with httpx.AsyncClient() as client:
-        #     response = await client.get(f"{os.getenv('PATIENT_API_URL')}/patients/{req.patient_id}")
-        #     patient_data = response.json()
-        
-        # Mock patient data for demonstration
-        mock_patient_data = {
-      "firstName": "Anurag",
-      "lastName": "Sinha",
-      "dateOfBirth": "01/07/2001",
-      "memberId": "12345",
-      "groupNumber": "12",
-      "phoneNumber": "9991123322",
-      "email": "abc@def.com",
-      "serviceType": "MRI",
-      "cptCode": "72148",
-      "diagnosis": "Persistent pain",
-      "clinicalJustification": "Required to rule out",
-      "urgency": "Urgent",
-      "requestedDate": "01/01/2025",
-      "documents": [
-        "/app/tmp/test_document.txt"
-      ]
-    }
-
-        # Ensure the document file exists
-        os.makedirs('/app/tmp', exist_ok=True)
-        document_path = '/app/tmp/test_document.txt'
-        
-        if not os.path.exists(document_path):
-            # Create a sample medical document
-            with open(document_path, 'w') as f:
-                f.write(f"""MEDICAL DOCUMENT - PRIOR AUTHORIZATION SUPPORT
-
-Patient: {mock_patient_data['firstName']} {mock_patient_data['lastName']}
-DOB: {mock_patient_data['dateOfBirth']}
-Member ID: {mock_patient_data['memberId']}
-
-SERVICE REQUEST:
-Service Type: {mock_patient_data['serviceType']}
-CPT Code: {mock_patient_data['cptCode']}
-Diagnosis: {mock_patient_data['diagnosis']}
-Clinical Justification: {mock_patient_data['clinicalJustification']}
-Urgency: {mock_patient_data['urgency']}
-Requested Date: {mock_patient_data['requestedDate']}
-
-This document supports the prior authorization request for the above patient.
-Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-Medical Provider Signature: [Electronic Signature]
-License Number: [Provider License]
-Date: {datetime.now().strftime('%Y-%m-%d')}
-""")
-            print(f"Document created at: {document_path}")
-        
-        await db["requestProgress"].update_one(
-            {"requestId": req.request_id},
-            {
-                "$set": {
-                    "status": RequestStatus.PROCESSING,
-                    "lastUpdatedAt": datetime.now(),
-                    "remarks": "Patient details fetched successfully"
-                }
-            }
-        )
+        try:
+            patient_data = await patient_directory.get(req.patient_id)
+        except PatientNotFound:
+            await progress_writer.update(req.request_id, {
+                "status": RequestStatus.FAILED,
+                "lastUpdatedAt": datetime.now(),
+                "remarks": f"Patient {req.patient_id} not found"
+            }, wait=True)
+            return PatientDetailsResponse(
+                patient_data={},
+                success=False,
+                message=f"Patient {req.patient_id} not found"
+            )
+
+        # Publish the patient's documents in the request's manifest for the browser agent
+        await document_store.stage_paths(req.request_id, patient_data.get("documents", []))
+
+        await progress_writer.update(req.request_id, {
+            "status": RequestStatus.PROCESSING,
+            "lastUpdatedAt": datetime.now(),
+            "remarks": "Patient details fetched successfully"
+        }, wait=True)
         
         return PatientDetailsResponse(
-            patient_data=mock_patient_data,
+            patient_data=patient_data,
             success=True,
             message="Patient details retrieved successfully"
         )
         
+    except DependencyUnavailable as e:
+        # Shed by the breaker or the concurrency limit: transient, so the request is not failed
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, int(e.retry_after)))})
     except Exception as e:
-        await db["requestProgress"].update_one(
-            {"requestId": req.request_id},
-            {
-                "$set": {
-                    "status": RequestStatus.FAILED,
-                    "lastUpdatedAt": datetime.now(),
-                    "remarks": f"Error fetching patient details: {str(e)}"
-                }
-            }
-        )
+        await progress_writer.update(req.request_id, {
+            "status": RequestStatus.FAILED,
+            "lastUpdatedAt": datetime.now(),
+            "remarks": f"Error fetching patient details: {str(e)}"
+        }, wait=True)
         return PatientDetailsResponse(
             patient_data={},
             success=False,
@@ -287,20 +221,13 @@ async def validate_patient_json(req: JsonValidationRequest):
     TOOL 4: Validate patient JSON against payer rules
     Uses existing validation logic from validate_json.py
     """   
-    db = get_db()
-    
     try:
         # Update request status
-        await db["requestProgress"].update_one(
-            {"requestId": req.request_id},
-            {
-                "$set": {
-                    "status": RequestStatus.PROCESSING,
-                    "lastUpdatedAt": datetime.now(),
-                    "remarks": f"Validating JSON for payer: {req.payer_id}"
-                }
-            }
-        )
+        await progress_writer.update(req.request_id, {
+            "status": RequestStatus.PROCESSING,
+            "lastUpdatedAt": datetime.now(),
+            "remarks": f"Validating JSON for payer: {req.payer_id}"
+        })
         
         # Call existing validation endpoint
         async with httpx.AsyncClient() as client:
@@ -309,26 +236,24 @@ async def validate_patient_json(req: JsonValidationRequest):
                 "json_data": req.patient_data
             }
             
-            response = await client.post(
-                f"{os.getenv('BASE_URL', 'http://host.docker.internal:8001')}/api/validate-json",
-                json=validation_request,
-                timeout=30.0
-            )
+            async with validation_dependency.guard() as call:
+                response = await client.post(
+                    f"{os.getenv('BASE_URL', 'http://host.docker.internal:8001')}/api/validate-json",
+                    json=validation_request,
+                    timeout=30.0
+                )
+                if response.status_code >= 500:
+                    call.fail()
             
             if response.status_code == 200:
                 result = response.json()
                 
                 if result.get("is_valid", False):
-                    await db["requestProgress"].update_one(
-                        {"requestId": req.request_id},
-                        {
-                            "$set": {
-                                "status": RequestStatus.PROCESSING,
-                                "lastUpdatedAt": datetime.now(),
-                                "remarks": "JSON validation successful"
-                            }
-                        }
-                    )
+                    await progress_writer.update(req.request_id, {
+                        "status": RequestStatus.PROCESSING,
+                        "lastUpdatedAt": datetime.now(),
+                        "remarks": "JSON validation successful"
+                    }, wait=True)
                     return JsonValidationResponse(
                         is_valid=True,
                         validation_errors=[],
@@ -336,16 +261,11 @@ async def validate_patient_json(req: JsonValidationRequest):
                         message="JSON validation passed"
                     )
                 else:
-                    await db["requestProgress"].update_one(
-                        {"requestId": req.request_id},
-                        {
-                            "$set": {
-                                "status": RequestStatus.USER_ACTION_REQUIRED,
-                                "lastUpdatedAt": datetime.now(),
-                                "remarks": "JSON validation failed - additional info required"
-                            }
-                        }
-                    )
+                    await progress_writer.update(req.request_id, {
+                        "status": RequestStatus.USER_ACTION_REQUIRED,
+                        "lastUpdatedAt": datetime.now(),
+                        "remarks": "JSON validation failed - additional info required"
+                    }, wait=True)
                     return JsonValidationResponse(
                         is_valid=False,
                         validation_errors=result.get("validation_errors", []),
@@ -354,18 +274,16 @@ async def validate_patient_json(req: JsonValidationRequest):
                     )
             else:
                 raise Exception("Validation service error")
-                
+
+    except DependencyUnavailable as e:
+        # Shed by the breaker or the concurrency limit: transient, so the request is not failed
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, int(e.retry_after)))})
     except Exception as e:
-        await db["requestProgress"].update_one(
-            {"requestId": req.request_id},
-            {
-                "$set": {
-                    "status": RequestStatus.FAILED,
-                    "lastUpdatedAt": datetime.now(),
-                    "remarks": f"JSON validation error: {str(e)}"
-                }
-            }
-        )
+        await progress_writer.update(req.request_id, {
+            "status": RequestStatus.FAILED,
+            "lastUpdatedAt": datetime.now(),
+            "remarks": f"JSON validation error: {str(e)}"
+        }, wait=True)
         return JsonValidationResponse(
             is_valid=False,
             validation_errors=[str(e)],
@@ -395,23 +313,10 @@ class N8NTriggerResponse(BaseModel):
 async def trigger_n8n_workflow(req: N8NTriggerRequest):
     """
     TOOL 5: Trigger N8N workflow with validated data
-    Starts the automation process in N8N
+    Starts the automation process in N8N. Returns once the trigger is stored;
+    the webhook itself is delivered in the background (services/n8n_outbox.py)
     """   
-    db = get_db()
-    
     try:
-        # Update request status
-        await db["requestProgress"].update_one(
-            {"requestId": req.request_id},
-            {
-                "$set": {
-                    "status": RequestStatus.IN_PROGRESS,
-                    "lastUpdatedAt": datetime.now(),
-                    "remarks": "Triggering N8N workflow"
-                }
-            }
-        )
-        
         # Create prior auth request record
         prior_auth_request = priorAuthRequest(
             requestId=req.request_id,
@@ -422,57 +327,45 @@ async def trigger_n8n_workflow(req: N8NTriggerRequest):
             createdAt=datetime.now(),
             lastUpdatedAt=datetime.now()
         )
-        await db["priorAuthRequest"].insert_one(prior_auth_request.dict())
+        n8n_payload = {
+            "requestId": req.request_id,
+            "payerId": req.payer_id,
+            "userId": req.user_id,
+            "patientId": req.patient_id,
+            "patientName": req.patient_name,
+            "task": req.prompt,
+            "json_data": req.validated_json
+        }
         
-        # Call N8N webhook
-        async with httpx.AsyncClient() as client:
-            n8n_payload = {
-                "requestId": req.request_id,
-                "payerId": req.payer_id,
-                "userId": req.user_id,
-                "patientId": req.patient_id,
-                "patientName": req.patient_name,
-                "task": req.prompt,
-                "json_data": req.validated_json
-            }
-            
-            response = await client.post(
-                os.getenv("N8N_WEBHOOK_URL"),
-                json=n8n_payload,
-                timeout=30.0
+        # Store the request and the N8N webhook call together; the outbox dispatcher delivers it
+        outcome = await n8n_outbox.enqueue_trigger(prior_auth_request.dict(), os.getenv("N8N_WEBHOOK_URL"), n8n_payload)
+        if outcome == "duplicate":
+            # Already queued or delivered: its status is the workflow's, leave it alone
+            return N8NTriggerResponse(
+                workflow_triggered=True,
+                workflow_id=None,
+                message="N8N workflow was already triggered"
             )
-            
-            if response.status_code in [200, 201]:
-                await db["requestProgress"].update_one(
-                    {"requestId": req.request_id},
-                    {
-                        "$set": {
-                            "status": RequestStatus.IN_PROGRESS,
-                            "lastUpdatedAt": datetime.now(),
-                            "remarks": "N8N workflow triggered successfully"
-                        }
-                    }
-                )
-                
-                return N8NTriggerResponse(
-                    workflow_triggered=True,
-                    workflow_id=response.headers.get("X-Workflow-ID"),
-                    message="N8N workflow triggered successfully"
-                )
-            else:
-                raise Exception(f"N8N webhook failed: {response.status_code}")
+
+        message = "N8N workflow queued for delivery" if outcome == "queued" else "N8N workflow queued again after a failed delivery"
+        await progress_writer.update(req.request_id, {
+            "status": RequestStatus.IN_PROGRESS,
+            "lastUpdatedAt": datetime.now(),
+            "remarks": message
+        }, wait=True)
+        
+        return N8NTriggerResponse(
+            workflow_triggered=True,
+            workflow_id=None,
+            message=message
+        )
                 
     except Exception as e:
-        await db["requestProgress"].update_one(
-            {"requestId": req.request_id},
-            {
-                "$set": {
-                    "status": RequestStatus.FAILED,
-                    "lastUpdatedAt": datetime.now(),
-                    "remarks": f"N8N trigger failed: {str(e)}"
-                }
-            }
-        )
+        await progress_writer.update(req.request_id, {
+            "status": RequestStatus.FAILED,
+            "lastUpdatedAt": datetime.now(),
+            "remarks": f"N8N trigger failed: {str(e)}"
+        }, wait=True)
         return N8NTriggerResponse(
             workflow_triggered=False,
             workflow_id=None,
@@ -489,22 +382,17 @@ async def get_request_status(request_id: str):
     TOOL 6: Get current status of any request
     Allows agent to check progress and status
     """
-    db = get_db()
-    
     try:
-        request_progress = await db["requestProgress"].find_one({"requestId": request_id})
+        request_progress = await request_cache.get("status", request_id)
         if not request_progress:
             raise HTTPException(status_code=404, detail="Request not found")
         
-        # Get user actions if any
-        user_actions = await db["priorAuthUserAction"].find({"requestId": request_id}).to_list(None)
-        
         return {
             "request_id": request_id,
             "status": request_progress["status"],
             "last_updated": request_progress["lastUpdatedAt"],
             "remarks": request_progress.get("remarks", ""),
-            "user_actions_pending": len([a for a in user_actions if a.get("actionStatus") == "PENDING"]),
+            "user_actions_pending": request_progress.get("pendingActions", 0),
             "workflow_step": request_progress.get("workflowStep"),
             "metadata": request_progress.get("metadata", {})
         }
@@ -532,8 +420,8 @@ async def handle_user_action_response(req: UserActionResponse):
     db = get_db()
     
     try:
-        # Update user action status
-        result = await db["priorAuthUserAction"].update_one(
+        # Update user action status (returns the action as it was before)
+        previous = await db["priorAuthUserAction"].find_one_and_update(
             {"id": req.action_id, "requestId": req.request_id},
             {
                 "$set": {
@@ -541,23 +429,19 @@ async def handle_user_action_response(req: UserActionResponse):
                     "actionedAt": datetime.now(),
                     "metadata": json.dumps(req.response_data)
                 }
-            }
+            },
+            projection={"actionStatus": 1}
         )
         
-        if result.modified_count == 0:
+        if previous is None:
             raise HTTPException(status_code=404, detail="User action not found")
         
         # Update request status to resume processing
-        await db["requestProgress"].update_one(
-            {"requestId": req.request_id},
-            {
-                "$set": {
-                    "status": RequestStatus.PROCESSING,
-                    "lastUpdatedAt": datetime.now(),
-                    "remarks": "User action completed - ready to resume"
-                }
-            }
-        )
+        await progress_writer.update(req.request_id, {
+            "status": RequestStatus.PROCESSING,
+            "lastUpdatedAt": datetime.now(),
+            "remarks": "User action completed - ready to resume"
+        }, inc={"pendingActions": -1} if previous.get("actionStatus") == "PENDING" else None, wait=True)
         
         return {
             "success": True,
@@ -592,11 +476,9 @@ async def update_request_status(req: UpdateRequestStatusRequest):
     TOOL 8: Update request progress status
     Allows updating the status of any request by request ID
     """
-    db = get_db()
-    
     try:
         # First, get the current request to check if it exists and get old status
-        current_request = await db["requestProgress"].find_one({"requestId": req.request_id})
+        current_request = await progress_writer.read(req.request_id)
         
         if not current_request:
             raise HTTPException(status_code=404, detail=f"Request {req.request_id} not found")
@@ -615,12 +497,9 @@ async def update_request_status(req: UpdateRequestStatusRequest):
         else:
             update_data["remarks"] = f"Status updated from {old_status} to {req.status}"
         
-        result = await db["requestProgress"].update_one(
-            {"requestId": req.request_id},
-            {"$set": update_data}
-        )
-        
-        if result.modified_count == 0:
+        try:
+            await progress_writer.update(req.request_id, update_data, wait=True)
+        except Exception:
             raise HTTPException(status_code=400, detail="Failed to update request status")
         
         return UpdateRequestStatusResponse(
@@ -5,6 +5,7 @@ from pydantic import BaseModel, Field
 
 from db.config.connection import get_db
 from db.models.dbmodels.utility.httpResponseEnum import HttpResponseEnum
+from services.progress_writer import progress_writer
 
 router = APIRouter()
 
@@ -49,19 +50,13 @@ async def get_dashboard_stats(
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
         
-        # Get all requests in the time period
-        requests_cursor = db["requestProgress"].find({
-            "lastUpdatedAt": {"$gte": start_date, "$lte": end_date}
-        })
-        requests = await requests_cursor.to_list(None)
-        
-        total_requests = len(requests)
-        
-        # Count by status
-        status_counts = {}
-        for request in requests:
-            status = request.get("status", "UNKNOWN")
-            status_counts[status] = status_counts.get(status, 0) + 1
+        # Count requests in the time period by status
+        status_groups = await db["requestSummary"].aggregate([
+            {"$match": {"lastUpdatedAt": {"$gte": start_date, "$lte": end_date}}},
+            {"$group": {"_id": {"$toUpper": {"$ifNull": ["$status", "UNKNOWN"]}}, "count": {"$sum": 1}}}
+        ]).to_list(None)
+        status_counts = {group["_id"]: group["count"] for group in status_groups}
+        total_requests = sum(status_counts.values())
         
         pending_requests = status_counts.get("IN_PROGRESS", 0) + status_counts.get("PROCESSING", 0)
         completed_requests = status_counts.get("COMPLETED", 0)
@@ -97,46 +92,28 @@ async def get_recent_requests(
     db = get_db()
     
     try:
-        # Build query filter
-        query_filter = {}
+        # Build query filter (only requests that have both progress and request details)
+        query_filter = {"progressDocId": {"$ne": None}, "requestDocId": {"$ne": None}}
         if status:
             query_filter["status"] = status
+        if user_id:
+            query_filter["userId"] = user_id
         
-        # Get request progress data
-        progress_cursor = db["requestProgress"].find(query_filter).sort([("lastUpdatedAt", -1)]).limit(limit)
-        progress_data = await progress_cursor.to_list(None)
+        summaries = await db["requestSummary"].find(query_filter).sort([("lastUpdatedAt", -1)]).limit(limit).to_list(None)
         
-        results = []
-        for progress in progress_data:
-            request_id = progress["requestId"]
-            
-            # Get original request details
-            original_request = await db["priorAuthRequest"].find_one({"requestId": request_id})
-            if not original_request:
-                continue
-            
-            # Filter by user_id if specified
-            if user_id and original_request.get("userId") != user_id:
-                continue
-            
-            # Count pending user actions
-            user_actions_count = await db["priorAuthUserAction"].count_documents({
-                "requestId": request_id,
-                "actionStatus": "PENDING"
-            })
-            
-            results.append(RequestSummary(
-                request_id=request_id,
-                patient_name=original_request.get("patientName", "Unknown"),
-                payer_id=original_request.get("payerId", "Unknown"),
-                status=progress.get("status", "UNKNOWN"),
-                created_at=original_request.get("createdAt"),
-                last_updated=progress.get("lastUpdatedAt"),
-                current_step=progress.get("workflowStep"),
-                user_actions_pending=user_actions_count
-            ))
-        
-        return results
+        return [
+            RequestSummary(
+                request_id=summary["requestId"],
+                patient_name=summary.get("patientName") or "Unknown",
+                payer_id=summary.get("payerId") or "Unknown",
+                status=summary.get("status") or "UNKNOWN",
+                created_at=summary.get("createdAt"),
+                last_updated=summary.get("lastUpdatedAt"),
+                current_step=summary.get("workflowStep"),
+                user_actions_pending=summary.get("pendingActions", 0)
+            )
+            for summary in summaries
+        ]
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -161,18 +138,21 @@ async def get_pending_user_actions(
         actions_cursor = db["priorAuthUserAction"].find(query_filter).sort([("requestedAt", -1)]).limit(limit)
         actions = await actions_cursor.to_list(None)
         
+        # Get patient names from the request summaries in one query
+        request_ids = list({action["requestId"] for action in actions})
+        summaries = await db["requestSummary"].find(
+            {"requestId": {"$in": request_ids}}, {"requestId": 1, "patientName": 1}
+        ).to_list(None)
+        patient_names = {summary["requestId"]: summary.get("patientName") for summary in summaries}
+        
         results = []
         for action in actions:
             request_id = action["requestId"]
             
-            # Get patient name from original request
-            original_request = await db["priorAuthRequest"].find_one({"requestId": request_id})
-            patient_name = original_request.get("patientName", "Unknown") if original_request else "Unknown"
-            
             results.append(UserActionSummary(
                 action_id=action["id"],
                 request_id=request_id,
-                patient_name=patient_name,
+                patient_name=patient_names.get(request_id) or "Unknown",
                 action_type=action["actionType"],
                 action_status=action["actionStatus"],
                 requested_at=action["requestedAt"],
@@ -283,7 +263,7 @@ async def get_payer_statistics(
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
         
-        # Aggregate requests by payer
+        # Count requests by payer and status
         pipeline = [
             {
                 "$match": {
@@ -292,32 +272,23 @@ async def get_payer_statistics(
             },
             {
                 "$group": {
-                    "_id": "$payerId",
-                    "total_requests": {"$sum": 1},
-                    "requests": {"$push": "$requestId"}
+                    "_id": {"payerId": "$payerId", "status": {"$toUpper": "$status"}},
+                    "count": {"$sum": 1}
                 }
             }
         ]
         
-        payer_groups = await db["priorAuthRequest"].aggregate(pipeline).to_list(None)
+        status_groups = await db["requestSummary"].aggregate(pipeline).to_list(None)
+        payer_groups: Dict[str, Dict[str, int]] = {}
+        for group in status_groups:
+            status_counts = payer_groups.setdefault(group["_id"].get("payerId"), {})
+            status_counts[group["_id"].get("status") or "UNKNOWN"] = group["count"]
         
-        # Get status information for each payer's requests
         payer_stats = []
-        for group in payer_groups:
-            payer_id = group["_id"]
-            request_ids = group["requests"]
-            
-            # Get status counts for this payer's requests
-            status_counts = {}
-            for request_id in request_ids:
-                progress = await db["requestProgress"].find_one({"requestId": request_id})
-                if progress:
-                    status = progress.get("status", "UNKNOWN")
-                    status_counts[status] = status_counts.get(status, 0) + 1
-            
+        for payer_id, status_counts in payer_groups.items():
             # Calculate success rate
             completed = status_counts.get("COMPLETED", 0)
-            total = group["total_requests"]
+            total = sum(status_counts.values())
             success_rate = (completed / total * 100) if total > 0 else 0
             
             payer_stats.append({
@@ -347,8 +318,8 @@ async def mark_user_action_completed(action_id: str, response_data: Dict[str, An
     db = get_db()
     
     try:
-        # Update the user action
-        result = await db["priorAuthUserAction"].update_one(
+        # Update the user action (returns the action as it was before)
+        previous = await db["priorAuthUserAction"].find_one_and_update(
             {"id": action_id},
             {
                 "$set": {
@@ -356,12 +327,19 @@ async def mark_user_action_completed(action_id: str, response_data: Dict[str, An
                     "actionedAt": datetime.now(),
                     "metadata": response_data.get("metadata", "")
                 }
-            }
+            },
+            projection={"requestId": 1, "actionStatus": 1}
         )
         
-        if result.modified_count == 0:
+        if previous is None:
             raise HTTPException(status_code=404, detail="User action not found")
         
+        await progress_writer.update(
+            previous["requestId"],
+            inc={"pendingActions": -1} if previous.get("actionStatus") == "PENDING" else None,
+            wait=True
+        )
+        
         return {
             "success": True,
             "message": "User action marked as completed",
@@ -0,0 +1,39 @@
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Request
+
+from services.document_store import DocumentTooLarge, document_store
+
+router = APIRouter()
+
+
+@router.put("/documents/{request_id}/{name}")
+async def upload_document(request_id: str, name: str, request: Request, content_type: Optional[str] = Header(None)):
+    """
+    Stage a supporting document for a request; the body is the raw file.
+    The body is streamed to disk, so large PDFs are never held in memory.
+    Uploading the same name again replaces the document.
+    """
+    try:
+        return await document_store.stage_stream(request_id, name, request.stream(), content_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DocumentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+@router.get("/documents/{request_id}/manifest")
+async def get_document_manifest(request_id: str):
+    """Documents staged for a request, as browser-use-backend sees them"""
+    manifest = await document_store.manifest(request_id)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="No documents staged for this request")
+    return manifest
+
+
+@router.delete("/documents/{request_id}")
+async def delete_documents(request_id: str):
+    """Remove every document staged for a request"""
+    if not await document_store.remove(request_id):
+        raise HTTPException(status_code=404, detail="No documents staged for this request")
+    return {"message": "Documents removed", "request_id": request_id}
@@ -1,105 +1,90 @@
 import json
+import os
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Response
 from pydantic import BaseModel, Field
 
 from db.config.connection import get_db
 from db.models.dbmodels.requestProgress import RequestStatus
 from db.models.dbmodels.priorAuthUserAction import priorAuthUserAction
 from db.models.dbmodels.utility.httpResponseEnum import HttpResponseEnum
+from db.models.requestModels.n8nCallbackRequest import N8NCallbackRequest
+from services.callback_ingest import apply_callbacks
+from services.callback_queue import N8N_CALLBACK_MODE, callback_queue
+from services.progress_writer import progress_writer
+from services.request_cache import request_cache
 import uuid
 
 router = APIRouter()
 
-class N8NCallbackRequest(BaseModel):
-    request_id: str = Field(..., description="Request ID from the original preauth request")
-    status: str = Field(..., description="Status update from N8N workflow")
-    action_type: Optional[str] = Field(None, description="Type of action required from user")
-    message: str = Field(..., description="Message or description of the update")
-    metadata: Optional[Dict[str, Any]] = Field(None, description="Additional metadata from N8N")
-    screenshot_url: Optional[str] = Field(None, description="URL of screenshot if available")
-    user_action_required: bool = Field(False, description="Whether user action is required")
-    workflow_step: Optional[str] = Field(None, description="Current workflow step")
+N8N_CALLBACK_BATCH_MAX = int(os.getenv("N8N_CALLBACK_BATCH_MAX", "500"))
 
 class N8NCallbackResponse(BaseModel):
     success: bool = Field(..., description="Whether the callback was processed successfully")
     message: str = Field(..., description="Response message")
     http_status: HttpResponseEnum
 
+class N8NCallbackBatchRequest(BaseModel):
+    callbacks: List[N8NCallbackRequest] = Field(..., description="Callbacks in the order n8n produced them")
+
+class N8NCallbackResult(BaseModel):
+    index: int = Field(..., description="Position of the callback in the batch")
+    request_id: str
+    idempotency_key: Optional[str] = None
+    status: str = Field(..., description="applied, duplicate or failed")
+    action_id: Optional[str] = Field(None, description="ID of the user action the callback created")
+    error: Optional[str] = None
+
+class N8NCallbackBatchResponse(BaseModel):
+    success: bool = Field(..., description="Whether every callback was applied or already had been")
+    applied: int = 0
+    duplicate: int = 0
+    failed: int = 0
+    queued: int = Field(0, description="Callbacks accepted for background processing (async mode)")
+    results: List[N8NCallbackResult] = []
+    http_status: HttpResponseEnum
+
 @router.post("/n8n/callback", response_model=N8NCallbackResponse)
-async def n8n_callback(req: N8NCallbackRequest):
+async def n8n_callback(req: N8NCallbackRequest, response: Response, idempotency_key: Optional[str] = Header(None)):
     """
     Callback endpoint for N8N to send updates back to the system.
     This endpoint handles various status updates and user action requests from N8N workflow.
+    A callback with an idempotency key (body field or Idempotency-Key header) is applied once.
+    With N8N_CALLBACK_MODE=async the callback is queued and acknowledged with 202.
     """
-    db = get_db()
+    if idempotency_key and not req.idempotency_key:
+        req = req.model_copy(update={"idempotency_key": idempotency_key})
     
-    try:
-        # Map N8N status to internal request status
-        status_mapping = {
-            "in_progress": RequestStatus.IN_PROGRESS,
-            "waiting_for_user": RequestStatus.USER_ACTION_REQUIRED,
-            "completed": RequestStatus.COMPLETED,
-            "failed": RequestStatus.FAILED,
-            "paused": RequestStatus.USER_ACTION_REQUIRED,
-            "success": RequestStatus.COMPLETED,
-            "error": RequestStatus.FAILED
-        }
-        
-        internal_status = status_mapping.get(req.status.lower(), RequestStatus.IN_PROGRESS)
-        
-        # Update request progress
-        await db["requestProgress"].update_one(
-            {"requestId": req.request_id},
-            {
-                "$set": {
-                    "status": internal_status,
-                    "lastUpdatedAt": datetime.now(),
-                    "remarks": f"N8N Update: {req.message}",
-                    "workflowStep": req.workflow_step,
-                    "metadata": req.metadata or {}
-                }
-            }
+    if N8N_CALLBACK_MODE == "async":
+        await callback_queue.enqueue([req])
+        response.status_code = 202
+        return N8NCallbackResponse(
+            success=True,
+            message="Callback queued",
+            http_status=HttpResponseEnum.ACCEPTED
         )
-        
-        # If user action is required, create a user action record
-        if req.user_action_required and req.action_type:
-            # Get the original request to find user_id
-            original_request = await db["priorAuthRequest"].find_one({"requestId": req.request_id})
-            if original_request:
-                user_action = priorAuthUserAction(
-                    id=uuid.uuid4().hex,
-                    requestId=req.request_id,
-                    userId=original_request["userId"],
-                    actionType=req.action_type,
-                    actionStatus="PENDING",
-                    requestedAt=datetime.now(),
-                    actionedAt=datetime.now(),
-                    metadata=req.screenshot_url or json.dumps(req.metadata or {})
-                )
-                await db["priorAuthUserAction"].insert_one(user_action.dict())
+    
+    try:
+        result = (await apply_callbacks([req]))[0]
+        if result["status"] == "failed":
+            raise Exception(result["error"])
         
         return N8NCallbackResponse(
             success=True,
-            message="Callback processed successfully",
+            message="Callback already processed" if result["status"] == "duplicate" else "Callback processed successfully",
             http_status=HttpResponseEnum.OK
         )
         
     except Exception as e:
         # Update request with error status
         try:
-            await db["requestProgress"].update_one(
-                {"requestId": req.request_id},
-                {
-                    "$set": {
-                        "status": RequestStatus.FAILED,
-                        "lastUpdatedAt": datetime.now(),
-                        "remarks": f"Callback processing error: {str(e)}"
-                    }
-                }
-            )
+            await progress_writer.update(req.request_id, {
+                "status": RequestStatus.FAILED,
+                "lastUpdatedAt": datetime.now(),
+                "remarks": f"Callback processing error: {str(e)}"
+            }, wait=True)
         except:
             pass  # Don't fail if we can't update the status
             
@@ -109,13 +94,44 @@ async def n8n_callback(req: N8NCallbackRequest):
             http_status=HttpResponseEnum.INTERNAL_SERVER_ERROR
         )
 
+@router.post("/n8n/callbacks/batch", response_model=N8NCallbackBatchResponse)
+async def n8n_callback_batch(req: N8NCallbackBatchRequest, response: Response):
+    """
+    Apply many N8N callbacks in one call with bulk writes.
+    Callbacks of the same request are applied in array order; each gets its own result.
+    With N8N_CALLBACK_MODE=async they are queued and acknowledged with 202 instead.
+    """
+    if len(req.callbacks) > N8N_CALLBACK_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {N8N_CALLBACK_BATCH_MAX} callbacks per batch")
+    
+    if N8N_CALLBACK_MODE == "async":
+        if req.callbacks:
+            await callback_queue.enqueue(req.callbacks)
+        response.status_code = 202
+        return N8NCallbackBatchResponse(
+            success=True,
+            queued=len(req.callbacks),
+            http_status=HttpResponseEnum.ACCEPTED
+        )
+    
+    try:
+        results = await apply_callbacks(req.callbacks)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    counts = {status: sum(result["status"] == status for result in results) for status in ("applied", "duplicate", "failed")}
+    return N8NCallbackBatchResponse(
+        success=counts["failed"] == 0,
+        results=[N8NCallbackResult(**result) for result in results],
+        http_status=HttpResponseEnum.OK,
+        **counts
+    )
+
 @router.post("/n8n/workflow-status/{request_id}")
 async def update_workflow_status(request_id: str, status_data: Dict[str, Any]):
     """
     Endpoint for N8N to update workflow status with detailed information
     """ 
-    db = get_db()
-    
     try:
         # Update the request progress with workflow-specific data
         update_data = {
@@ -136,10 +152,7 @@ async def update_workflow_status(request_id: str, status_data: Dict[str, Any]):
         if "message" in status_data:
             update_data["remarks"] = f"Workflow: {status_data['message']}"
         
-        await db["requestProgress"].update_one(
-            {"requestId": request_id},
-            {"$set": update_data}
-        )
+        await progress_writer.update(request_id, update_data, wait=True)
         
         return {
             "success": True,
@@ -177,16 +190,11 @@ async def save_screenshot(request_id: str, screenshot_data: Dict[str, Any]):
         await db["priorAuthUserAction"].insert_one(user_action.dict())
         
         # Also update the request progress
-        await db["requestProgress"].update_one(
-            {"requestId": request_id},
-            {
-                "$set": {
-                    "lastUpdatedAt": datetime.now(),
-                    "remarks": "Screenshot captured",
-                    "latestScreenshot": screenshot_data.get("screenshot_url")
-                }
-            }
-        )
+        await progress_writer.update(request_id, {
+            "lastUpdatedAt": datetime.now(),
+            "remarks": "Screenshot captured",
+            "latestScreenshot": screenshot_data.get("screenshot_url")
+        }, wait=True)
         
         return {
             "success": True,
@@ -202,19 +210,12 @@ async def get_workflow_info(request_id: str):
     """
     Endpoint for N8N to get information about a specific workflow/request
     """    
-    db = get_db()
-    
     try:
-        # Get request progress
-        request_progress = await db["requestProgress"].find_one({"requestId": request_id})
-        if not request_progress:
+        # Request progress, original request details and user actions
+        snapshot = await request_cache.get("workflow", request_id)
+        if not snapshot:
             raise HTTPException(status_code=404, detail="Request not found")
-        
-        # Get original request details
-        original_request = await db["priorAuthRequest"].find_one({"requestId": request_id})
-        
-        # Get user actions
-        user_actions = await db["priorAuthUserAction"].find({"requestId": request_id}).to_list(None)
+        request_progress = snapshot["progress"]
         
         return {
             "request_id": request_id,
@@ -222,8 +223,8 @@ async def get_workflow_info(request_id: str):
             "workflow_step": request_progress.get("workflowStep"),
             "last_updated": request_progress.get("lastUpdatedAt"),
             "remarks": request_progress.get("remarks"),
-            "original_request": original_request,
-            "user_actions": user_actions,
+            "original_request": snapshot["original_request"],
+            "user_actions": snapshot["user_actions"],
             "metadata": request_progress.get("metadata", {}),
             "http_status": HttpResponseEnum.OK
         }
@@ -240,18 +241,13 @@ async def complete_workflow(request_id: str, completion_data: Dict[str, Any]):
     
     try:
         # Update request progress to completed
-        await db["requestProgress"].update_one(
-            {"requestId": request_id},
-            {
-                "$set": {
-                    "status": RequestStatus.COMPLETED,
-                    "lastUpdatedAt": datetime.now(),
-                    "remarks": f"Workflow completed: {completion_data.get('message', 'Success')}",
-                    "completionData": completion_data,
-                    "completedAt": datetime.now()
-                }
-            }
-        )
+        await progress_writer.update(request_id, {
+            "status": RequestStatus.COMPLETED,
+            "lastUpdatedAt": datetime.now(),
+            "remarks": f"Workflow completed: {completion_data.get('message', 'Success')}",
+            "completionData": completion_data,
+            "completedAt": datetime.now()
+        }, wait=True)
         
         # Create a completion user action record
         original_request = await db["priorAuthRequest"].find_one({"requestId": request_id})
@@ -267,6 +263,7 @@ async def complete_workflow(request_id: str, completion_data: Dict[str, Any]):
                 metadata=json.dumps(completion_data)
             )
             await db["priorAuthUserAction"].insert_one(user_action.dict())
+            await request_cache.invalidate(request_id)
         
         return {
             "success": True,
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException
+
+from db.models.requestModels.patientBatchRequest import PatientBatchRequest
+from services.patient_source import PATIENT_BATCH_MAX, patient_directory
+from services.resilience import DependencyUnavailable
+
+router = APIRouter()
+
+
+@router.post("/patients/batch")
+async def prefetch_patients(req: PatientBatchRequest):
+    """
+    Load a worklist of patients in one round trip.
+    Patients not already cached are fetched from the source in a single call
+    and kept, so the get-patient-details calls that follow are cache hits.
+    """
+    if len(req.patient_ids) > PATIENT_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {PATIENT_BATCH_MAX} patients per batch")
+    try:
+        patients = await patient_directory.get_many(req.patient_ids)
+    except DependencyUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, int(e.retry_after)))})
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Patient source failed: {e}")
+    return {
+        "patients": patients,
+        "missing": [patient_id for patient_id in dict.fromkeys(req.patient_ids) if patient_id not in patients],
+    }
@@ -0,0 +1,59 @@
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from typing import Optional
+
+from db.models.dbmodels.priorAuthPayers import PriorAuthPayers
+from db.models.dbmodels.utility.httpResponseEnum import HttpResponseEnum
+from services.payer_catalog import payer_catalog
+
+router = APIRouter()
+
+
+@router.get("/payers/catalog")
+async def get_payer_catalog(if_none_match: Optional[str] = Header(None)):
+    """
+    Every payer, with the catalog version as ETag.
+    Send it back in If-None-Match to get a 304 while the catalog is unchanged.
+    """
+    snapshot = payer_catalog.snapshot
+    etag = f'"{snapshot.version}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(
+        content=jsonable_encoder({"version": snapshot.version, "payers": snapshot.payers()}),
+        headers={"ETag": etag}
+    )
+
+
+@router.get("/payers/catalog/version")
+async def get_payer_catalog_version():
+    """Current catalog version, for clients that only want to know whether to reload"""
+    snapshot = payer_catalog.snapshot
+    return {"version": snapshot.version, "payers": len(snapshot.by_id), "loaded_at": snapshot.loaded_at}
+
+
+@router.get("/payers/resolve")
+async def resolve_payer_name(name: str = Query(..., description="Payer name as the user wrote it")):
+    """Resolve a payer name to its id"""
+    payer_id = payer_catalog.resolve_name(name)
+    if payer_id is None:
+        raise HTTPException(status_code=404, detail=f"No payer named {name}")
+    return {"payer_id": payer_id, "version": payer_catalog.snapshot.version}
+
+
+@router.put("/payers/{payer_id}")
+async def save_payer(payer_id: str, payer: PriorAuthPayers):
+    """Admin: create or replace a payer; the catalog is reloaded before this returns"""
+    if payer.id != payer_id:
+        raise HTTPException(status_code=400, detail="Payer id in the body does not match the URL")
+    snapshot = await payer_catalog.save(payer.model_dump())
+    return {"success": True, "version": snapshot.version, "http_status": HttpResponseEnum.OK}
+
+
+@router.delete("/payers/{payer_id}")
+async def delete_payer(payer_id: str):
+    """Admin: remove a payer; the catalog is reloaded before this returns"""
+    if not await payer_catalog.remove(payer_id):
+        raise HTTPException(status_code=404, detail="Payer not found")
+    return {"success": True, "version": payer_catalog.snapshot.version, "http_status": HttpResponseEnum.OK}
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 from datetime import datetime
@@ -5,8 +6,9 @@ from datetime import datetime
 from jsonschema import validate, ValidationError
 from fastapi import APIRouter, HTTPException
 
-from db.config.connection import get_db
+from services.payer_catalog import payer_catalog
 from db.models.dbmodels.requestProgress import RequestStatus
+from services.progress_writer import progress_writer
 from db.models.requestModels.validationRequest import ValidationRequest
 from db.models.requestModels.jsonValidatorRequest import JsonValidatorRequest
 from db.models.responseModels.jsonValidatorResponse import JsonValidatorResponse
@@ -41,7 +43,7 @@ async def validate_json_payload(req: JsonValidatorRequest):
     """
     try:
         # Load validation rules
-        all_rules = load_validation_rules()
+        all_rules = await asyncio.to_thread(load_validation_rules)
         
         # Extract payer ID from the JSON data
         payer_id = get_payer_id_from_json(req.json_data)
@@ -94,33 +96,22 @@ async def validate_json_payload(req: JsonValidatorRequest):
 @router.post("/payers/{payer_id}/validate")
 async def validate_payer(req:ValidationRequest):
 
-    db = get_db()
     try:
 
-        payer = await db.collections("priorAuthPayers").find_one({"id": req.payer_id})
+        payer = payer_catalog.get(req.payer_id)
         if payer:
-            await db["requestProgress"].update_one(
-                {"requestId": req.request_id},
-                {
-                    "$set": {
-                        "status": RequestStatus.VALIDATED,
-                        "lastUpdatedAt": datetime.now(),
-                        "remarks": "Payer info reterived successfully"
-                    }
-                }
-            )
+            await progress_writer.update(req.request_id, {
+                "status": RequestStatus.VALIDATED,
+                "lastUpdatedAt": datetime.now(),
+                "remarks": "Payer info reterived successfully"
+            }, wait=True)
             return {"status": HttpResponseEnum.OK, "message": "Payer validated successfully"}
         else:
             return {"status": HttpResponseEnum.NOT_FOUND, "message": "Payer not found"}
     except Exception as e:
-        await db["requestProgress"].update_one(
-            {"requestId": req.request_id},
-            {
-                "$set": {
-                    "status": RequestStatus.FAILED,
-                    "lastUpdatedAt": datetime.now(),
-                    "remarks": str(e)
-                }
-            }
-        )
+        await progress_writer.update(req.request_id, {
+            "status": RequestStatus.FAILED,
+            "lastUpdatedAt": datetime.now(),
+            "remarks": str(e)
+        }, wait=True)
         return {"status": HttpResponseEnum.INTERNAL_SERVER_ERROR, "message": str(e)}
@@ -20,6 +20,7 @@ class RequestProgress(BaseModel):
     status: RequestStatus = Field(..., description="Current status of the request")
     lastUpdatedAt: datetime = Field(..., description="Timestamp when the request was last updated")
     remarks: Optional[str] = Field(None, description="Remarks or comments related to the request")  
+    pendingActions: int = Field(0, description="Number of user actions still PENDING, maintained with $inc")
     
     class Config:
         allow_population_by_field_name = True
@@ -0,0 +1,17 @@
+from pydantic import BaseModel, Field
+from typing import Any, Optional
+from datetime import datetime
+
+class RequestSummary(BaseModel):
+    """One document per request, maintained from change streams by services/request_summary.py"""
+    requestId: str = Field(..., description="Unique identifier for the request")
+    userId: Optional[str] = Field(None, description="ID of the user who made the request (priorAuthRequest)")
+    patientName: Optional[str] = Field(None, description="Name of the patient (priorAuthRequest)")
+    payerId: Optional[str] = Field(None, description="ID of the payer (priorAuthRequest)")
+    status: Optional[str] = Field(None, description="Current status of the request (requestProgress)")
+    workflowStep: Optional[str] = Field(None, description="Current workflow step (requestProgress)")
+    pendingActions: int = Field(0, description="Number of user actions still PENDING (requestProgress)")
+    createdAt: Optional[datetime] = Field(None, description="Timestamp when the request was created (priorAuthRequest)")
+    lastUpdatedAt: Optional[datetime] = Field(None, description="Timestamp of the last progress update (requestProgress)")
+    progressDocId: Any = Field(None, description="_id of the source requestProgress document")
+    requestDocId: Any = Field(None, description="_id of the source priorAuthRequest document")
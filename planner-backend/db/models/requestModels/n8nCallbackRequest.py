@@ -0,0 +1,13 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional
+
+class N8NCallbackRequest(BaseModel):
+    request_id: str = Field(..., description="Request ID from the original preauth request")
+    status: str = Field(..., description="Status update from N8N workflow")
+    action_type: Optional[str] = Field(None, description="Type of action required from user")
+    message: str = Field(..., description="Message or description of the update")
+    metadata: Optional[Dict[str, Any]] = Field(None, description="Additional metadata from N8N")
+    screenshot_url: Optional[str] = Field(None, description="URL of screenshot if available")
+    user_action_required: bool = Field(False, description="Whether user action is required")
+    workflow_step: Optional[str] = Field(None, description="Current workflow step")
+    idempotency_key: Optional[str] = Field(None, description="Unique per callback; retries with the same key are applied once")
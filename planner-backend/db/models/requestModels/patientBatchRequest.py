@@ -0,0 +1,5 @@
+from pydantic import BaseModel, Field
+from typing import List
+
+class PatientBatchRequest(BaseModel):
+    patient_ids: List[str] = Field(..., description="Patient IDs to load, e.g. a day's worklist")
@@ -5,7 +5,20 @@ from api.validate_json import router as validate_json_router
 from api.n8n_callback_api import router as n8n_callback_router
 from api.dashboard_api import router as dashboard_router
 from api.agent_tools import router as agent_tools_router
+from api.payer_api import router as payer_router
+from api.patient_api import router as patient_router
+from api.document_api import router as document_router
 from db.config.connection import init_db
+from services.callback_ingest import ensure_callback_indexes
+from services.callback_queue import N8N_CALLBACK_DRAIN_SECONDS, callback_queue
+from services.document_store import document_store
+from services.n8n_outbox import n8n_outbox
+from services.patient_source import patient_directory
+from services.payer_catalog import payer_catalog
+from services.progress_writer import progress_writer
+from services.request_cache import backfill_pending_actions, request_cache
+from services.request_summary import request_summary_tailer
+from services.resilience import dependency_status
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -13,9 +26,29 @@ async def lifespan(app: FastAPI):
     print("Starting up...")
     init_db()
     print("Database initialized...")
+    await ensure_callback_indexes()
+    print(f"pendingActions backfilled on {await backfill_pending_actions()} request(s)")
+    await payer_catalog.start()
+    print(f"Payer catalog loaded, version {payer_catalog.snapshot.version}")
+    await patient_directory.start()
+    await document_store.start()
+    progress_writer.on_change = request_cache.invalidate
+    await request_cache.start()
+    await progress_writer.start()
+    await request_summary_tailer.start()
+    await callback_queue.start()
+    await n8n_outbox.start()
     yield
     # Code to run on shutdown
     print("Shutting down...")
+    await n8n_outbox.shutdown()
+    await callback_queue.shutdown(N8N_CALLBACK_DRAIN_SECONDS)
+    await request_summary_tailer.shutdown()
+    await progress_writer.shutdown()
+    await request_cache.shutdown()
+    await document_store.shutdown()
+    await patient_directory.shutdown()
+    await payer_catalog.shutdown()
 
 app = FastAPI(
     title="Preauth Agent APIs", 
@@ -38,12 +71,60 @@ app.include_router(agent_tools_router, prefix="/api", tags=["Agent Tools"])
 app.include_router(n8n_callback_router, prefix="/api", tags=["N8N Callbacks"])
 app.include_router(dashboard_router, prefix="/api", tags=["Dashboard"])
 app.include_router(validate_json_router, prefix="/api", tags=["Validation"])
+app.include_router(payer_router, prefix="/api", tags=["Payers"])
+app.include_router(patient_router, prefix="/api", tags=["Patients"])
+app.include_router(document_router, prefix="/api", tags=["Documents"])
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "message": "Preauth Agent APIs are running"}
 
+@app.get("/metrics/progress-writes")
+async def progress_write_metrics():
+    """requestProgress updates received vs. Mongo operations actually issued"""
+    return progress_writer.stats()
+
+@app.get("/metrics/request-cache")
+async def request_cache_metrics():
+    """Hit rate of the request status / workflow-info snapshot cache"""
+    return request_cache.stats()
+
+@app.get("/metrics/payer-catalog")
+async def payer_catalog_metrics():
+    """Payer catalog version, size and lookups served from memory"""
+    return payer_catalog.stats()
+
+@app.get("/metrics/callback-queue")
+async def callback_queue_metrics():
+    """Queued n8n callbacks: depth, dead letters and age of the oldest one"""
+    return await callback_queue.stats()
+
+@app.get("/metrics/n8n-outbox")
+async def n8n_outbox_metrics():
+    """n8n webhook deliveries by state, age of the oldest pending one and retry counts"""
+    return await n8n_outbox.stats()
+
+@app.get("/metrics/request-summary")
+async def request_summary_metrics():
+    """requestSummary tailer mode, events applied and replication lag"""
+    return request_summary_tailer.stats()
+
+@app.get("/metrics/patients")
+async def patient_metrics():
+    """Patient source in use and hit rate of the patient cache"""
+    return patient_directory.stats()
+
+@app.get("/metrics/documents")
+async def document_metrics():
+    """Documents staged, deduplicated by content and removed by the cleanup policy"""
+    return document_store.stats()
+
+@app.get("/metrics/dependencies")
+async def dependency_metrics():
+    """Circuit breaker state, concurrency limit and shed calls per downstream dependency"""
+    return dependency_status()
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
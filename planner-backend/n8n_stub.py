@@ -0,0 +1,88 @@
+"""
+Local stand-in for the n8n preauth webhook, for testing the n8n outbox
+Standard library only. Point planner-backend at it with
+N8N_WEBHOOK_URL=http://host.docker.internal:5678/webhook/preauth
+
+    python n8n_stub.py --port 5678 --fail-rate 0.3 --delay 2
+
+Every POST is answered 200 with an X-Workflow-ID header, or 503 for a
+--fail-rate share of them. Deliveries repeating an Idempotency-Key that was
+already answered 200 are counted as duplicates. GET /stats returns the counts.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+stats = {"received": 0, "accepted": 0, "failed": 0, "duplicates": 0}
+accepted_keys = set()
+lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    fail_rate = 0.0
+    delay = 0.0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        key = self.headers.get("Idempotency-Key")
+        time.sleep(self.delay)
+        with lock:
+            stats["received"] += 1
+            if random.random() < self.fail_rate:
+                stats["failed"] += 1
+                status = 503
+            else:
+                stats["accepted"] += 1
+                if key in accepted_keys:
+                    stats["duplicates"] += 1
+                accepted_keys.add(key)
+                status = 200
+        try:
+            request_id = json.loads(body).get("requestId")
+        except ValueError:
+            request_id = None
+        print(f"{status} {self.path} requestId={request_id} key={key}")
+        self._reply(status, {"received": True} if status == 200 else {"error": "stub failure"})
+
+    def do_GET(self):
+        with lock:
+            self._reply(200, dict(stats))
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if status == 200 and self.command == "POST":
+            self.send_header("X-Workflow-ID", uuid.uuid4().hex)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local n8n webhook stub")
+    parser.add_argument("--port", type=int, default=5678)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of deliveries answered 503")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+    args = parser.parse_args()
+
+    StubHandler.fail_rate = args.fail_rate
+    StubHandler.delay = args.delay
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), StubHandler)
+    print(f"n8n stub listening on :{args.port} (fail rate {args.fail_rate}, delay {args.delay}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
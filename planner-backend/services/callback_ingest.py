@@ -0,0 +1,233 @@
+"""
+Applies n8n progress callbacks, one at a time or in batches.
+
+Used by POST /n8n/callback and POST /n8n/callbacks/batch. A batch costs one
+insert_many to claim idempotency keys, one find for the original requests,
+one bulk_write for user actions and one coalesced requestProgress update per
+request, however many callbacks it holds.
+
+Idempotency: a callback carrying an idempotency key is applied at most once.
+The key is claimed in n8nCallbackKeys (expired after
+N8N_CALLBACK_KEY_TTL_HOURS) before anything is written, and released again
+if applying the callback fails so n8n can retry it. The user action a keyed
+callback creates gets an id derived from the request id and the key and is
+written with $setOnInsert, so even a retry racing past the key check
+cannot create a second row.
+
+Ordering: callbacks of the same request are applied in the order they
+appear; their progress fields are merged with later values winning. Once a
+callback fails, the later callbacks of its request in the batch are failed
+too (held back), so a retry can never apply an older status over a newer
+one.
+"""
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from db.config.connection import get_db
+from db.models.dbmodels.priorAuthUserAction import priorAuthUserAction
+from db.models.dbmodels.requestProgress import RequestStatus
+from services.progress_writer import progress_writer
+
+logger = logging.getLogger(__name__)
+
+N8N_CALLBACK_KEY_TTL_HOURS = float(os.getenv("N8N_CALLBACK_KEY_TTL_HOURS", "24"))
+
+CALLBACK_KEYS = "n8nCallbackKeys"
+ACTION_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "preauth/n8n-callback")
+DUPLICATE_KEY = 11000
+
+# Map N8N status to internal request status
+N8N_STATUS_MAPPING = {
+    "in_progress": RequestStatus.IN_PROGRESS,
+    "waiting_for_user": RequestStatus.USER_ACTION_REQUIRED,
+    "completed": RequestStatus.COMPLETED,
+    "failed": RequestStatus.FAILED,
+    "paused": RequestStatus.USER_ACTION_REQUIRED,
+    "success": RequestStatus.COMPLETED,
+    "error": RequestStatus.FAILED
+}
+
+
+async def ensure_callback_indexes():
+    db = get_db()
+    await db[CALLBACK_KEYS].create_index("createdAt", expireAfterSeconds=int(N8N_CALLBACK_KEY_TTL_HOURS * 3600))
+    await db["priorAuthUserAction"].create_index("id", unique=True)
+
+
+def action_id_for(request_id: str, idempotency_key: Optional[str]) -> str:
+    if idempotency_key:
+        return uuid.uuid5(ACTION_ID_NAMESPACE, f"{request_id}:{idempotency_key}").hex
+    return uuid.uuid4().hex
+
+
+def progress_fields(callback) -> Dict[str, Any]:
+    return {
+        "status": N8N_STATUS_MAPPING.get(callback.status.lower(), RequestStatus.IN_PROGRESS),
+        "lastUpdatedAt": datetime.now(),
+        "remarks": f"N8N Update: {callback.message}",
+        "workflowStep": callback.workflow_step,
+        "metadata": callback.metadata or {}
+    }
+
+
+async def apply_callbacks(callbacks: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Apply N8NCallbackRequest-shaped callbacks; returns one result per
+    callback, in order, with `status` "applied", "duplicate" or "failed".
+    """
+    db = get_db()
+    results = [
+        {"index": index, "request_id": callback.request_id, "idempotency_key": callback.idempotency_key,
+         "status": "applied", "action_id": None, "error": None}
+        for index, callback in enumerate(callbacks)
+    ]
+
+    claimed = await _claim_keys(callbacks, results)
+    _hold_back(callbacks, results)
+    done = set()
+    try:
+        await _apply(db, callbacks, results, done)
+    except BaseException:
+        # e.g. the database went away mid-batch: n8n must be able to retry every callback not written
+        await _release_keys([key for index, key in claimed.items() if index not in done])
+        raise
+
+    await _release_keys([claimed[index] for index, result in enumerate(results)
+                         if result["status"] == "failed" and index in claimed])
+    return results
+
+
+async def _apply(db, callbacks: List[Any], results: List[Dict[str, Any]], done: set):
+    """Write the live callbacks; `done` collects those whose progress update went through."""
+    live = [index for index, result in enumerate(results) if result["status"] == "applied"]
+
+    # User actions, one upsert each, for callbacks that ask for one
+    wanted = [index for index in live if callbacks[index].user_action_required and callbacks[index].action_type]
+    owners = {}
+    if wanted:
+        request_ids = list({callbacks[index].request_id for index in wanted})
+        originals = await db["priorAuthRequest"].find(
+            {"requestId": {"$in": request_ids}}, {"requestId": 1, "userId": 1}
+        ).to_list(None)
+        owners = {original["requestId"]: original["userId"] for original in originals}
+    upserts, upsert_items = [], []
+    for index in wanted:
+        callback = callbacks[index]
+        if callback.request_id not in owners:
+            continue
+        user_action = priorAuthUserAction(
+            id=action_id_for(callback.request_id, callback.idempotency_key),
+            requestId=callback.request_id,
+            userId=owners[callback.request_id],
+            actionType=callback.action_type,
+            actionStatus="PENDING",
+            requestedAt=datetime.now(),
+            actionedAt=datetime.now(),
+            metadata=callback.screenshot_url or json.dumps(callback.metadata or {})
+        )
+        upserts.append(UpdateOne({"id": user_action.id}, {"$setOnInsert": user_action.dict()}, upsert=True))
+        upsert_items.append(index)
+        results[index]["action_id"] = user_action.id
+
+    inserted = set()
+    if upserts:
+        try:
+            # ordered: nothing after a failed action is written, so held-back callbacks leave no rows behind
+            written = await db["priorAuthUserAction"].bulk_write(upserts, ordered=True)
+            upserted = written.upserted_ids
+        except BulkWriteError as e:
+            upserted = {item["index"]: item["_id"] for item in e.details.get("upserted", [])}
+            errors = e.details.get("writeErrors", [])
+            for error in errors:
+                _fail(results[upsert_items[error["index"]]], error.get("errmsg", "write failed"))
+            if errors:
+                for index in upsert_items[errors[0]["index"] + 1:]:
+                    _fail(results[index], "not written after an earlier user action failed")
+        inserted = {upsert_items[position] for position in upserted}
+        _hold_back(callbacks, results)
+
+    # One progress update per request: fields merged in callback order, new actions counted
+    updates: Dict[str, Dict[str, Any]] = {}
+    for index in live:
+        if results[index]["status"] != "applied":
+            continue
+        update = updates.setdefault(callbacks[index].request_id, {"fields": {}, "pending": 0, "items": []})
+        update["fields"].update(progress_fields(callbacks[index]))
+        update["pending"] += index in inserted
+        update["items"].append(index)
+    for request_id, update in updates.items():
+        try:
+            await progress_writer.update(
+                request_id, update["fields"],
+                inc={"pendingActions": update["pending"]} if update["pending"] else None,
+                wait=True
+            )
+        except Exception as e:
+            for index in update["items"]:
+                _fail(results[index], str(e))
+            continue
+        done.update(update["items"])
+
+
+def _fail(result: Dict[str, Any], error: str):
+    result["status"] = "failed"
+    result["error"] = error
+
+
+def _hold_back(callbacks: List[Any], results: List[Dict[str, Any]]):
+    """Fail every callback that follows a failed callback of the same request."""
+    failed = set()
+    for callback, result in zip(callbacks, results):
+        if result["status"] == "failed":
+            failed.add(callback.request_id)
+        elif result["status"] == "applied" and callback.request_id in failed:
+            _fail(result, "held back behind an earlier failed callback of this request")
+
+
+async def _claim_keys(callbacks: List[Any], results: List[Dict[str, Any]]) -> Dict[int, str]:
+    """Claim the idempotency key of every keyed callback; marks already-seen keys as duplicates."""
+    claimed, seen = {}, set()
+    for index, callback in enumerate(callbacks):
+        if not callback.idempotency_key:
+            continue
+        key = f"{callback.request_id}:{callback.idempotency_key}"
+        if key in seen:
+            results[index]["status"] = "duplicate"
+            continue
+        seen.add(key)
+        claimed[index] = key
+    if not claimed:
+        return claimed
+
+    indexes = list(claimed)
+    now = datetime.now()
+    try:
+        await get_db()[CALLBACK_KEYS].insert_many(
+            [{"_id": claimed[index], "requestId": callbacks[index].request_id, "createdAt": now} for index in indexes],
+            ordered=False
+        )
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            index = indexes[error["index"]]
+            del claimed[index]
+            if error.get("code") == DUPLICATE_KEY:
+                results[index]["status"] = "duplicate"
+            else:
+                _fail(results[index], error.get("errmsg", "could not claim idempotency key"))
+    return claimed
+
+
+async def _release_keys(keys: List[str]):
+    if not keys:
+        return
+    try:
+        await get_db()[CALLBACK_KEYS].delete_many({"_id": {"$in": keys}})
+    except Exception as e:
+        logger.error(f"Could not release {len(keys)} n8n callback key(s), their retries will be skipped: {e}")
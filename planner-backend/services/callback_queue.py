@@ -0,0 +1,267 @@
+"""
+Durable queue for n8n callbacks, used when N8N_CALLBACK_MODE=async.
+
+Applying a callback takes several Mongo round trips, and n8n holds a worker
+slot for as long as it waits on the response. In async mode the callback
+endpoints only validate the callbacks, insert them into n8nCallbackQueue
+(journaled, so a 202 means the callback survives a crash) and answer 202.
+A consumer in every planner-backend process applies them in the background
+through services/callback_ingest.apply_callbacks.
+
+Ordering: each callback goes to one of N8N_CALLBACK_PARTITIONS partitions by
+its requestId. A partition is consumed by one process at a time, the holder
+of its lease in n8nCallbackPartitions, in enqueue (_id) order, so callbacks
+of one request are applied in the order they arrived. A process only
+consumes while its leases are valid by its own clock; leases it stops
+renewing expire after N8N_CALLBACK_LEASE_SECONDS and another process takes
+over. Every consumer heartbeats in n8nCallbackConsumers and holds at most
+its fair share of the partitions, ceil(partitions / live consumers): it
+takes free partitions one at a time up to that share and gives back the
+ones above it, so a consumer that starts later gets work too.
+
+A callback that fails, alone or because its whole batch raised, is retried
+after a backoff of its own (nextAttemptAt, growing with its attempts) while
+the consumer goes on with other requests. Until then the later callbacks of
+its request are held back behind it (services/callback_ingest.py) without
+spending their own attempts. After N8N_CALLBACK_MAX_ATTEMPTS failures it is kept with state
+"dead" for inspection and the callbacks behind it go ahead. On shutdown
+the consumer drains its partitions for up to N8N_CALLBACK_DRAIN_SECONDS,
+then gives up its leases.
+"""
+import asyncio
+import logging
+import math
+import os
+import socket
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from pymongo import ReturnDocument, WriteConcern
+from pymongo.errors import BulkWriteError
+
+from db.config.connection import get_db
+from db.models.requestModels.n8nCallbackRequest import N8NCallbackRequest
+from services.callback_ingest import apply_callbacks
+
+logger = logging.getLogger(__name__)
+
+N8N_CALLBACK_MODE = os.getenv("N8N_CALLBACK_MODE", "sync")
+N8N_CALLBACK_PARTITIONS = int(os.getenv("N8N_CALLBACK_PARTITIONS", "16"))
+N8N_CALLBACK_LEASE_SECONDS = float(os.getenv("N8N_CALLBACK_LEASE_SECONDS", "30"))
+N8N_CALLBACK_CONSUMER_BATCH = int(os.getenv("N8N_CALLBACK_CONSUMER_BATCH", "200"))
+N8N_CALLBACK_POLL_SECONDS = float(os.getenv("N8N_CALLBACK_POLL_SECONDS", "1"))
+N8N_CALLBACK_MAX_ATTEMPTS = int(os.getenv("N8N_CALLBACK_MAX_ATTEMPTS", "5"))
+N8N_CALLBACK_DRAIN_SECONDS = float(os.getenv("N8N_CALLBACK_DRAIN_SECONDS", "10"))
+
+QUEUE = "n8nCallbackQueue"
+PARTITIONS = "n8nCallbackPartitions"
+CONSUMERS = "n8nCallbackConsumers"
+EPOCH = datetime(1970, 1, 1)
+
+
+def partition_of(request_id: str, partitions: int) -> int:
+    return zlib.crc32(request_id.encode()) % partitions
+
+
+class CallbackQueue:
+    def __init__(self, partitions: int, lease_seconds: float, batch_size: int, poll_interval: float,
+                 max_attempts: int):
+        self.partitions = partitions
+        self.lease = timedelta(seconds=lease_seconds)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.consumer_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._owned: List[int] = []
+        self._lease_valid_until = 0.0
+        self._next_claim = 0.0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.enqueued = 0
+        self.applied = 0
+        self.failed = 0
+
+    async def start(self):
+        db = get_db()
+        await db[QUEUE].create_index([("state", 1), ("partition", 1), ("_id", 1)])
+        await db[QUEUE].create_index([("state", 1), ("_id", 1)])
+        await db[QUEUE].create_index([("state", 1), ("partition", 1), ("nextAttemptAt", 1)])
+        # Liveness is judged by leaseUntil; the TTL only clears out heartbeats of long-gone consumers
+        await db[CONSUMERS].create_index("leaseUntil", expireAfterSeconds=86400)
+        try:
+            await db[PARTITIONS].insert_many(
+                [{"_id": partition, "owner": None, "leaseUntil": EPOCH} for partition in range(self.partitions)],
+                ordered=False
+            )
+        except BulkWriteError:
+            pass  # created by an earlier run or another process
+        self._task = asyncio.create_task(self._run())
+
+    async def enqueue(self, callbacks: List[N8NCallbackRequest]):
+        """Store callbacks durably; they are applied in the background."""
+        now = datetime.now()
+        await get_db()[QUEUE].with_options(write_concern=WriteConcern(w=1, j=True)).insert_many([
+            {
+                "requestId": callback.request_id,
+                "partition": partition_of(callback.request_id, self.partitions),
+                "callback": callback.model_dump(),
+                "state": "queued",
+                "attempts": 0,
+                "nextAttemptAt": now,
+                "enqueuedAt": now,
+            }
+            for callback in callbacks
+        ], ordered=True)
+        self.enqueued += len(callbacks)
+        self._wakeup.set()
+
+    async def shutdown(self, drain_seconds: float):
+        """Stop consuming, apply what is left in this process's partitions, then give up the leases."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        deadline = time.monotonic() + drain_seconds
+        try:
+            self._next_claim = 0.0
+            await self._claim_partitions()
+            while time.monotonic() < deadline and await self._consume_once():
+                pass
+            remaining = await get_db()[QUEUE].count_documents({"state": "queued", "partition": {"$in": self._owned}})
+            if remaining:
+                logger.warning(f"{remaining} n8n callback(s) left queued at shutdown; another worker or the next start applies them")
+            await get_db()[PARTITIONS].update_many(
+                {"owner": self.consumer_id}, {"$set": {"owner": None, "leaseUntil": EPOCH}}
+            )
+            await get_db()[CONSUMERS].delete_one({"_id": self.consumer_id})
+        except Exception as e:
+            logger.error(f"Draining the n8n callback queue failed: {e}")
+
+    async def stats(self) -> dict:
+        queue = get_db()[QUEUE]
+        depth = await queue.count_documents({"state": "queued"})
+        dead = await queue.count_documents({"state": "dead"})
+        oldest = await queue.find_one({"state": "queued"}, {"enqueuedAt": 1}, sort=[("_id", 1)])
+        lag = (datetime.now() - oldest["enqueuedAt"]).total_seconds() if oldest else 0.0
+        return {
+            "mode": N8N_CALLBACK_MODE,
+            "depth": depth,
+            "dead": dead,
+            "lag_seconds": round(lag, 3),
+            "consumer_id": self.consumer_id,
+            "owned_partitions": self._owned,
+            "enqueued": self.enqueued,
+            "applied": self.applied,
+            "failed": self.failed,
+        }
+
+    async def _run(self):
+        while True:
+            busy = False
+            try:
+                await self._claim_partitions()
+                busy = await self._consume_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"n8n callback consumer failed: {e}")
+            if not busy:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def _claim_partitions(self):
+        """Renew this process's leases, then take free partitions or give some back to hold a fair share."""
+        if time.monotonic() < self._next_claim:
+            return
+        started = time.monotonic()
+        now = datetime.now()
+        lease_until = now + self.lease
+        db = get_db()
+        await db[CONSUMERS].update_one(
+            {"_id": self.consumer_id}, {"$set": {"leaseUntil": lease_until}}, upsert=True
+        )
+        consumers = await db[CONSUMERS].count_documents({"leaseUntil": {"$gt": now}})
+        share = math.ceil(self.partitions / max(1, consumers))
+
+        partitions = db[PARTITIONS]
+        await partitions.update_many({"owner": self.consumer_id}, {"$set": {"leaseUntil": lease_until}})
+        owned = sorted(doc["_id"] for doc in await partitions.find({"owner": self.consumer_id}, {"_id": 1}).to_list(None))
+        if len(owned) > share:
+            # No batch is in flight between passes, so the extra partitions can be handed over right away
+            await partitions.update_many(
+                {"_id": {"$in": owned[share:]}, "owner": self.consumer_id},
+                {"$set": {"owner": None, "leaseUntil": EPOCH}}
+            )
+            owned = owned[:share]
+        while len(owned) < share:
+            taken = await partitions.find_one_and_update(
+                {"leaseUntil": {"$lt": now}},
+                {"$set": {"owner": self.consumer_id, "leaseUntil": lease_until}},
+                projection={"_id": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if taken is None:
+                break
+            owned.append(taken["_id"])
+        self._owned = sorted(owned)
+        # Trust the lease for a little less than its length, measured from before it was written.
+        self._lease_valid_until = started + self.lease.total_seconds() * 0.8
+        self._next_claim = started + self.lease.total_seconds() / 3
+
+    async def _consume_once(self) -> bool:
+        """Apply the next batch from the owned partitions; returns whether there was anything to apply."""
+        if not self._owned or time.monotonic() >= self._lease_valid_until:
+            return False
+        queue = get_db()[QUEUE]
+        now = datetime.now()
+        # A request whose failed callback waits for its retry keeps its later callbacks behind it
+        waiting = await queue.distinct("requestId", {
+            "state": "queued", "partition": {"$in": self._owned}, "nextAttemptAt": {"$gt": now}
+        })
+        items = await queue.find(
+            {"state": "queued", "partition": {"$in": self._owned}, "requestId": {"$nin": waiting}}
+        ).sort("_id", 1).limit(self.batch_size).to_list(None)
+        if not items:
+            return False
+
+        try:
+            results = await apply_callbacks([N8NCallbackRequest(**item["callback"]) for item in items])
+        except Exception as e:
+            logger.error(f"Applying {len(items)} n8n callback(s) failed: {e}")
+            results = [{"status": "failed", "error": str(e)} for _ in items]
+        done = [item["_id"] for item, result in zip(items, results) if result["status"] != "failed"]
+        if done:
+            await queue.delete_many({"_id": {"$in": done}})
+        self.applied += len(done)
+        failed_requests = set()
+        for item, result in zip(items, results):
+            if result["status"] != "failed":
+                continue
+            self.failed += 1
+            if item["requestId"] in failed_requests:
+                # held back behind an earlier failure of its request: waiting is not its own attempt
+                await queue.update_one({"_id": item["_id"]}, {"$set": {"lastError": result["error"]}})
+                continue
+            failed_requests.add(item["requestId"])
+            attempts = item["attempts"] + 1
+            state = "dead" if attempts >= self.max_attempts else "queued"
+            retry_at = datetime.now() + timedelta(seconds=min(30, 2 ** attempts))
+            await queue.update_one(
+                {"_id": item["_id"]},
+                {"$set": {"attempts": attempts, "state": state, "nextAttemptAt": retry_at, "lastError": result["error"]}}
+            )
+        return True
+
+
+callback_queue = CallbackQueue(
+    N8N_CALLBACK_PARTITIONS, N8N_CALLBACK_LEASE_SECONDS, N8N_CALLBACK_CONSUMER_BATCH,
+    N8N_CALLBACK_POLL_SECONDS, N8N_CALLBACK_MAX_ATTEMPTS
+)
@@ -0,0 +1,334 @@
+"""
+Staging of supporting documents for the browser agent.
+
+Documents reach browser-use-backend through the volume both services mount
+at /app/tmp. They are stored once per content under DOCUMENT_STORE_DIR:
+
+    blobs/<sha256[:2]>/<sha256>          content, written once
+    requests/<request_id>/<name>         hard link to the blob (a copy where links are unsupported)
+    requests/<request_id>/manifest.json  what is staged for the request
+
+The manifest is the contract with browser-use-backend
+(app/services/document_manifest.py): one entry per document with its name,
+sha256, size, content type, path relative to DOCUMENT_STORE_DIR and the
+path it was staged from, if any. It is replaced atomically, so a reader
+never sees a half-written one.
+
+Uploads are streamed to disk while they are hashed, at most
+DOCUMENT_WRITE_BUFFER_BYTES in memory at a time, and refused above
+DOCUMENT_MAX_BYTES. All file access runs in a thread.
+
+Cleanup, every DOCUMENT_CLEANUP_INTERVAL_SECONDS: a request's documents are
+removed DOCUMENT_RETENTION_HOURS after its manifest last changed, then
+blobs no manifest refers to are removed once they are older than
+DOCUMENT_ORPHAN_GRACE_SECONDS (so an upload being staged is not lost).
+Staging an upload that matches an existing blob refreshes the blob's mtime.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_STORE_DIR = os.getenv("DOCUMENT_STORE_DIR", "/app/tmp/documents")
+DOCUMENT_MAX_BYTES = int(os.getenv("DOCUMENT_MAX_BYTES", str(100 * 1024 * 1024)))
+DOCUMENT_WRITE_BUFFER_BYTES = int(os.getenv("DOCUMENT_WRITE_BUFFER_BYTES", str(1024 * 1024)))
+DOCUMENT_RETENTION_HOURS = float(os.getenv("DOCUMENT_RETENTION_HOURS", "72"))
+DOCUMENT_ORPHAN_GRACE_SECONDS = float(os.getenv("DOCUMENT_ORPHAN_GRACE_SECONDS", "3600"))
+DOCUMENT_CLEANUP_INTERVAL_SECONDS = float(os.getenv("DOCUMENT_CLEANUP_INTERVAL_SECONDS", "900"))
+
+MANIFEST = "manifest.json"
+SAFE_NAME = re.compile(r"^[\w][\w .()-]{0,199}$")
+READ_CHUNK = 1024 * 1024
+LOCK_STRIPES = 64
+
+
+class DocumentTooLarge(Exception):
+    pass
+
+
+def safe_name(name: str) -> bool:
+    return bool(SAFE_NAME.match(name)) and name != MANIFEST and ".." not in name
+
+
+class DocumentStore:
+    def __init__(self, root: str, max_bytes: int, buffer_bytes: int, retention_hours: float,
+                 orphan_grace: float, cleanup_interval: float):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.buffer_bytes = buffer_bytes
+        self.retention = timedelta(hours=retention_hours)
+        self.orphan_grace = orphan_grace
+        self.cleanup_interval = cleanup_interval
+        self._locks = [asyncio.Lock() for _ in range(LOCK_STRIPES)]
+        self._task: Optional[asyncio.Task] = None
+        self.staged = 0
+        self.deduplicated = 0
+        self.bytes_written = 0
+        self.requests_removed = 0
+        self.blobs_removed = 0
+
+    async def start(self):
+        await asyncio.to_thread(self._make_dirs)
+        self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def stage_stream(self, request_id: str, name: str, chunks: AsyncIterator[bytes],
+                           content_type: Optional[str] = None) -> dict:
+        """Stream a document into the store and add it to the request's manifest."""
+        if not safe_name(request_id) or not safe_name(name):
+            raise ValueError("Invalid request id or document name")
+        incoming = os.path.join(self.root, "incoming", uuid.uuid4().hex)
+        hasher = hashlib.sha256()
+        size = 0
+        buffer = bytearray()
+        f = await asyncio.to_thread(open, incoming, "wb")
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise DocumentTooLarge(f"Document is larger than {self.max_bytes} bytes")
+                hasher.update(chunk)
+                buffer += chunk
+                if len(buffer) >= self.buffer_bytes:
+                    await asyncio.to_thread(f.write, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await asyncio.to_thread(f.write, bytes(buffer))
+            await asyncio.to_thread(f.close)
+        except BaseException:
+            await asyncio.to_thread(self._discard, f, incoming)
+            raise
+        return await self._commit(request_id, name, incoming, hasher.hexdigest(), size, content_type, None)
+
+    async def stage_path(self, request_id: str, source_path: str, name: Optional[str] = None,
+                         content_type: Optional[str] = None) -> dict:
+        """Stage a file already on disk (e.g. a patient's documents) under the request."""
+        name = name or os.path.basename(source_path)
+        if not safe_name(request_id) or not safe_name(name):
+            raise ValueError("Invalid request id or document name")
+        incoming = os.path.join(self.root, "incoming", uuid.uuid4().hex)
+        digest, size = await asyncio.to_thread(self._copy_hashed, source_path, incoming)
+        return await self._commit(request_id, name, incoming, digest, size, content_type, source_path)
+
+    async def stage_paths(self, request_id: str, source_paths: List[str]) -> List[dict]:
+        """Stage every file that exists; missing ones are logged and skipped."""
+        staged = []
+        for source_path in source_paths:
+            try:
+                staged.append(await self.stage_path(request_id, source_path))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not stage {source_path} for request {request_id}: {e}")
+        return staged
+
+    async def manifest(self, request_id: str) -> Optional[dict]:
+        if not safe_name(request_id):
+            return None
+        return await asyncio.to_thread(self._read_manifest, request_id)
+
+    async def remove(self, request_id: str) -> bool:
+        if not safe_name(request_id):
+            return False
+        async with self._lock(request_id):
+            return await asyncio.to_thread(self._remove_request, request_id)
+
+    async def cleanup(self) -> dict:
+        """Apply the retention policy once; returns what was removed."""
+        cutoff = datetime.now() - self.retention
+        removed_requests = 0
+        for request_id in await asyncio.to_thread(self._request_ids):
+            async with self._lock(request_id):
+                manifest = await asyncio.to_thread(self._read_manifest, request_id)
+                updated = datetime.fromisoformat(manifest["updatedAt"]) if manifest else None
+                if updated is None or updated < cutoff:
+                    removed_requests += await asyncio.to_thread(self._remove_request, request_id)
+        removed_blobs = await asyncio.to_thread(self._remove_orphan_blobs)
+        self.requests_removed += removed_requests
+        self.blobs_removed += removed_blobs
+        return {"requests_removed": removed_requests, "blobs_removed": removed_blobs}
+
+    def stats(self) -> dict:
+        return {
+            "root": self.root,
+            "staged": self.staged,
+            "deduplicated": self.deduplicated,
+            "bytes_written": self.bytes_written,
+            "requests_removed": self.requests_removed,
+            "blobs_removed": self.blobs_removed,
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                removed = await self.cleanup()
+                if removed["requests_removed"] or removed["blobs_removed"]:
+                    logger.info(f"Document cleanup: {removed}")
+            except Exception as e:
+                logger.error(f"Document cleanup failed: {e}")
+
+    def _lock(self, request_id: str) -> asyncio.Lock:
+        # Manifest updates of one request are serialized; a fixed set of locks keeps this bounded.
+        return self._locks[zlib.crc32(request_id.encode()) % LOCK_STRIPES]
+
+    async def _commit(self, request_id: str, name: str, incoming: str, digest: str, size: int,
+                      content_type: Optional[str], source_path: Optional[str]) -> dict:
+        async with self._lock(request_id):
+            entry = await asyncio.to_thread(
+                self._commit_sync, request_id, name, incoming, digest, size, content_type, source_path
+            )
+        return entry
+
+    # Blocking helpers, run in a thread
+
+    def _make_dirs(self):
+        for directory in ("blobs", "requests", "incoming"):
+            os.makedirs(os.path.join(self.root, directory), exist_ok=True)
+
+    @staticmethod
+    def _discard(f, path: str):
+        f.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _copy_hashed(self, source_path: str, incoming: str):
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(source_path, "rb") as src, open(incoming, "wb") as dst:
+                while chunk := src.read(READ_CHUNK):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise DocumentTooLarge(f"Document is larger than {self.max_bytes} bytes")
+                    hasher.update(chunk)
+                    dst.write(chunk)
+        except BaseException:
+            if os.path.exists(incoming):
+                os.remove(incoming)
+            raise
+        return hasher.hexdigest(), size
+
+    def _commit_sync(self, request_id: str, name: str, incoming: str, digest: str, size: int,
+                     content_type: Optional[str], source_path: Optional[str]) -> dict:
+        blob = os.path.join(self.root, "blobs", digest[:2], digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        request_dir = os.path.join(self.root, "requests", request_id)
+        os.makedirs(request_dir, exist_ok=True)
+        staged = os.path.join(request_dir, name)
+        linked = os.path.join(request_dir, f".{uuid.uuid4().hex}")
+        try:
+            # Dedup: a fresh mtime keeps orphan cleanup (which takes no locks) off the blob
+            os.utime(blob)
+            self._link(blob, linked)
+            os.remove(incoming)
+            self.deduplicated += 1
+        except FileNotFoundError:
+            # not stored yet, or orphan cleanup removed it just now
+            os.replace(incoming, blob)
+            self.bytes_written += size
+            self._link(blob, linked)
+        if not os.path.exists(blob):
+            try:
+                self._link(linked, blob)  # removed after we linked it: put it back
+            except FileExistsError:
+                pass
+        os.replace(linked, staged)
+
+        manifest = self._read_manifest(request_id) or {"requestId": request_id, "documents": []}
+        entry = {
+            "name": name,
+            "sha256": digest,
+            "size": size,
+            "contentType": content_type,
+            "path": os.path.relpath(staged, self.root),
+            "source": source_path,
+            "stagedAt": datetime.now().isoformat(),
+        }
+        manifest["documents"] = [doc for doc in manifest["documents"] if doc["name"] != name] + [entry]
+        manifest["updatedAt"] = entry["stagedAt"]
+        self._write_manifest(request_id, manifest)
+        self.staged += 1
+        return entry
+
+    @staticmethod
+    def _link(source: str, target: str):
+        try:
+            os.link(source, target)
+        except (FileNotFoundError, FileExistsError):
+            raise
+        except OSError:
+            shutil.copyfile(source, target)  # e.g. a filesystem without hard links
+
+    def _manifest_path(self, request_id: str) -> str:
+        return os.path.join(self.root, "requests", request_id, MANIFEST)
+
+    def _read_manifest(self, request_id: str) -> Optional[dict]:
+        try:
+            with open(self._manifest_path(request_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_manifest(self, request_id: str, manifest: dict):
+        path = self._manifest_path(request_id)
+        partial = f"{path}.{uuid.uuid4().hex}"
+        with open(partial, "w") as f:
+            json.dump(manifest, f)
+        os.replace(partial, path)
+
+    def _request_ids(self) -> List[str]:
+        try:
+            return os.listdir(os.path.join(self.root, "requests"))
+        except FileNotFoundError:
+            return []
+
+    def _remove_request(self, request_id: str) -> bool:
+        request_dir = os.path.join(self.root, "requests", request_id)
+        if not os.path.isdir(request_dir):
+            return False
+        shutil.rmtree(request_dir, ignore_errors=True)
+        return True
+
+    def _remove_orphan_blobs(self) -> int:
+        referenced = set()
+        for request_id in self._request_ids():
+            manifest = self._read_manifest(request_id)
+            if manifest:
+                referenced.update(doc["sha256"] for doc in manifest["documents"])
+        removed = 0
+        cutoff = time.time() - self.orphan_grace
+        blobs = os.path.join(self.root, "blobs")
+        for prefix in os.listdir(blobs) if os.path.isdir(blobs) else []:
+            for digest in os.listdir(os.path.join(blobs, prefix)):
+                path = os.path.join(blobs, prefix, digest)
+                if digest not in referenced and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+        incoming = os.path.join(self.root, "incoming")
+        for partial in os.listdir(incoming) if os.path.isdir(incoming) else []:
+            path = os.path.join(incoming, partial)
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)  # left over from a crash mid-upload
+        return removed
+
+
+document_store = DocumentStore(
+    DOCUMENT_STORE_DIR, DOCUMENT_MAX_BYTES, DOCUMENT_WRITE_BUFFER_BYTES, DOCUMENT_RETENTION_HOURS,
+    DOCUMENT_ORPHAN_GRACE_SECONDS, DOCUMENT_CLEANUP_INTERVAL_SECONDS
+)
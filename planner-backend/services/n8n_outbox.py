@@ -0,0 +1,279 @@
+"""
+Transactional outbox for n8n workflow triggers.
+
+/tools/trigger-n8n used to insert the priorAuthRequest and then POST to
+N8N_WEBHOOK_URL inside the request, so a slow n8n stalled the agent and a
+crash between the two steps left a request that never ran. Now the tool
+writes the request record and an n8nOutbox entry in one transaction and
+returns once it has committed; N8nOutboxDispatcher delivers the webhook in
+the background:
+
+- at most N8N_OUTBOX_CONCURRENCY deliveries at a time per process;
+- an entry being delivered is leased for N8N_OUTBOX_LEASE_SECONDS, and an
+  entry whose lease ran out (its process died) is delivered again;
+- failed deliveries are retried up to N8N_OUTBOX_MAX_ATTEMPTS times after
+  a "full jitter" exponential backoff, so retries from many requests do
+  not hit a recovering n8n at the same moment; 4xx answers other than 408
+  and 429 are not retried;
+- the entry id is derived from the request id, so triggering the same
+  request twice queues one delivery, and it is sent as Idempotency-Key so
+  n8n can drop a delivery repeated after a crash. Triggering a request
+  whose delivery failed for good queues it again, under a new key;
+- deliveries go through the "n8n" circuit breaker and concurrency limit
+  (services/resilience.py). A delivery shed by them is put back without
+  using up an attempt.
+
+Transactions need a replica set (see docker-compose.yaml). On a standalone
+mongod the two writes are made one after the other, request record first.
+"""
+import asyncio
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import httpx
+from pymongo import ReturnDocument, WriteConcern
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from db.config.connection import get_db
+from db.models.dbmodels.requestProgress import RequestStatus
+from services.progress_writer import progress_writer
+from services.resilience import DependencyUnavailable, dependency
+
+logger = logging.getLogger(__name__)
+
+N8N_OUTBOX_CONCURRENCY = int(os.getenv("N8N_OUTBOX_CONCURRENCY", "4"))
+N8N_OUTBOX_MAX_ATTEMPTS = int(os.getenv("N8N_OUTBOX_MAX_ATTEMPTS", "8"))
+N8N_OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv("N8N_OUTBOX_BACKOFF_BASE_SECONDS", "1"))
+N8N_OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("N8N_OUTBOX_BACKOFF_MAX_SECONDS", "300"))
+N8N_OUTBOX_TIMEOUT_SECONDS = float(os.getenv("N8N_OUTBOX_TIMEOUT_SECONDS", "30"))
+N8N_OUTBOX_LEASE_SECONDS = float(os.getenv("N8N_OUTBOX_LEASE_SECONDS", "60"))
+N8N_OUTBOX_POLL_SECONDS = float(os.getenv("N8N_OUTBOX_POLL_SECONDS", "1"))
+N8N_LATENCY_TARGET_SECONDS = float(os.getenv("N8N_LATENCY_TARGET_SECONDS", "5"))
+
+OUTBOX = "n8nOutbox"
+ILLEGAL_OPERATION = 20  # "Transaction numbers are only allowed on a replica set member or mongos"
+RETRYABLE_STATUS = {408, 429}
+
+n8n_dependency = dependency("n8n", latency_target=N8N_LATENCY_TARGET_SECONDS)
+
+
+# Statuses a request can have before n8n reports on it; delivery only moves these on
+PRE_TRIGGER_STATUSES = [RequestStatus.CREATED, RequestStatus.VALIDATED, RequestStatus.PROCESSING, RequestStatus.IN_PROGRESS]
+
+
+def trigger_entry_id(request_id: str) -> str:
+    return f"trigger:{request_id}"
+
+
+def idempotency_key(entry: dict) -> str:
+    # A re-triggered entry is a new delivery, which n8n must not drop as a repeat
+    retriggers = entry.get("retriggers", 0)
+    return f"{entry['_id']}:{retriggers}" if retriggers else entry["_id"]
+
+
+class N8nOutboxDispatcher:
+    def __init__(self, concurrency: int, max_attempts: int, backoff_base: float, backoff_max: float,
+                 timeout: float, lease_seconds: float, poll_interval: float):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.lease = timedelta(seconds=lease_seconds)
+        self.poll_interval = poll_interval
+        self._transactions = True
+        self._wakeup = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+        self._client: Optional[httpx.AsyncClient] = None
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+        self.shed = 0
+
+    async def start(self):
+        outbox = get_db()[OUTBOX]
+        await outbox.create_index([("state", 1), ("nextAttemptAt", 1)])
+        await outbox.create_index([("state", 1), ("leaseUntil", 1)])
+        self._client = httpx.AsyncClient(timeout=self.timeout)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def shutdown(self):
+        # Deliveries cut short here are picked up again once their lease runs out.
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        if self._client:
+            await self._client.aclose()
+
+    async def enqueue_trigger(self, request_record: Dict[str, Any], url: str, payload: Dict[str, Any]) -> str:
+        """
+        Store the priorAuthRequest record and its webhook delivery together.
+        Returns "queued", "requeued" (its earlier delivery had failed for
+        good) or "duplicate" (already queued or delivered).
+        """
+        now = datetime.now()
+        entry = {
+            "_id": trigger_entry_id(request_record["requestId"]),
+            "requestId": request_record["requestId"],
+            "url": url,
+            "payload": payload,
+            "state": "pending",
+            "attempts": 0,
+            "nextAttemptAt": now,
+            "createdAt": now,
+        }
+        db = get_db()
+        try:
+            if self._transactions:
+                try:
+                    async with await db.client.start_session() as session:
+                        async with session.start_transaction(write_concern=WriteConcern("majority")):
+                            await db["priorAuthRequest"].insert_one(request_record, session=session)
+                            await db[OUTBOX].insert_one(entry, session=session)
+                except OperationFailure as e:
+                    if e.code != ILLEGAL_OPERATION:
+                        raise
+                    logger.warning("MongoDB does not support transactions here; writing the n8n outbox without one")
+                    self._transactions = False
+            if not self._transactions:
+                if await db[OUTBOX].find_one({"_id": entry["_id"]}, {"_id": 1}):
+                    return await self._retrigger(entry)
+                await db["priorAuthRequest"].insert_one(request_record)
+                await db[OUTBOX].with_options(write_concern=WriteConcern(w=1, j=True)).insert_one(entry)
+        except DuplicateKeyError:
+            return await self._retrigger(entry)
+        self._wakeup.set()
+        return "queued"
+
+    async def _retrigger(self, entry: dict) -> str:
+        """Put an entry whose delivery failed for good back in the queue."""
+        requeued = await get_db()[OUTBOX].find_one_and_update(
+            {"_id": entry["_id"], "state": "failed"},
+            {
+                "$set": {"url": entry["url"], "payload": entry["payload"], "state": "pending",
+                         "attempts": 0, "nextAttemptAt": datetime.now()},
+                "$inc": {"retriggers": 1},
+                "$unset": {"lastError": ""},
+            },
+            {"_id": 1}
+        )
+        if requeued is None:
+            return "duplicate"
+        self._wakeup.set()
+        return "requeued"
+
+    async def stats(self) -> dict:
+        outbox = get_db()[OUTBOX]
+        counts = await outbox.aggregate([{"$group": {"_id": "$state", "count": {"$sum": 1}}}]).to_list(None)
+        oldest = await outbox.find_one({"state": "pending"}, {"createdAt": 1}, sort=[("createdAt", 1)])
+        return {
+            "entries": {count["_id"]: count["count"] for count in counts},
+            "oldest_pending_seconds": round((datetime.now() - oldest["createdAt"]).total_seconds(), 3) if oldest else 0.0,
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "failed": self.failed,
+            "shed": self.shed,
+            "concurrency": self.concurrency,
+            "transactions": self._transactions,
+        }
+
+    async def _worker(self):
+        while True:
+            try:
+                entry = await self._claim()
+                if entry is not None:
+                    await self._deliver(entry)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"n8n outbox dispatcher failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.now()
+        return await get_db()[OUTBOX].find_one_and_update(
+            {"$or": [
+                {"state": "pending", "nextAttemptAt": {"$lte": now}},
+                {"state": "delivering", "leaseUntil": {"$lt": now}},
+            ]},
+            {"$set": {"state": "delivering", "leaseUntil": now + self.lease}, "$inc": {"attempts": 1}},
+            sort=[("nextAttemptAt", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _deliver(self, entry: dict):
+        retryable = True
+        try:
+            async with n8n_dependency.guard() as call:
+                response = await self._client.post(entry["url"], json=entry["payload"], headers={"Idempotency-Key": idempotency_key(entry)})
+                if response.status_code >= 500 or response.status_code in RETRYABLE_STATUS:
+                    call.fail()
+            if response.status_code < 300:
+                await self._delivered(entry, response.headers.get("X-Workflow-ID"))
+                return
+            error = f"N8N webhook failed: {response.status_code}"
+            retryable = response.status_code >= 500 or response.status_code in RETRYABLE_STATUS
+        except DependencyUnavailable as e:
+            await self._shed(entry, e)
+            return
+        except httpx.HTTPError as e:
+            error = f"N8N webhook unreachable: {e!r}"
+
+        if retryable and entry["attempts"] < self.max_attempts:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** entry["attempts"]))
+            self.retried += 1
+            await get_db()[OUTBOX].update_one({"_id": entry["_id"]}, {"$set": {
+                "state": "pending", "nextAttemptAt": datetime.now() + timedelta(seconds=delay), "lastError": error,
+            }})
+            return
+
+        self.failed += 1
+        await get_db()[OUTBOX].update_one({"_id": entry["_id"]}, {"$set": {"state": "failed", "lastError": error}})
+        await progress_writer.update(entry["requestId"], {
+            "status": RequestStatus.FAILED,
+            "lastUpdatedAt": datetime.now(),
+            "remarks": f"N8N trigger failed: {error}"
+        })
+
+    async def _shed(self, entry: dict, error: DependencyUnavailable):
+        # Not sent, so the attempt does not count; wait for the breaker to let probes through.
+        self.shed += 1
+        delay = error.retry_after + random.uniform(0, self.backoff_base * 2)
+        await get_db()[OUTBOX].update_one({"_id": entry["_id"]}, {
+            "$set": {"state": "pending", "nextAttemptAt": datetime.now() + timedelta(seconds=delay), "lastError": str(error)},
+            "$inc": {"attempts": -1},
+        })
+        # Nothing else gets through either until then; don't spin on claiming entries.
+        await asyncio.sleep(max(error.retry_after, self.poll_interval))
+
+    async def _delivered(self, entry: dict, workflow_id: Optional[str]):
+        self.delivered += 1
+        await get_db()[OUTBOX].update_one({"_id": entry["_id"]}, {"$set": {
+            "state": "delivered", "deliveredAt": datetime.now(), "workflowId": workflow_id,
+        }})
+        # Conditional: n8n's first callback may already have moved the request on
+        db = get_db()
+        moved = await db["requestProgress"].update_one(
+            {"requestId": entry["requestId"], "status": {"$in": PRE_TRIGGER_STATUSES}},
+            {"$set": {
+                "status": RequestStatus.IN_PROGRESS,
+                "lastUpdatedAt": datetime.now(),
+                "remarks": "N8N workflow triggered successfully"
+            }}
+        )
+        if moved.modified_count and progress_writer.on_change:
+            await progress_writer.on_change(entry["requestId"])
+
+
+n8n_outbox = N8nOutboxDispatcher(
+    N8N_OUTBOX_CONCURRENCY, N8N_OUTBOX_MAX_ATTEMPTS, N8N_OUTBOX_BACKOFF_BASE_SECONDS, N8N_OUTBOX_BACKOFF_MAX_SECONDS,
+    N8N_OUTBOX_TIMEOUT_SECONDS, N8N_OUTBOX_LEASE_SECONDS, N8N_OUTBOX_POLL_SECONDS
+)
@@ -0,0 +1,290 @@
+"""
+Patient data for /tools/get-patient-details and POST /patients/batch.
+
+PATIENT_SOURCE picks where patients come from:
+
+- "fixture" (default): one JSON file per patient in PATIENT_FIXTURES_DIR,
+  named <patient_id>.json. Unknown ids get default.json if there is one, so
+  a demo works with any id. Documents a fixture lists that do not exist
+  yet are written as sample medical documents.
+- "http": an EHR API at PATIENT_API_URL, GET /patients/{id} for one
+  patient and POST /patients/batch {"ids": [...]} for several. An EHR
+  without the batch route is asked per patient instead, at most
+  PATIENT_API_CONCURRENCY at a time. Calls go through the "ehr" circuit
+  breaker (services/resilience.py).
+
+PatientDirectory keeps each patient for PATIENT_CACHE_TTL_SECONDS (LRU,
+PATIENT_CACHE_MAX_ENTRIES), so the agent's tool calls for a request cost
+one lookup, and get_many loads a whole worklist with one call to the
+source for the patients that are not cached. Concurrent misses for the
+same patient share one fetch. File access runs in a thread.
+"""
+import asyncio
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import httpx
+
+from services.resilience import dependency
+
+PATIENT_SOURCE = os.getenv("PATIENT_SOURCE", "fixture")
+PATIENT_FIXTURES_DIR = os.getenv(
+    "PATIENT_FIXTURES_DIR", os.path.join(os.path.dirname(__file__), "..", "fixtures", "patients")
+)
+PATIENT_API_URL = os.getenv("PATIENT_API_URL", "")
+PATIENT_API_TOKEN = os.getenv("PATIENT_API_TOKEN")
+PATIENT_API_TIMEOUT_SECONDS = float(os.getenv("PATIENT_API_TIMEOUT_SECONDS", "10"))
+PATIENT_API_CONCURRENCY = int(os.getenv("PATIENT_API_CONCURRENCY", "8"))
+PATIENT_CACHE_TTL_SECONDS = float(os.getenv("PATIENT_CACHE_TTL_SECONDS", "300"))
+PATIENT_CACHE_MAX_ENTRIES = int(os.getenv("PATIENT_CACHE_MAX_ENTRIES", "5000"))
+PATIENT_BATCH_MAX = int(os.getenv("PATIENT_BATCH_MAX", "200"))
+
+DOCUMENT_TEMPLATE = """MEDICAL DOCUMENT - PRIOR AUTHORIZATION SUPPORT
+
+Patient: {firstName} {lastName}
+DOB: {dateOfBirth}
+Member ID: {memberId}
+
+SERVICE REQUEST:
+Service Type: {serviceType}
+CPT Code: {cptCode}
+Diagnosis: {diagnosis}
+Clinical Justification: {clinicalJustification}
+Urgency: {urgency}
+Requested Date: {requestedDate}
+
+This document supports the prior authorization request for the above patient.
+Generated on: {generated}
+
+Medical Provider Signature: [Electronic Signature]
+License Number: [Provider License]
+Date: {date}
+"""
+
+
+class PatientNotFound(LookupError):
+    pass
+
+
+class PatientSource(ABC):
+    """Where patient records come from; fetch_many returns only the patients that exist."""
+
+    name = "base"
+    concurrency = 16
+
+    async def start(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @abstractmethod
+    async def fetch(self, patient_id: str) -> Dict[str, Any]:
+        """One patient, raising PatientNotFound if there is no such patient."""
+
+    async def fetch_many(self, patient_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(patient_id: str):
+            async with semaphore:
+                return await self.fetch(patient_id)
+
+        results = await asyncio.gather(*(fetch(patient_id) for patient_id in patient_ids), return_exceptions=True)
+        found = {}
+        for patient_id, result in zip(patient_ids, results):
+            if isinstance(result, PatientNotFound):
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            found[patient_id] = result
+        return found
+
+
+class FixturePatientSource(PatientSource):
+    name = "fixture"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    async def fetch(self, patient_id: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._load, patient_id)
+
+    def _load(self, patient_id: str) -> Dict[str, Any]:
+        if os.path.basename(patient_id) != patient_id or patient_id.startswith("."):
+            raise PatientNotFound(patient_id)
+        for name in (f"{patient_id}.json", "default.json"):
+            path = os.path.join(self.directory, name)
+            if os.path.exists(path):
+                with open(path) as f:
+                    patient = json.load(f)
+                self._ensure_documents(patient)
+                return patient
+        raise PatientNotFound(patient_id)
+
+    @staticmethod
+    def _ensure_documents(patient: Dict[str, Any]):
+        for document_path in patient.get("documents", []):
+            if os.path.exists(document_path):
+                continue
+            os.makedirs(os.path.dirname(document_path), exist_ok=True)
+            now = datetime.now()
+            with open(document_path, "w") as f:
+                f.write(DOCUMENT_TEMPLATE.format_map({
+                    **{key: patient.get(key, "") for key in (
+                        "firstName", "lastName", "dateOfBirth", "memberId", "serviceType", "cptCode",
+                        "diagnosis", "clinicalJustification", "urgency", "requestedDate")},
+                    "generated": now.strftime('%Y-%m-%d %H:%M:%S'),
+                    "date": now.strftime('%Y-%m-%d'),
+                }))
+            print(f"Document created at: {document_path}")
+
+
+class HttpPatientSource(PatientSource):
+    name = "http"
+
+    def __init__(self, base_url: str, token: Optional[str], timeout: float, concurrency: int):
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.dependency = dependency("ehr", latency_target=timeout / 4)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._batch_supported = True
+
+    async def start(self):
+        self._client = httpx.AsyncClient(base_url=self.base_url, headers=self.headers, timeout=self.timeout)
+
+    async def shutdown(self):
+        if self._client:
+            await self._client.aclose()
+
+    async def fetch(self, patient_id: str) -> Dict[str, Any]:
+        async with self.dependency.guard() as call:
+            response = await self._client.get(f"/patients/{quote(patient_id, safe='')}")
+            if response.status_code >= 500:
+                call.fail()
+        if response.status_code == 404:
+            raise PatientNotFound(patient_id)
+        response.raise_for_status()
+        return response.json()
+
+    async def fetch_many(self, patient_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        if self._batch_supported:
+            async with self.dependency.guard() as call:
+                response = await self._client.post("/patients/batch", json={"ids": patient_ids})
+                if response.status_code >= 500:
+                    call.fail()
+            if response.status_code in (404, 405):
+                self._batch_supported = False
+            else:
+                response.raise_for_status()
+                return {patient["id"]: patient for patient in response.json().get("patients", [])}
+        return await super().fetch_many(patient_ids)
+
+
+class PatientDirectory:
+    def __init__(self, source: PatientSource, ttl: float, max_entries: int):
+        self.source = source
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.source_calls = 0
+
+    async def start(self):
+        await self.source.start()
+
+    async def shutdown(self):
+        await self.source.shutdown()
+
+    async def get(self, patient_id: str) -> Dict[str, Any]:
+        """One patient, raising PatientNotFound if the source has no such patient."""
+        patient = self._cached(patient_id)
+        if patient is not None:
+            return patient
+        inflight = self._inflight.get(patient_id)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[patient_id] = future
+        try:
+            self.source_calls += 1
+            patient = await self.source.fetch(patient_id)
+            self._store(patient_id, patient)
+            future.set_result(patient)
+            return patient
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved here so a future nobody else awaited does not warn
+            raise
+        finally:
+            del self._inflight[patient_id]
+
+    async def get_many(self, patient_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """The patients that exist among patient_ids, loading all cache misses in one source call."""
+        found, missing = {}, []
+        for patient_id in dict.fromkeys(patient_ids):
+            patient = self._cached(patient_id)
+            if patient is None:
+                missing.append(patient_id)
+            else:
+                found[patient_id] = patient
+        if missing:
+            self.source_calls += 1
+            loaded = await self.source.fetch_many(missing)
+            for patient_id, patient in loaded.items():
+                self._store(patient_id, patient)
+            found.update(loaded)
+        return found
+
+    def invalidate(self, patient_id: str):
+        self._entries.pop(patient_id, None)
+
+    def _cached(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(patient_id)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(patient_id)
+        self.hits += 1
+        return entry[1]
+
+    def _store(self, patient_id: str, patient: Dict[str, Any]):
+        if self.ttl <= 0:
+            return
+        self._entries[patient_id] = (time.monotonic() + self.ttl, patient)
+        self._entries.move_to_end(patient_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "source": self.source.name,
+            "cached": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "coalesced": self.coalesced,
+            "source_calls": self.source_calls,
+        }
+
+
+def _build_source() -> PatientSource:
+    if PATIENT_SOURCE == "http":
+        return HttpPatientSource(PATIENT_API_URL, PATIENT_API_TOKEN, PATIENT_API_TIMEOUT_SECONDS, PATIENT_API_CONCURRENCY)
+    return FixturePatientSource(PATIENT_FIXTURES_DIR)
+
+
+patient_directory = PatientDirectory(_build_source(), PATIENT_CACHE_TTL_SECONDS, PATIENT_CACHE_MAX_ENTRIES)
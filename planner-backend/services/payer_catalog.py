@@ -0,0 +1,138 @@
+"""
+In-memory catalog of the `payers` collection.
+
+Payer records almost never change, yet /tools/check-payer used to read the
+collection on every call and planner-agent resolved payer names against a
+hard-coded dict. The catalog loads every payer at startup into an immutable
+PayerSnapshot indexed by id and by normalized name, and swaps in a new
+snapshot when it reloads:
+
+- every PAYER_CATALOG_REFRESH_SECONDS in the background, so writes made by
+  other workers or directly in Mongo show up within that interval;
+- straight away after an admin write through this service.
+
+Readers always see one complete snapshot, never a half-loaded one. The
+snapshot's `version` is a hash of its content, identical on every worker for
+the same data, and is served as the ETag of GET /payers/catalog so clients
+can cache the catalog and revalidate cheaply.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional
+
+from bson import json_util
+
+from db.config.connection import get_db
+
+logger = logging.getLogger(__name__)
+
+PAYER_CATALOG_COLLECTION = os.getenv("PAYER_CATALOG_COLLECTION", "payers")
+PAYER_CATALOG_REFRESH_SECONDS = float(os.getenv("PAYER_CATALOG_REFRESH_SECONDS", "60"))
+
+
+def normalize_payer_name(name: str) -> str:
+    """"BlueCross BlueShield", "Blue Cross Blue Shield" and "bluecross-blueshield" are the same payer."""
+    return re.sub(r"[^0-9a-z]", "", name.casefold())
+
+
+@dataclass(frozen=True)
+class PayerSnapshot:
+    version: str
+    loaded_at: datetime
+    by_id: Mapping[str, Mapping[str, Any]] = field(repr=False)
+    by_name: Mapping[str, str] = field(repr=False)
+
+    @classmethod
+    def build(cls, payers: List[dict]) -> "PayerSnapshot":
+        skipped = [payer.get("_id") for payer in payers if payer.get("id") is None]
+        if skipped:
+            logger.warning(f"Payer catalog skipped {len(skipped)} payer document(s) without an id: {skipped}")
+        payers = sorted((payer for payer in payers if payer.get("id") is not None), key=lambda payer: payer["id"])
+        digest = hashlib.sha256(json_util.dumps(payers, sort_keys=True).encode()).hexdigest()
+        return cls(
+            version=digest[:16],
+            loaded_at=datetime.now(),
+            by_id=MappingProxyType({payer["id"]: MappingProxyType(payer) for payer in payers}),
+            by_name=MappingProxyType({
+                normalize_payer_name(payer["name"]): payer["id"] for payer in payers if payer.get("name")
+            }),
+        )
+
+    def payers(self) -> List[dict]:
+        return [dict(payer) for payer in self.by_id.values()]
+
+
+class PayerCatalog:
+    def __init__(self, collection: str, refresh_interval: float):
+        self.collection = collection
+        self.refresh_interval = refresh_interval
+        self.snapshot = PayerSnapshot.build([])
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.lookups = 0
+        self.refreshes = 0
+
+    async def start(self):
+        await self.refresh()
+        self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+
+    async def refresh(self) -> PayerSnapshot:
+        """Reload every payer and swap in the new snapshot if anything changed."""
+        async with self._lock:
+            payers = await get_db()[self.collection].find({}, {"_id": 0}).to_list(None)
+            snapshot = PayerSnapshot.build(payers)
+            self.refreshes += 1
+            if snapshot.version != self.snapshot.version:
+                logger.info(f"Payer catalog loaded {len(payers)} payer(s), version {snapshot.version}")
+                self.snapshot = snapshot
+            return self.snapshot
+
+    def get(self, payer_id: str) -> Optional[dict]:
+        self.lookups += 1
+        payer = self.snapshot.by_id.get(payer_id)
+        return dict(payer) if payer is not None else None
+
+    def resolve_name(self, name: str) -> Optional[str]:
+        """The id of the payer called `name`, compared case- and punctuation-insensitively."""
+        self.lookups += 1
+        return self.snapshot.by_name.get(normalize_payer_name(name))
+
+    async def save(self, payer: Dict[str, Any]) -> PayerSnapshot:
+        await get_db()[self.collection].replace_one({"id": payer["id"]}, payer, upsert=True)
+        return await self.refresh()
+
+    async def remove(self, payer_id: str) -> bool:
+        result = await get_db()[self.collection].delete_one({"id": payer_id})
+        await self.refresh()
+        return result.deleted_count > 0
+
+    def stats(self) -> dict:
+        return {
+            "version": self.snapshot.version,
+            "payers": len(self.snapshot.by_id),
+            "loaded_at": self.snapshot.loaded_at,
+            "lookups": self.lookups,
+            "refreshes": self.refreshes,
+            "refresh_interval_seconds": self.refresh_interval,
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Payer catalog refresh failed, keeping version {self.snapshot.version}: {e}")
+
+
+payer_catalog = PayerCatalog(PAYER_CATALOG_COLLECTION, PAYER_CATALOG_REFRESH_SECONDS)
@@ -0,0 +1,212 @@
+"""
+Coalescing writer for the requestProgress collection.
+
+Every agent tool and n8n callback records its progress on the request's
+requestProgress document, usually several times per call ("Fetching...",
+then the outcome). Instead of one update_one per remark, updates are queued
+here, merged per requestId and flushed every PROGRESS_WRITE_WINDOW_MS as one
+unordered bulk_write across all requests:
+
+- `$set` fields of later updates win, `$inc` amounts add up, so each request
+  costs one operation per flush however many times it was updated.
+- Flushes run one at a time, so updates of a request reach Mongo in order.
+- `update(..., wait=True)` returns once the update is stored; tools use it
+  for their final remark so a response is never ahead of the database.
+- `read()` overlays updates that are still queued or being written on the
+  stored document, so the coroutine that wrote a change reads it back.
+- `on_change(request_id)` is awaited when an update is queued and again
+  once it is written, so caches of the request can be dropped.
+- When a whole flush fails (network error, failover), its updates are
+  merged back under any newer ones and retried after a growing backoff, up
+  to PROGRESS_WRITE_MAX_RETRIES times, so `$inc` counters do not drift.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from db.config.connection import get_db
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_WRITE_WINDOW_MS = float(os.getenv("PROGRESS_WRITE_WINDOW_MS", "50"))
+PROGRESS_WRITE_MAX_BATCH = int(os.getenv("PROGRESS_WRITE_MAX_BATCH", "500"))
+PROGRESS_WRITE_MAX_RETRIES = int(os.getenv("PROGRESS_WRITE_MAX_RETRIES", "5"))
+
+COLLECTION = "requestProgress"
+
+
+class ProgressWriter:
+    def __init__(self, window_ms: float, max_batch: int, max_retries: int):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self._retries: Dict[str, int] = {}
+        self._pending: Dict[str, Dict[str, dict]] = {}
+        self._inflight: Dict[str, Dict[str, dict]] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.on_change: Optional[Callable[[str], Awaitable]] = None
+        self.updates = 0
+        self.operations = 0
+        self.bulk_writes = 0
+        self.failed = 0
+        self.retried = 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        while self._pending:
+            await self._flush()
+
+    async def update(self, request_id: str, fields: Optional[Dict[str, Any]] = None,
+                     inc: Optional[Dict[str, int]] = None, wait: bool = False):
+        """Queue a `$set` of `fields` and `$inc` of `inc` on the request's progress document."""
+        entry = self._pending.setdefault(request_id, {"$set": {}, "$inc": {}})
+        entry["$set"].update(fields or {})
+        for field, amount in (inc or {}).items():
+            entry["$inc"][field] = entry["$inc"].get(field, 0) + amount
+        self.updates += 1
+        if self.on_change:
+            await self.on_change(request_id)
+        future = None
+        if wait or self._task is None:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.setdefault(request_id, []).append(future)
+        if self._task is None:
+            # Not started (scripts, tests): write straight away.
+            await self._flush()
+        else:
+            self._wakeup.set()
+        if future:
+            await future
+
+    async def read(self, request_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        """The request's progress document including updates not written yet."""
+        doc = await get_db()[COLLECTION].find_one({"requestId": request_id}, projection)
+        if doc is None:
+            return None
+        for queued in (self._inflight.get(request_id), self._pending.get(request_id)):
+            if queued:
+                doc.update(queued["$set"])
+                for field, amount in queued["$inc"].items():
+                    doc[field] = doc.get(field, 0) + amount
+        return doc
+
+    def stats(self) -> dict:
+        return {
+            "updates": self.updates,
+            "operations": self.operations,
+            "bulk_writes": self.bulk_writes,
+            "failed": self.failed,
+            "retried": self.retried,
+            "coalesced": self.updates - self.operations,
+            "pending": len(self._pending),
+            "window_ms": self.window * 1000,
+        }
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.window)
+            self._wakeup.clear()
+            try:
+                while self._pending:
+                    retries = await self._flush()
+                    if retries:
+                        await asyncio.sleep(min(5.0, 0.2 * 2 ** retries))  # Mongo is failing over or unreachable
+            except Exception as e:
+                logger.error(f"requestProgress flush failed: {e}")
+
+    async def _flush(self) -> int:
+        """Write one batch; returns the highest retry count of updates put back for another try, else 0."""
+        request_ids = list(self._pending)[:self.max_batch]
+        batch = {request_id: self._pending.pop(request_id) for request_id in request_ids}
+        waiters = {request_id: self._waiters.pop(request_id, []) for request_id in request_ids}
+        self._inflight = batch
+        written, operations = [], []
+        for request_id, entry in batch.items():
+            update = {op: values for op, values in entry.items() if values}
+            if update:
+                written.append(request_id)
+                operations.append(UpdateOne({"requestId": request_id}, update))
+
+        errors: Dict[str, BaseException] = {}
+        requeued: Dict[str, int] = {}
+        try:
+            try:
+                if operations:
+                    await get_db()[COLLECTION].bulk_write(operations, ordered=False)
+                    self.bulk_writes += 1
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    errors[written[error["index"]]] = Exception(error.get("errmsg", "write failed"))
+            except Exception as e:
+                errors = {request_id: e for request_id in written}
+                if self._task is not None:
+                    for request_id in written:
+                        if self._retries.get(request_id, 0) < self.max_retries:
+                            requeued[request_id] = self._requeue(request_id, batch[request_id], waiters.pop(request_id))
+                            del errors[request_id]
+            finally:
+                self._inflight = {}
+            self.operations += len(operations)
+            self.failed += len(errors)
+            if errors:
+                logger.error(f"Failed to write progress of {len(errors)} request(s): {next(iter(errors.values()))}")
+            if requeued:
+                self.retried += len(requeued)
+                logger.warning(f"Progress write failed, retrying {len(requeued)} request(s)")
+            for request_id in written:
+                if request_id not in requeued:
+                    self._retries.pop(request_id, None)
+
+            if self.on_change:
+                for request_id in written:
+                    if request_id in requeued:
+                        continue
+                    try:
+                        await self.on_change(request_id)
+                    except Exception as e:
+                        logger.error(f"Progress change hook failed for {request_id}: {e}")
+        except BaseException as e:
+            errors = {request_id: e for request_id in waiters}
+            raise
+        finally:
+            # Waiters are always answered, or update(wait=True) would hang
+            for request_id, futures in waiters.items():
+                for future in futures:
+                    if future.done():
+                        continue
+                    if isinstance(errors.get(request_id), asyncio.CancelledError):
+                        future.cancel()
+                    elif request_id in errors:
+                        future.set_exception(errors[request_id])
+                    else:
+                        future.set_result(None)
+        return max(requeued.values(), default=0)
+
+    def _requeue(self, request_id: str, entry: Dict[str, dict], waiters: List[asyncio.Future]) -> int:
+        """Put a batch entry back under the updates queued since; newer `$set` values still win."""
+        newer = self._pending.pop(request_id, None)
+        if newer:
+            entry["$set"].update(newer["$set"])
+            for field, amount in newer["$inc"].items():
+                entry["$inc"][field] = entry["$inc"].get(field, 0) + amount
+        self._pending[request_id] = entry
+        self._waiters[request_id] = waiters + self._waiters.get(request_id, [])
+        self._retries[request_id] = self._retries.get(request_id, 0) + 1
+        return self._retries[request_id]
+
+progress_writer = ProgressWriter(PROGRESS_WRITE_WINDOW_MS, PROGRESS_WRITE_MAX_BATCH, PROGRESS_WRITE_MAX_RETRIES)
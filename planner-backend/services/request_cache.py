@@ -0,0 +1,215 @@
+"""
+Snapshot cache for the request views the agent and n8n poll.
+
+GET /tools/request-status and GET /n8n/workflow-info are polled far more
+often than a request changes. Their snapshots are cached here per
+requestId and dropped whenever planner-backend writes the request: every
+progress_writer update invalidates (see main.py), and the routes that write
+user actions invalidate explicitly. The number of pending user actions is
+kept on the progress document as `pendingActions` and maintained with $inc,
+so a status poll never has to load the actions.
+
+With REQUEST_CACHE_REDIS_URL set, snapshots are also shared through Redis
+and invalidations are broadcast on a pub/sub channel, so every worker drops
+its local copy when any worker writes the request. REQUEST_CACHE_TTL bounds
+how stale a snapshot can get if an invalidation is ever missed.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from bson import json_util
+from pymongo import UpdateOne
+
+from db.config.connection import get_db
+from services.progress_writer import progress_writer
+
+logger = logging.getLogger(__name__)
+
+REQUEST_CACHE_TTL = float(os.getenv("REQUEST_CACHE_TTL", "30"))
+REQUEST_CACHE_MAX_ENTRIES = int(os.getenv("REQUEST_CACHE_MAX_ENTRIES", "5000"))
+REQUEST_CACHE_REDIS_URL = os.getenv("REQUEST_CACHE_REDIS_URL", "")
+
+REDIS_KEY_PREFIX = "request-cache"
+INVALIDATION_CHANNEL = "request-cache:invalidate"
+
+
+async def load_status(request_id: str) -> Optional[dict]:
+    return await progress_writer.read(request_id)
+
+
+async def load_workflow_info(request_id: str) -> Optional[dict]:
+    progress = await progress_writer.read(request_id)
+    if not progress:
+        return None
+    db = get_db()
+    original_request = await db["priorAuthRequest"].find_one({"requestId": request_id})
+    user_actions = await db["priorAuthUserAction"].find({"requestId": request_id}).to_list(None)
+    return {"progress": progress, "original_request": original_request, "user_actions": user_actions}
+
+
+LOADERS: Dict[str, Callable[[str], Awaitable[Optional[dict]]]] = {
+    "status": load_status,
+    "workflow": load_workflow_info,
+}
+
+
+class RequestCache:
+    def __init__(self, ttl: float, max_entries: int, redis_url: str = ""):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.redis_url = redis_url
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, dict]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._generations: Dict[str, int] = {}
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def start(self):
+        if not self.redis_url:
+            return
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            logger.warning("REQUEST_CACHE_REDIS_URL is set but the redis package is not installed; using the local cache only")
+            return
+        self._redis = redis.from_url(self.redis_url)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def shutdown(self):
+        if self._listener:
+            self._listener.cancel()
+        if self._redis:
+            await self._redis.aclose()
+
+    async def get(self, kind: str, request_id: str) -> Optional[dict]:
+        """The `kind` snapshot ("status" or "workflow") of a request, or None if it does not exist."""
+        key = (kind, request_id)
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return (await asyncio.shield(inflight))[0]
+
+        generation = self._generations.get(request_id, 0)
+        future = asyncio.ensure_future(self._load(kind, request_id))
+        self._inflight[key] = future
+        try:
+            snapshot, shared = await asyncio.shield(future)
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        if snapshot is not None and self.ttl > 0 and self._generations.get(request_id, 0) == generation:
+            self._put(key, snapshot)
+            if self._redis and not shared:
+                await self._share(key, snapshot)
+        if not self._loading(request_id):
+            self._generations.pop(request_id, None)
+        return snapshot
+
+    async def invalidate(self, request_id: str):
+        """Drop every snapshot of the request, here and (with Redis) on every worker."""
+        self._drop(request_id)
+        if self._redis:
+            try:
+                await self._redis.delete(*(self._redis_key(kind, request_id) for kind in LOADERS))
+                await self._redis.publish(INVALIDATION_CHANNEL, request_id)
+            except Exception as e:
+                logger.warning(f"Could not invalidate shared snapshot of {request_id}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "shared_tier": self._redis is not None,
+            "ttl_seconds": self.ttl,
+        }
+
+    async def _load(self, kind: str, request_id: str) -> Tuple[Optional[dict], bool]:
+        """Returns the snapshot and whether it came from the shared tier."""
+        if self._redis:
+            try:
+                cached = await self._redis.get(self._redis_key(kind, request_id))
+                if cached is not None:
+                    self.shared_hits += 1
+                    return json_util.loads(cached), True
+            except Exception as e:
+                logger.warning(f"Shared request cache read failed: {e}")
+        self.misses += 1
+        return await LOADERS[kind](request_id), False
+
+    async def _share(self, key: Tuple[str, str], snapshot: dict):
+        try:
+            await self._redis.set(self._redis_key(*key), json_util.dumps(snapshot), ex=max(1, int(self.ttl)))
+        except Exception as e:
+            logger.warning(f"Shared request cache write failed: {e}")
+
+    def _put(self, key: Tuple[str, str], snapshot: dict):
+        self._entries[key] = (time.monotonic() + self.ttl, snapshot)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _loading(self, request_id: str) -> bool:
+        return any((kind, request_id) in self._inflight for kind in LOADERS)
+
+    def _drop(self, request_id: str):
+        # A load already running read the request before this write; it must not cache its result.
+        if self._loading(request_id):
+            self._generations[request_id] = self._generations.get(request_id, 0) + 1
+        for kind in LOADERS:
+            self._entries.pop((kind, request_id), None)
+        self.invalidations += 1
+
+    def _redis_key(self, kind: str, request_id: str) -> str:
+        return f"{REDIS_KEY_PREFIX}:{kind}:{request_id}"
+
+    async def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub()
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._drop(message["data"].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Request cache invalidation listener failed, resubscribing: {e}")
+                await asyncio.sleep(1)
+
+
+async def backfill_pending_actions() -> int:
+    """Set `pendingActions` on progress documents written before it was maintained."""
+    db = get_db()
+    missing = {"pendingActions": {"$exists": False}}
+    if not await db["requestProgress"].count_documents(missing, limit=1):
+        return 0
+    counts = await db["priorAuthUserAction"].aggregate([
+        {"$match": {"actionStatus": "PENDING"}},
+        {"$group": {"_id": "$requestId", "pending": {"$sum": 1}}},
+    ]).to_list(None)
+    if counts:
+        await db["requestProgress"].bulk_write([
+            UpdateOne({"requestId": count["_id"], **missing}, {"$set": {"pendingActions": count["pending"]}})
+            for count in counts
+        ], ordered=False)
+    result = await db["requestProgress"].update_many(missing, {"$set": {"pendingActions": 0}})
+    return len(counts) + result.modified_count
+
+
+request_cache = RequestCache(REQUEST_CACHE_TTL, REQUEST_CACHE_MAX_ENTRIES, REQUEST_CACHE_REDIS_URL)
@@ -0,0 +1,236 @@
+"""
+requestSummary read model for the dashboard.
+
+The dashboard used to join requestProgress, priorAuthRequest and
+priorAuthUserAction per row at read time. requestSummary holds one
+denormalized document per request (see db/models/dbmodels/requestSummary.py)
+so the list and stats endpoints query one indexed collection.
+
+RequestSummaryTailer keeps it current from a change stream on the two source
+collections (pending-action counts already live on requestProgress). Each
+event is applied with the full current source document, so replaying an
+event is harmless. The resume token is stored in changeStreamResumeTokens
+after every applied batch, so a restart continues where the last run
+stopped. Without a stored token, or when it has fallen out of the oplog, the
+stream is opened first and the collection rebuilt from scratch, so no write
+is missed in between.
+
+Change streams need a replica set (a single-node one is enough, see
+docker-compose.yaml). Against a standalone mongod the tailer falls back to
+rebuilding every REQUEST_SUMMARY_POLL_SECONDS.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from pymongo import DeleteMany, UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
+
+from db.config.connection import get_db
+
+logger = logging.getLogger(__name__)
+
+REQUEST_SUMMARY_BATCH_SIZE = int(os.getenv("REQUEST_SUMMARY_BATCH_SIZE", "500"))
+REQUEST_SUMMARY_POLL_SECONDS = float(os.getenv("REQUEST_SUMMARY_POLL_SECONDS", "30"))
+
+SUMMARY = "requestSummary"
+RESUME_TOKENS = "changeStreamResumeTokens"
+TAILER_ID = "requestSummary"
+
+# summary field -> source field, per source collection
+SOURCES = {
+    "requestProgress": {
+        "status": "status",
+        "workflowStep": "workflowStep",
+        "pendingActions": "pendingActions",
+        "lastUpdatedAt": "lastUpdatedAt",
+        "progressDocId": "_id",
+    },
+    "priorAuthRequest": {
+        "userId": "userId",
+        "patientName": "patientName",
+        "payerId": "payerId",
+        "createdAt": "createdAt",
+        "requestDocId": "_id",
+    },
+}
+SOURCE_ID_FIELDS = {"requestProgress": "progressDocId", "priorAuthRequest": "requestDocId"}
+
+# Error codes that mean the stored resume token cannot be used any more
+RESUME_TOKEN_LOST = {260, 280, 286}
+NOT_A_REPLICA_SET = 40573
+TOKEN_SAVE_INTERVAL = 60
+
+
+async def ensure_summary_indexes():
+    summary = get_db()[SUMMARY]
+    await summary.create_index("requestId", unique=True)
+    await summary.create_index([("lastUpdatedAt", -1)])
+    await summary.create_index([("status", 1), ("lastUpdatedAt", -1)])
+    await summary.create_index([("userId", 1), ("lastUpdatedAt", -1)])
+    await summary.create_index([("payerId", 1), ("createdAt", -1)])
+    await summary.create_index([("createdAt", -1)])
+    await summary.create_index("progressDocId")
+    await summary.create_index("requestDocId")
+
+
+async def rebuild_request_summaries():
+    """
+    Recompute every summary from requestProgress and priorAuthRequest.
+
+    The first $merge writes one summary per progress document, joined with its
+    request. The second merges in requests without a progress document yet, the
+    same way the tailer upserts them from priorAuthRequest events.
+    """
+    fields = {target: f"${source}" for target, source in SOURCES["requestProgress"].items()}
+    fields.update({target: f"$request.{source}" for target, source in SOURCES["priorAuthRequest"].items()})
+    fields["pendingActions"] = {"$ifNull": ["$pendingActions", 0]}
+    await get_db()["requestProgress"].aggregate([
+        {"$lookup": {"from": "priorAuthRequest", "localField": "requestId", "foreignField": "requestId", "as": "request"}},
+        {"$unwind": {"path": "$request", "preserveNullAndEmptyArrays": True}},
+        {"$project": {"_id": 0, "requestId": 1, **fields}},
+        {"$merge": {"into": SUMMARY, "on": "requestId", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]).to_list(None)
+    request_fields = {target: f"${source}" for target, source in SOURCES["priorAuthRequest"].items()}
+    await get_db()["priorAuthRequest"].aggregate([
+        {"$match": {"requestId": {"$exists": True}}},
+        {"$project": {"_id": 0, "requestId": 1, **request_fields}},
+        {"$merge": {"into": SUMMARY, "on": "requestId", "whenMatched": "merge", "whenNotMatched": "insert"}},
+    ]).to_list(None)
+
+
+def summary_operation(change: dict):
+    """The requestSummary write for one change event, or None if it does not affect a summary."""
+    source = change["ns"]["coll"]
+    if change["operationType"] == "delete":
+        return DeleteMany({SOURCE_ID_FIELDS[source]: change["documentKey"]["_id"]})
+    doc = change.get("fullDocument")
+    if change["operationType"] not in ("insert", "update", "replace") or not doc or "requestId" not in doc:
+        return None
+    fields = {target: doc.get(field) for target, field in SOURCES[source].items()}
+    if source == "requestProgress":
+        fields["pendingActions"] = fields["pendingActions"] or 0
+    return UpdateOne({"requestId": doc["requestId"]}, {"$set": fields}, upsert=True)
+
+
+class RequestSummaryTailer:
+    def __init__(self, batch_size: int, poll_interval: float):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+        self._token_saved_at = 0.0
+        self.mode = "stopped"
+        self.events = 0
+        self.batches = 0
+        self.rebuilds = 0
+        self.lag_seconds: Optional[float] = None
+        self.last_applied_at: Optional[datetime] = None
+
+    async def start(self):
+        await ensure_summary_indexes()
+        self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "events": self.events,
+            "batches": self.batches,
+            "rebuilds": self.rebuilds,
+            "lag_seconds": self.lag_seconds,
+            "last_applied_at": self.last_applied_at,
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self._tail()
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == NOT_A_REPLICA_SET:
+                    logger.warning("MongoDB is not a replica set; rebuilding requestSummary by polling instead of change streams")
+                    await self._poll()
+                elif e.code in RESUME_TOKEN_LOST:
+                    logger.warning(f"requestSummary resume token is no longer usable, rebuilding: {e}")
+                    await self._save_token(None)
+                else:
+                    logger.error(f"requestSummary change stream failed, reopening: {e}")
+                    await asyncio.sleep(5)
+            except PyMongoError as e:
+                logger.error(f"requestSummary change stream failed, reopening: {e}")
+                await asyncio.sleep(5)
+
+    async def _tail(self):
+        token = await self._load_token()
+        pipeline = [{"$match": {"ns.coll": {"$in": list(SOURCES)}}}]
+        async with get_db().watch(pipeline, full_document="updateLookup", resume_after=token,
+                                  max_await_time_ms=1000) as stream:
+            change = await stream.try_next()  # opens the stream
+            if token is None:
+                await self._rebuild()
+            self.mode = "change_stream"
+            batch: List[dict] = []
+            while True:
+                if change is not None:
+                    batch.append(change)
+                if batch and (change is None or len(batch) >= self.batch_size):
+                    await self._apply(batch)
+                    batch = []
+                    await self._save_token(stream.resume_token)
+                elif change is None and time.monotonic() - self._token_saved_at > TOKEN_SAVE_INTERVAL:
+                    # Keep the stored token inside the oplog window while nothing changes.
+                    await self._save_token(stream.resume_token)
+                change = await stream.try_next()
+
+    async def _poll(self):
+        self.mode = "polling"
+        while True:
+            try:
+                await self._rebuild()
+            except PyMongoError as e:
+                logger.error(f"requestSummary rebuild failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _rebuild(self):
+        started = time.monotonic()
+        await rebuild_request_summaries()
+        self.rebuilds += 1
+        self.last_applied_at = datetime.now()
+        logger.info(f"requestSummary rebuilt in {time.monotonic() - started:.2f}s")
+
+    async def _apply(self, batch: List[dict]):
+        operations = [op for op in map(summary_operation, batch) if op is not None]
+        if operations:
+            await get_db()[SUMMARY].bulk_write(operations, ordered=True)
+        self.events += len(batch)
+        self.batches += 1
+        self.last_applied_at = datetime.now()
+        cluster_time = batch[-1].get("clusterTime")
+        if cluster_time is not None:
+            self.lag_seconds = round(max(0.0, time.time() - cluster_time.time), 3)
+
+    async def _load_token(self):
+        doc = await get_db()[RESUME_TOKENS].find_one({"_id": TAILER_ID})
+        return doc.get("token") if doc else None
+
+    async def _save_token(self, token):
+        await get_db()[RESUME_TOKENS].update_one(
+            {"_id": TAILER_ID},
+            {"$set": {"token": token, "updatedAt": datetime.now()}},
+            upsert=True
+        )
+        self._token_saved_at = time.monotonic()
+
+
+request_summary_tailer = RequestSummaryTailer(REQUEST_SUMMARY_BATCH_SIZE, REQUEST_SUMMARY_POLL_SECONDS)
@@ -0,0 +1,62 @@
+"""
+Check that the modules copied into several services are still identical.
+
+Each service image is built from its own directory, so a module the
+services share (the resilience module) is kept as one copy per service.
+Run this before committing a change to any of them; it prints a diff and
+exits with status 1 when the copies differ. --sync copies the first
+(planner-backend) copy over the others.
+
+    python scripts/check_shared_modules.py [--sync]
+"""
+import argparse
+import difflib
+import os
+import shutil
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+SHARED_MODULES = {
+    "resilience": [
+        "planner-backend/services/resilience.py",
+        "planner-agent/functions/resilience.py",
+        "browser-use-backend/app/utility/resilience.py",
+    ],
+}
+
+
+def read(path: str) -> str:
+    with open(os.path.join(ROOT, path)) as f:
+        return f.read()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sync", action="store_true", help="overwrite the other copies with the first one")
+    args = parser.parse_args()
+
+    drifted = 0
+    for name, copies in SHARED_MODULES.items():
+        source, *others = copies
+        reference = read(source)
+        for copy in others:
+            if read(copy) == reference:
+                continue
+            if args.sync:
+                shutil.copyfile(os.path.join(ROOT, source), os.path.join(ROOT, copy))
+                print(f"{name}: synced {copy} from {source}")
+                continue
+            drifted += 1
+            sys.stdout.writelines(difflib.unified_diff(
+                reference.splitlines(keepends=True), read(copy).splitlines(keepends=True), source, copy
+            ))
+    if drifted:
+        print(f"{drifted} shared module copy(ies) differ; fix them or run with --sync")
+        return 1
+    print("Shared module copies are identical")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())